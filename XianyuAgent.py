@@ -1,57 +1,148 @@
 import re
-from typing import List, Dict
-import os
-from openai import OpenAI
+import json
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional
+import time
 from loguru import logger
 
+from intent_matcher import IntentRuleSource
+from intent_classifier import load_local_classifier, normalize_label
+from context_budget import SUMMARY_PREFIX, ContextBudget
+from llm_provider import ProviderPool
+from speculation import SpeculativeExecutor
+from classify_batcher import ClassifyBatcher
+from prompt_registry import FIELD_LABELS, get_prompt_registry, render_static_prompt
+from utils.reporting_utils import log_intent_label, log_search_decision
+from llm_usage import configure_usage_recorder, current_usage_context, get_usage_recorder, usage_context_in
+from agent_profiles import AgentProfile
+from safety_filter import SafetyFilter
+from web_search import SearchCache, search_available
+from search_gate import SearchGate
+from bargain_engine import BargainEngine, parse_offer
+from reply_engine import bargain_count_from_context
+from utils.deadline import current_deadline
+
 # =================================================================
 # 1. Base Agent and Specific Agents
 # =================================================================
 
+# 同一商品下保持不变的字段，与静态指令一起构成可缓存的前缀
+ITEM_FIELDS = ('item_desc', 'product_name', 'original_price')
+
+
+def extract_usage(response) -> Dict:
+    """从响应的usage中提取token用量，包括命中前缀缓存的token数"""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return {}
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return {
+        'prompt_tokens': getattr(usage, 'prompt_tokens', 0) or 0,
+        'completion_tokens': getattr(usage, 'completion_tokens', 0) or 0,
+        'cached_tokens': (getattr(details, 'cached_tokens', 0) or 0) if details is not None else 0,
+    }
+
+
 class BaseAgent:
     """Agent基类"""
-    def __init__(self, client, system_prompt, safety_filter):
+    default_profile = AgentProfile()
+
+    def __init__(self, client, system_prompt, safety_filter, profile: Dict = None):
         self.client = client
+        # config.json 中 agent_profiles 的对应项覆盖本类的默认调用参数
+        self.profile = AgentProfile.from_dict(profile, self.default_profile)
         self.system_prompt = system_prompt
+        self.static_prompt = render_static_prompt(system_prompt)
         self.safety_filter = safety_filter
+        self.last_usage = {}
 
-    def generate(self, user_msg: str, item_desc: str, context: str, **kwargs) -> str:
+    def generate(self, user_msg: str, item_desc: str, context, **kwargs) -> str:
         """生成回复模板方法"""
         messages = self._build_messages(user_msg, item_desc, context, **kwargs)
         response = self._call_llm(messages)
         return self.safety_filter(response)
 
-    def _build_messages(self, user_msg: str, item_desc: str, context: str, **kwargs) -> List[Dict]:
-        """构建消息链"""
-        
+    def _build_messages(self, user_msg: str, item_desc: str, context, **kwargs) -> List[Dict]:
+        """
+        构建消息链
+
+        顺序为：静态指令（跨调用不变）→ 商品信息（同一商品不变）→ 对话历史 → 本轮信息与买家消息，
+        变化越频繁的内容越靠后，以最大化前缀缓存的命中长度。
+        """
         # 为kwargs中的None值提供默认空字符串，避免格式化错误
         safe_kwargs = {k: (v if v is not None else "") for k, v in kwargs.items()}
 
-        system_prompt = self.system_prompt.format(
-            item_desc=item_desc,
-            context=context,
-            **safe_kwargs
-        )
-        
-        return [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_msg}
-        ]
+        messages = [{"role": "system", "content": self.static_prompt}]
 
-    def _call_llm(self, messages: List[Dict], temperature: float = 0.4) -> str:
-        """调用大模型"""
-        response = self.client.chat.completions.create(
-            model=os.getenv("MODEL_NAME", "qwen-max"),
-            messages=messages,
-            temperature=temperature,
-            max_tokens=500,
-            top_p=0.8
-        )
+        item_facts = {'item_desc': item_desc, **{k: safe_kwargs[k] for k in ITEM_FIELDS if k in safe_kwargs}}
+        item_lines = [f"【{FIELD_LABELS[k]}】{v}" for k, v in item_facts.items() if v != ""]
+        if item_lines:
+            messages.append({"role": "system", "content": "\n".join(item_lines)})
+
+        if isinstance(context, str):
+            if context:
+                messages.append({"role": "system", "content": f"【{FIELD_LABELS['context']}】\n{context}"})
+        elif context:
+            messages.extend(context)
+
+        turn_lines = [
+            f"【{FIELD_LABELS.get(k, k)}】{v}"
+            for k, v in safe_kwargs.items()
+            if k not in ITEM_FIELDS and k in FIELD_LABELS and v != ""
+        ]
+        if turn_lines:
+            messages.append({"role": "system", "content": "\n".join(turn_lines)})
+
+        messages.append({"role": "user", "content": user_msg})
+        return messages
+
+    def _call_llm(self, messages: List[Dict], temperature: float = None, *, profile: AgentProfile = None,
+                  usage_name: str = None, usage_fields: List[Dict] = None, **params) -> str:
+        """
+        按调用参数调用大模型，并记录用量与延迟
+
+        profile/usage_name 用于同一Agent内的不同调用档位（如带搜索的技术咨询），默认为本Agent的档位；
+        usage_fields 用于合并了多个会话请求的调用，用量按会话平分，每个会话记录一条；
+        params 可覆盖单次调用的参数。
+        """
+        merged = {**(profile or self.profile).request_params(temperature), **params}
+        request = {k: v for k, v in merged.items() if v is not None}
+        model = request["model"]
+        agent_name = usage_name or type(self).__name__.replace("Agent", "").lower()
+        deadline = current_deadline()
+        if deadline is not None:
+            # 回复时限内的调用超时不超过该Agent的子预算与剩余时间
+            deadline.check(agent_name)
+            budget = max(deadline.budget(agent_name), 0.1)
+            request["timeout"] = min(request.get("timeout", budget), budget)
+        start = time.perf_counter()
+        try:
+            response = self.client.chat.completions.create(messages=messages, **request)
+        except Exception:
+            self._record_usage(agent_name, model, None, time.perf_counter() - start, usage_fields, ok=False)
+            raise
+        self.last_usage = extract_usage(response)
+        self._record_usage(agent_name, getattr(response, 'model', None) or model, self.last_usage,
+                           time.perf_counter() - start, usage_fields)
+        if self.last_usage:
+            logger.debug(f"{type(self).__name__} token用量: {self.last_usage}")
         return response.choices[0].message.content
 
+    @staticmethod
+    def _record_usage(agent_name, model, usage, latency, usage_fields=None, ok=True):
+        recorder = get_usage_recorder()
+        if not usage_fields:
+            recorder.record(agent_name, model, usage, latency, ok=ok)
+            return
+        n = len(usage_fields)
+        for i, fields in enumerate(usage_fields):
+            share = {k: v // n + (1 if i < v % n else 0) for k, v in (usage or {}).items()}
+            recorder.record(agent_name, model, share, latency, ok=ok, **fields)
+
 class PriceAgent(BaseAgent):
     """议价处理Agent"""
-    def generate(self, user_msg: str, item_desc: str, context: str, bargain_count: int = 0, **kwargs) -> str:
+    def generate(self, user_msg: str, item_desc: str, context, bargain_count: int = 0, **kwargs) -> str:
         """重写生成逻辑"""
         dynamic_temp = self._calc_temperature(bargain_count)
         
@@ -65,31 +156,47 @@ class PriceAgent(BaseAgent):
         )
 
         logger.info(f"向大模型发送的消息: {messages}")
-        response = self.client.chat.completions.create(
-            model=os.getenv("MODEL_NAME", "qwen-max"),
-            messages=messages,
-            temperature=dynamic_temp,
-            max_tokens=500,
-            top_p=0.8
-        )
-        return self.safety_filter(response.choices[0].message.content)
+        return self.safety_filter(self._call_llm(messages, temperature=dynamic_temp))
 
     def _calc_temperature(self, bargain_count: int) -> float:
         return min(0.3 + bargain_count * 0.15, 0.9)
 
 class TechAgent(BaseAgent):
     """技术咨询Agent"""
-    def generate(self, user_msg: str, item_desc: str, context: str, **kwargs) -> str:
-        messages = self._build_messages(user_msg, item_desc, context)
-        response = self.client.chat.completions.create(
-            model=os.getenv("MODEL_NAME", "qwen-max"),
-            messages=messages,
-            temperature=0.4,
-            max_tokens=500,
-            top_p=0.8,
-            extra_body={"enable_search": True}
-        )
-        return self.safety_filter(response.choices[0].message.content)
+    def __init__(self, client, system_prompt, safety_filter, profile: Dict = None, search_cache: SearchCache = None,
+                 search_profile: Dict = None, search_gate: SearchGate = None):
+        super().__init__(client, system_prompt, safety_filter, profile)
+        self.search_cache = search_cache
+        # 联网搜索的回答使用单独的档位，未配置的字段沿用技术咨询档位
+        self.search_profile = AgentProfile.from_dict(search_profile, self.profile)
+        self.search_gate = search_gate or SearchGate()
+
+    def generate(self, user_msg: str, item_desc: str, context, product_name: str = "", **kwargs) -> str:
+        decision = self.search_gate.decide(user_msg, item_desc, product_name)
+        log_search_decision(user_msg, current_usage_context().get("item_id"), *decision)
+        logger.info(f"技术咨询{'需要' if decision.search else '无需'}联网搜索: {decision.reason}, 覆盖度 {decision.coverage:.2f}")
+        if not decision.search:
+            messages = self._build_messages(user_msg, item_desc, context)
+            return self.safety_filter(self._call_llm(messages))
+
+        search_results = self._search(user_msg, product_name)
+        if search_results is None:
+            # 没有可缓存的搜索后端时使用模型自带的联网搜索
+            messages = self._build_messages(user_msg, item_desc, context)
+            return self.safety_filter(self._call_llm(messages, profile=self.search_profile, usage_name="tech_search",
+                                                     extra_body={"enable_search": True}))
+        messages = self._build_messages(user_msg, item_desc, context, search_results=search_results)
+        return self.safety_filter(self._call_llm(messages, profile=self.search_profile, usage_name="tech_search"))
+
+    def _search(self, user_msg: str, product_name: str):
+        """通过搜索缓存查询商品参数，同一型号的重复问题在TTL内不会再次联网"""
+        if self.search_cache is None or not search_available():
+            return None
+        try:
+            return self.search_cache.get_or_search(f"{product_name} {user_msg}")
+        except Exception as e:
+            logger.warning(f"网络搜索失败，改用模型联网搜索: {e}")
+            return None
 
 class ProposeDiscountAgent(BaseAgent):
     """优惠方案提议Agent"""
@@ -115,13 +222,51 @@ class ConfirmDiscountAgent(BaseAgent):
 
 class ClassifyAgent(BaseAgent):
     """意图识别Agent"""
-    pass # Inherits __init__ and generate from BaseAgent
+
+    BATCH_INSTRUCTION = (
+        "下面是多位买家各自发来的消息，每行一条并带有编号。请按上述标准逐条独立分类，"
+        "只输出一个JSON数组，按编号顺序给出每条消息的类别，例如[\"price\",\"default\"]，不要输出其他内容。"
+    )
+
+    def generate_batch(self, user_msgs: List[str], usage_fields: List[Dict] = None) -> List[str]:
+        """
+        一次调用分类多条消息
+
+        Args:
+            user_msgs: 各会话的买家消息
+            usage_fields: 各条消息所属会话的用量字段（chat_id / item_id），用量按条记录
+
+        Returns:
+            list: 与输入等长的标签列表，无法识别的位置为None
+        """
+        if len(user_msgs) == 1:
+            messages = self._build_messages(user_msgs[0], "", [])
+            output = self._call_llm(messages, usage_fields=usage_fields)
+            return [normalize_label(self.safety_filter(output))]
+
+        numbered = "\n".join(f"{i}. {' '.join(msg.split())}" for i, msg in enumerate(user_msgs, 1))
+        messages = [
+            {"role": "system", "content": self.static_prompt},
+            {"role": "system", "content": self.BATCH_INSTRUCTION},
+            {"role": "user", "content": numbered},
+        ]
+        # 分类档位的输出预算只够一个标签，批量时按条数放宽
+        output = self._call_llm(messages, temperature=0.0,
+                                max_tokens=max(self.profile.max_tokens, 12 * len(user_msgs)), stop=None,
+                                usage_fields=usage_fields)
+        try:
+            labels = json.loads(output[output.index('['):output.rindex(']') + 1])
+        except (ValueError, TypeError):
+            logger.warning(f"批量分类结果无法解析: {output}")
+            return [None] * len(user_msgs)
+        if not isinstance(labels, list) or len(labels) != len(user_msgs):
+            logger.warning(f"批量分类结果数量不匹配: {output}")
+            return [None] * len(user_msgs)
+        return [normalize_label(str(label)) for label in labels]
 
 class DefaultAgent(BaseAgent):
     """默认处理Agent"""
-    def _call_llm(self, messages: List[Dict], *args) -> str:
-        response = super()._call_llm(messages, temperature=0.7)
-        return response
+    default_profile = AgentProfile(temperature=0.7)
 
 # =================================================================
 # 2. Intent Router
@@ -129,92 +274,178 @@ class DefaultAgent(BaseAgent):
 
 class IntentRouter:
     """意图路由决策器"""
-    def __init__(self, classify_agent):
-        self.rules = {
-            'tech': {'keywords': ['参数', '规格', '型号', '连接', '对比'], 'patterns': [r'和.+比']},
-            'price': {'keywords': ['便宜', '价', '砍价', '少点'], 'patterns': [r'\d+元', r'能少\d+']},
-            'confirm_discount': {'keywords': ['可以', '好的', '行', 'ok', '嗯'], 'patterns': []},
-            'propose_discount': {'keywords': ['批量', '多件', '都买了'], 'patterns': [r'买\d+件', r'要\d+个']}
-        }
+    def __init__(self, classify_agent, rule_source: IntentRuleSource = None, local_classifier=None, local_threshold: float = 0.85,
+                 batcher: ClassifyBatcher = None):
         self.classify_agent = classify_agent
+        self.batcher = batcher
+        self.rule_source = rule_source or IntentRuleSource()
+        self.matcher = self.rule_source.load()
+        self.local_classifier = local_classifier
+        self.local_threshold = local_threshold
+
+    @property
+    def rules(self):
+        return self.matcher.rules
+
+    def reload_rules(self, force: bool = False) -> bool:
+        """规则配置变化时重新编译并整体替换匹配器"""
+        if not force and not self.rule_source.changed():
+            return False
+        self.matcher = self.rule_source.load()
+        logger.info("意图规则已重新加载")
+        return True
+
+    def detect_by_rules(self, user_msg: str, last_intent: str):
+        """只用规则与本地分类器判断意图，无法确定时返回None"""
+        intent = self.matcher.best_intent(user_msg, last_intent)
+        if intent:
+            return intent
+
+        # 规则未命中时先用本地分类器，置信度足够则省掉一次大模型调用
+        if self.local_classifier is not None:
+            label, confidence = self.local_classifier.predict(user_msg)
+            if confidence >= self.local_threshold:
+                logger.debug(f"本地意图分类: {label} ({confidence:.2f})")
+                return label
+        return None
+
+    def classify(self, user_msg: str, item_desc: str, context) -> str:
+        """调用ClassifyAgent分类，输出无法识别时归为default"""
+        label = None
+        if self.batcher is not None:
+            # 与其他会话的分类请求合并为一次调用；批量结果不可用时退回单条分类
+            try:
+                label = self.batcher.classify(user_msg)
+            except Exception as e:
+                logger.warning(f"批量分类失败，改为单条分类: {e}")
+        if label is None:
+            label = normalize_label(self.classify_agent.generate(user_msg=user_msg, item_desc=item_desc, context=context))
+        if label:
+            log_intent_label(user_msg, label)
+            return label
+        return 'default'
+
+    def detect(self, user_msg: str, item_desc: str, context, last_intent: str) -> str:
+        return self.detect_by_rules(user_msg, last_intent) or self.classify(user_msg, item_desc, context)
 
-    def detect(self, user_msg: str, item_desc: str, context: str, last_intent: str) -> str:
-        text_clean = re.sub(r'[^\w\u4e00-\u9fa5]', '', user_msg).lower()
+# =================================================================
+# 3. Main Bot Class
+# =================================================================
 
-        if last_intent == 'propose_discount' and any(kw in text_clean for kw in self.rules['confirm_discount']['keywords']):
-            return 'confirm_discount'
+class ChatIntentState:
+    """单个会话上一轮的意图与待确认的优惠方案"""
 
-        if any(kw in text_clean for kw in self.rules['propose_discount']['keywords']) or any(re.search(p, text_clean) for p in self.rules['propose_discount']['patterns']):
-             return 'propose_discount'
+    __slots__ = ("last_intent", "last_discount_info")
 
-        if any(kw in text_clean for kw in self.rules['tech']['keywords']) or any(re.search(p, text_clean) for p in self.rules['tech']['patterns']):
-            return 'tech'
-        if any(kw in text_clean for kw in self.rules['price']['keywords']) or any(re.search(p, text_clean) for p in self.rules['price']['patterns']):
-            return 'price'
-        
-        return self.classify_agent.generate(user_msg=user_msg, item_desc=item_desc, context=context)
+    def __init__(self):
+        self.last_intent = None
+        self.last_discount_info = {}
+
+
+# 保留意图状态的会话数上限，超出后淘汰最久未活动的会话
+MAX_TRACKED_CHATS = 10000
 
-# =================================================================
-# 3. Main Bot Class
-# =================================================================
 
 class XianyuReplyBot:
-    def __init__(self):
-        self.client = OpenAI(
-            api_key=os.getenv("API_KEY"),
-            base_url=os.getenv("MODEL_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1"),
-        )
+    def __init__(self, config: dict = None, prompt_registry=None):
+        self.config = config if config is not None else self._load_config()
+        self.prompts = prompt_registry or get_prompt_registry()
+        configure_usage_recorder(self.config)
+        self.safety = SafetyFilter.from_config(self.config)
+        self.search_cache = SearchCache.from_config(self.config)
+        self.search_gate = SearchGate.from_config(self.config)
+        self.bargain = BargainEngine.from_config(self.config)
+        # 多端点调用池，接口与 OpenAI 客户端一致；未配置 llm_providers 时等同于单一端点
+        self.client = ProviderPool.from_config(self.config)
+        self.context_budget = ContextBudget.from_config(self.config)
         self._init_system_prompts()
         self._init_agents()
-        self.router = IntentRouter(self.agents['classify'])
-        self.last_intent = None
-        self.last_discount_info = {}
+        classifier_config = self.config.get("intent_classifier", {})
+        self.router = IntentRouter(
+            self.agents['classify'],
+            local_classifier=load_local_classifier(self.config),
+            local_threshold=classifier_config.get("threshold", 0.85),
+            batcher=self._init_classify_batcher(),
+        )
+        self.speculation = SpeculativeExecutor.from_config(self.config)
+        # generate_reply 在多个线程中为不同会话并发执行，意图与优惠方案按会话分开保存
+        self._chat_states: "OrderedDict[Optional[str], ChatIntentState]" = OrderedDict()
+        self._chat_states_lock = threading.Lock()
+        # 提示词文件或规则配置变化时，由注册表的后台任务触发热更新
+        self.prompts.add_listener(self._on_prompts_changed)
+        self.prompts.watch_file(self.router.rule_source.config_path, self.router.reload_rules)
+
+    @staticmethod
+    def _load_config(path: str = "config.json") -> dict:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.error(f"加载配置文件时出错: {e}")
+            return {}
+
+    def _init_classify_batcher(self):
+        batching = self.config.get("classify_batching", {})
+        if not batching.get("enabled", False):
+            return None
+        # 通过router取当前的ClassifyAgent，提示词热更新后批处理也使用新模板
+        return ClassifyBatcher(
+            lambda msgs, contexts: self.router.classify_agent.generate_batch(
+                msgs, [usage_context_in(ctx) for ctx in contexts]),
+            window_ms=batching.get("window_ms", 15),
+            max_batch=batching.get("max_batch", 16),
+        )
 
     def _init_agents(self):
+        profiles = self.config.get("agent_profiles", {})
         self.agents = {
-            'classify': ClassifyAgent(self.client, self.classify_prompt, self._safe_filter),
-            'price': PriceAgent(self.client, self.price_prompt, self._safe_filter),
-            'tech': TechAgent(self.client, self.tech_prompt, self._safe_filter),
-            'default': DefaultAgent(self.client, self.default_prompt, self._safe_filter),
+            'classify': ClassifyAgent(self.client, self.classify_prompt, self._safe_filter, profiles.get('classify')),
+            'price': PriceAgent(self.client, self.price_prompt, self._safe_filter, profiles.get('price')),
+            'tech': TechAgent(self.client, self.tech_prompt, self._safe_filter, profiles.get('tech'), self.search_cache,
+                              profiles.get('tech_search'), self.search_gate),
+            'default': DefaultAgent(self.client, self.default_prompt, self._safe_filter, profiles.get('default')),
             'propose_discount': ProposeDiscountAgent(self.client, "", self._safe_filter),
             'confirm_discount': ConfirmDiscountAgent(self.client, "", self._safe_filter),
         }
 
     def _init_system_prompts(self):
-        prompt_dir = "prompts"
-        try:
-            with open(os.path.join(prompt_dir, "classify_prompt.txt"), "r", encoding="utf-8") as f: self.classify_prompt = f.read()
-            with open(os.path.join(prompt_dir, "price_prompt.txt"), "r", encoding="utf-8") as f: self.price_prompt = f.read()
-            with open(os.path.join(prompt_dir, "tech_prompt.txt"), "r", encoding="utf-8") as f: self.tech_prompt = f.read()
-            with open(os.path.join(prompt_dir, "default_prompt.txt"), "r", encoding="utf-8") as f: self.default_prompt = f.read()
-            logger.info("成功加载所有提示词")
-        except Exception as e:
-            logger.error(f"加载提示词时出错: {e}")
-            pass
+        self.classify_prompt = self.prompts.text("classify")
+        self.price_prompt = self.prompts.text("price")
+        self.tech_prompt = self.prompts.text("tech")
+        self.default_prompt = self.prompts.text("default")
+
+    def _on_prompts_changed(self):
+        """模板已在注册表中整体替换，这里只需基于内存中的新模板重建Agent"""
+        self._init_system_prompts()
+        self._init_agents()
+        self.router.classify_agent = self.agents['classify']
 
     def _safe_filter(self, text: str) -> str:
-        blocked_phrases = ["微信", "QQ", "支付宝", "银行卡", "线下"]
-        return "[安全提醒]请通过平台沟通" if any(p in text for p in blocked_phrases) else text
-
-    def format_history(self, context: List[Dict]) -> str:
-        user_assistant_msgs = [msg for msg in context if msg['role'] in ['user', 'assistant']]
-        return "\n".join([f"{msg['role']}: {msg['content']}" for msg in user_assistant_msgs])
-
-    def _extract_bargain_count(self, context: List[Dict]) -> int:
-        for msg in context:
-            if msg.get('role') == 'system' and '议价次数' in msg.get('content', ''):
-                try:
-                    match = re.search(r'议价次数[:：]\s*(\d+)', msg['content'])
-                    if match: return int(match.group(1))
-                except Exception: pass
-        return 0
-
-    def _extract_user_offer(self, user_msg: str) -> float:
-        """从用户消息中提取出价"""
-        match = re.search(r'(\d+\.?\d*)\s*(块|元)', user_msg)
-        if match:
-            return float(match.group(1))
-        return 0.0
+        return self.safety.apply(text)
+
+    def format_history(self, context: List[Dict], agent_name: str = None) -> str:
+        """按对应Agent的token预算格式化对话历史：滚动摘要 + 最近的原文"""
+        summary, user_assistant_msgs = self.context_budget.select(context, agent_name)
+        lines = [f"summary: {summary}"] if summary else []
+        lines.extend(f"{msg['role']}: {msg['content']}" for msg in user_assistant_msgs)
+        return "\n".join(lines)
+
+    def history_messages(self, context: List[Dict], agent_name: str = None) -> List[Dict]:
+        """按预算挑选的对话历史，以独立消息的形式放在静态指令与商品信息之后"""
+        summary, user_assistant_msgs = self.context_budget.select(context, agent_name)
+        messages = [{"role": "system", "content": f"{SUMMARY_PREFIX} {summary}"}] if summary else []
+        messages.extend(
+            msg for msg in context
+            if msg.get('role') == 'system' and msg.get('content', '').startswith('[系统提示]')
+        )
+        messages.extend({"role": msg['role'], "content": msg['content']} for msg in user_assistant_msgs)
+        return messages
+
+    def _extract_user_offer(self, user_msg: str, list_price: float = 0.0) -> float:
+        """从用户消息中提取出价，“少50”等让价说法按标价换算"""
+        return parse_offer(user_msg, list_price)
 
     def _calculate_discount(self, user_msg: str, item_desc: str) -> dict:
         quantity_match = re.search(r'(\d+)', user_msg)
@@ -237,64 +468,123 @@ class XianyuReplyBot:
             "final_price": round(final_price, 2),
         }
 
-    def generate_reply(self, user_msg: str, item_info: dict, context: List[Dict]) -> str:
+    def generate_reply(self, user_msg: str, item_info: dict, context: List[Dict],
+                       bargain_count: Optional[int] = None, chat_id: Optional[str] = None) -> str:
+        """
+        生成回复
+
+        Args:
+            bargain_count: 该会话对此商品的议价次数，由调用方随上下文一起读取后传入；
+                为 None 时从上下文中的议价次数系统消息读取（旧的调用方式）
+            chat_id: 会话ID，上一轮意图与待确认的优惠方案按会话保存；本轮识别的意图可由 chat_state(chat_id) 读取
+        """
+        if bargain_count is None:
+            bargain_count = bargain_count_from_context(context)
         item_desc = f"{item_info.get('desc', '')};当前商品售卖价格为:{str(item_info.get('soldPrice', ''))}"
+        state = self.chat_state(chat_id)
+
+        detected_intent = self.router.detect_by_rules(user_msg, state.last_intent)
+        if detected_intent is None:
+            classify_context = self.history_messages(context, 'classify')
+            predicted = self.speculation.predict(state.last_intent, self.router.local_classifier, user_msg) \
+                if self.speculation.enabled else None
+            if predicted:
+                detected_intent, reply = self.speculation.run(
+                    predicted,
+                    lambda: self.router.classify(user_msg, item_desc, classify_context),
+                    lambda intent: self._dispatch(intent, user_msg, item_info, item_desc, context, bargain_count, state),
+                )
+                logger.info(f'意图识别完成: {detected_intent}')
+                state.last_intent = detected_intent
+                return reply
+            detected_intent = self.router.classify(user_msg, item_desc, classify_context)
+        logger.info(f'意图识别完成: {detected_intent}')
+
+        reply = self._dispatch(detected_intent, user_msg, item_info, item_desc, context, bargain_count, state)
+        state.last_intent = detected_intent
+        return reply
+
+    def chat_state(self, chat_id: Optional[str] = None) -> ChatIntentState:
+        """会话的意图状态，不存在时新建；chat_id 为 None 的调用共用一份状态"""
+        with self._chat_states_lock:
+            state = self._chat_states.get(chat_id)
+            if state is None:
+                state = self._chat_states[chat_id] = ChatIntentState()
+                if len(self._chat_states) > MAX_TRACKED_CHATS:
+                    self._chat_states.popitem(last=False)
+            else:
+                self._chat_states.move_to_end(chat_id)
+            return state
+
+    def _dispatch(self, detected_intent: str, user_msg: str, item_info: dict, item_desc: str, context: List[Dict],
+                  bargain_count: int = 0, state: Optional[ChatIntentState] = None) -> str:
+        """按意图调用对应Agent生成回复"""
+        state = state or self.chat_state()
         product_name = item_info.get('title', '这款商品')
         original_price = float(item_info.get('soldPrice', 0.0))
 
-        formatted_context = self.format_history(context)
-        detected_intent = self.router.detect(user_msg, item_desc, formatted_context, self.last_intent)
-        logger.info(f'意图识别完成: {detected_intent}')
-
         agent = self.agents.get(detected_intent, self.agents['default'])
         
         agent_kwargs = {
             'user_msg': user_msg,
             'item_desc': item_desc,
-            'context': formatted_context,
+            'context': self.history_messages(context, detected_intent if detected_intent in self.agents else 'default'),
             'product_name': product_name
         }
 
         if detected_intent == 'propose_discount':
             discount_info = self._calculate_discount(user_msg, item_desc)
             if discount_info:
-                self.last_discount_info = discount_info
+                state.last_discount_info = discount_info
                 agent_kwargs['discount_info'] = discount_info
                 reply = agent.generate(**agent_kwargs)
             else:
-                agent = self.agents['price']
-                bargain_count = self._extract_bargain_count(context)
-                user_offer_price = self._extract_user_offer(user_msg)
-                agent_kwargs['bargain_count'] = bargain_count
-                agent_kwargs['user_offer_price'] = user_offer_price
-                agent_kwargs['original_price'] = original_price
-                reply = agent.generate(**agent_kwargs)
+                reply = self._negotiate(self.agents['price'], agent_kwargs, item_info, original_price, bargain_count)
 
         elif detected_intent == 'confirm_discount':
-            if self.last_intent == 'propose_discount' and self.last_discount_info:
-                agent_kwargs['discount_info'] = self.last_discount_info
+            if state.last_intent == 'propose_discount' and state.last_discount_info:
+                agent_kwargs['discount_info'] = state.last_discount_info
                 reply = agent.generate(**agent_kwargs)
-                self.last_discount_info = {}
+                state.last_discount_info = {}
             else:
                 agent = self.agents['default']
                 reply = agent.generate(**agent_kwargs)
         
         elif detected_intent == 'price':
-            bargain_count = self._extract_bargain_count(context)
-            user_offer_price = self._extract_user_offer(user_msg)
-            agent_kwargs['bargain_count'] = bargain_count
-            agent_kwargs['user_offer_price'] = user_offer_price
-            agent_kwargs['original_price'] = original_price
-            reply = agent.generate(**agent_kwargs)
+            reply = self._negotiate(agent, agent_kwargs, item_info, original_price, bargain_count)
 
         else:
             reply = agent.generate(**agent_kwargs)
 
-        self.last_intent = detected_intent
         return reply
 
+    def _negotiate(self, agent, agent_kwargs: dict, item_info: dict, original_price: float, bargain_count: int) -> str:
+        """
+        处理议价
+
+        有明确数字出价时由议价引擎按底价和让价节奏直接决定，模板回复不调用大模型；
+        没有数字出价（如“能便宜点吗”）或配置为由大模型组织语言时，才交给议价Agent。
+        """
+        user_offer_price = self._extract_user_offer(agent_kwargs['user_msg'], original_price)
+        agent_kwargs['bargain_count'] = bargain_count
+        agent_kwargs['user_offer_price'] = user_offer_price
+        agent_kwargs['original_price'] = original_price
+        if not self.bargain.enabled:
+            return agent.generate(**agent_kwargs)
+
+        item_id = item_info.get('itemId', item_info.get('id'))
+        decision = self.bargain.decide(item_id, original_price, user_offer_price, bargain_count)
+        self.bargain.log_decision(item_id, decision)
+        if decision.action == 'llm':
+            return agent.generate(**agent_kwargs)
+        if self.bargain.phrasing == 'llm':
+            agent_kwargs['bargain_decision'] = self.bargain.describe(decision)
+            return agent.generate(**agent_kwargs)
+        return self.bargain.render(decision, agent_kwargs['product_name'], bargain_count)
+
     def reload_prompts(self):
         logger.info("正在重新加载提示词...")
-        self._init_system_prompts()
-        self._init_agents()
+        self.prompts.load_all()
+        self._on_prompts_changed()
+        self.router.reload_rules()
         logger.info("提示词重新加载完成")
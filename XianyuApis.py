@@ -6,6 +6,7 @@ import sys
 import requests
 from loguru import logger
 from utils.xianyu_utils import generate_sign
+from utils.deadline import current_deadline, remaining_or
 
 
 class XianyuApis:
@@ -202,10 +203,14 @@ class XianyuApis:
             return self.get_token(device_id, retry_count + 1)
 
     def get_item_info(self, item_id, retry_count=0):
-        """获取商品信息，自动处理token失效的情况"""
+        """获取商品信息，自动处理token失效的情况；处于回复时限内时，请求超时与重试都不会超出剩余时间"""
         if retry_count >= 3:  # 最多重试3次
             logger.error("获取商品信息失败，重试次数过多")
             return {"error": "获取商品信息失败，重试次数过多"}
+        deadline = current_deadline()
+        if deadline is not None and deadline.expired:
+            logger.warning(f"获取商品信息超出回复时限，已重试 {retry_count} 次")
+            return {"error": "获取商品信息超出回复时限"}
             
         params = {
             'jsv': '2.7.2',
@@ -237,7 +242,8 @@ class XianyuApis:
             response = self.session.post(
                 'https://h5api.m.goofish.com/h5/mtop.taobao.idle.pc.detail/1.0/', 
                 params=params, 
-                data=data
+                data=data,
+                timeout=remaining_or(10)
             )
             
             res_json = response.json()
@@ -251,7 +257,7 @@ class XianyuApis:
                     if 'Set-Cookie' in response.headers:
                         logger.debug("检测到Set-Cookie，更新cookie")
                         self.clear_duplicate_cookies()
-                    time.sleep(0.5)
+                    time.sleep(remaining_or(0.5))
                     return self.get_item_info(item_id, retry_count + 1)
                 else:
                     logger.debug(f"商品信息获取成功: {item_id}")
@@ -262,5 +268,5 @@ class XianyuApis:
                 
         except Exception as e:
             logger.error(f"商品信息API请求异常: {str(e)}")
-            time.sleep(0.5)
+            time.sleep(remaining_or(0.5))
             return self.get_item_info(item_id, retry_count + 1)
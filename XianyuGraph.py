@@ -1,9 +1,11 @@
+import asyncio
 import os
 import re
 import functools
+import threading
 from typing import TypedDict, Annotated, List, Dict, Optional
-import operator
 import json
+import time
 
 from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, ToolMessage, AIMessage
 from langchain_core.tools import tool
@@ -11,10 +13,36 @@ from pydantic import BaseModel, Field
 from langgraph.graph import StateGraph, END
 from langchain_openai import ChatOpenAI
 from loguru import logger
-from tavily import TavilyClient
+
+from prompt_registry import get_prompt_registry
+from llm_usage import get_usage_recorder
+from safety_filter import get_safety_filter
+from web_search import get_search_cache
+from graph_checkpoint import SqliteCheckpointSaver
+from item_store import get_item_store
+from context_budget import SUMMARY_PREFIX, fold_summary
 
 #from context_manager import ChatContextManager
 
+# 单个工具调用的默认超时（秒），可在 config.json 的 graph.tool_timeouts 中按工具覆盖
+DEFAULT_TOOL_TIMEOUT = 10.0
+DEFAULT_TOOL_TIMEOUTS = {
+    "tavily_web_search": 12.0,
+    "get_item_details": 5.0,
+    "log_customer_request": 2.0,
+}
+
+# 单轮对话中工具调用循环的默认预算
+DEFAULT_MAX_TOOL_ITERATIONS = 3
+DEFAULT_MAX_WALL_SECS = 20.0
+DEFAULT_MAX_TURN_TOKENS = 8000
+
+FORCE_FINAL_INSTRUCTION = "本轮工具调用次数或时间已用完，不要再调用任何工具，请根据已有信息直接回复买家。"
+
+# 图状态中保留的对话轮数（从买家消息起算），更早的轮次折叠进摘要
+HISTORY_TURNS = 6
+HISTORY_SUMMARY_MAX_TOKENS = 200
+
 # 1. 工具定义
 class TavilySearchArgs(BaseModel):
     query: str = Field(description="The search query to use with Tavily.")
@@ -23,14 +51,8 @@ class TavilySearchArgs(BaseModel):
 def tavily_web_search(query: str) -> str:
     """Use Tavily to search the web for up-to-date information."""
     try:
-        tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
-        # search_depth="advanced" 可以获取更丰富的结果
-        response = tavily_client.search(query, search_depth="advanced")
-        
-        # 提取并格式化结果，使其更易于LLM消费
-        results = response.get("results", [])
-        formatted_results = "\n".join([res.get("content", "") for res in results])
-        
+        # 相同（规范化后）的查询在TTL内直接返回缓存，并发的相同查询只搜索一次
+        formatted_results = get_search_cache().get_or_search(query)
         return f"网络搜索结果：\n{formatted_results}"
     except Exception as e:
         return f"Error during Tavily search: {e}"
@@ -40,14 +62,15 @@ class ItemDetailsArgs(BaseModel):
     item_id: str = Field(description="The ID of the item to get details for.")
 
 @tool(args_schema=ItemDetailsArgs)
-def get_item_details(item_id: str) -> str:
+async def get_item_details(item_id: str) -> str:
     """Call this to get detailed technical specifications of an item."""
     logger.info(f"Tool called: get_item_details for item_id: {item_id}")
-    mock_db = {
-        "item_123": {"power_output": "100W", "channels": "5.1", "impedance": "8 ohms"},
-        "item_456": {"power_output": "150W", "channels": "7.1", "impedance": "6 ohms"},
-    }
-    details = mock_db.get(item_id, {"error": "Item not found"})
+    store = get_item_store()
+    if store is None:
+        return json.dumps({"error": "Item store not configured"}, ensure_ascii=False)
+    # 内存缓存 -> items 表 -> 闲鱼接口，同一商品的并发查询只获取一次
+    record = await store.get_record(item_id)
+    details = record.details() if record is not None else {"error": "Item not found"}
     return json.dumps(details, ensure_ascii=False)
 
 class LogRequestArgs(BaseModel):
@@ -66,102 +89,321 @@ def log_customer_request(request_details: str) -> str:
         return f"Error logging request: {e}"
 
 # 2. 状态定义
+def _is_tool_exchange(message: BaseMessage) -> bool:
+    return isinstance(message, ToolMessage) or bool(getattr(message, "tool_calls", None))
+
+def window_history(left: list, right: list) -> list:
+    """
+    chat_history 的合并函数：追加新消息后只保留最近 HISTORY_TURNS 轮
+
+    更早的买家消息与回复折叠进开头的摘要消息；已结束轮次中的工具调用与工具结果不再保留，
+    只有当前轮（最后一条买家消息之后）的工具往来原样保留。检查点中的状态因此不随会话无限增长。
+    """
+    merged = list(left or []) + list(right or [])
+    summary = ""
+    if merged and isinstance(merged[0], SystemMessage) and str(merged[0].content).startswith(SUMMARY_PREFIX):
+        summary = merged[0].content[len(SUMMARY_PREFIX):].strip()
+        merged = merged[1:]
+
+    starts = [i for i, message in enumerate(merged) if isinstance(message, HumanMessage)]
+    cut = starts[-HISTORY_TURNS] if len(starts) > HISTORY_TURNS else 0
+    current = starts[-1] if starts else len(merged)
+
+    dropped = []
+    for message in merged[:cut]:
+        if not isinstance(message.content, str) or not message.content or _is_tool_exchange(message):
+            continue
+        if isinstance(message, HumanMessage):
+            dropped.append(("user", message.content))
+        elif isinstance(message, AIMessage):
+            dropped.append(("assistant", message.content))
+    if dropped:
+        summary = fold_summary(summary, dropped, HISTORY_SUMMARY_MAX_TOKENS)
+
+    head = [SystemMessage(content=f"{SUMMARY_PREFIX} {summary}")] if summary else []
+    finished = [message for message in merged[cut:current] if not _is_tool_exchange(message)]
+    return head + finished + merged[current:]
+
 class AgentState(TypedDict):
     user_message: str
+    item_id: str
     item_description: str
-    chat_history: Annotated[list, operator.add]
+    chat_history: Annotated[list, window_history]
     intent: str
     bargain_count: int
     final_reply: str
     # 直接使用 AIMessage 中解析好的 tool_calls 对象
     tool_calls: Optional[List[dict]] = None
+    # 本轮的工具循环预算消耗，由 router 在每轮开始时重置
+    turn_started: float
+    tool_iterations: int
+    tokens_used: int
+
+class ToolLoopBudget:
+    """
+    单轮对话的工具循环预算
+
+    Agent 与 tool_node 之间的循环按工具轮次、耗时和token数三项设上限，任一项用完后
+    不再执行工具，改为不带工具地强制生成最终回复。同时统计预算被用完的频率。
+    """
+
+    def __init__(
+        self,
+        max_tool_iterations: int = DEFAULT_MAX_TOOL_ITERATIONS,
+        max_wall_secs: float = DEFAULT_MAX_WALL_SECS,
+        max_tokens: int = DEFAULT_MAX_TURN_TOKENS,
+    ):
+        self.max_tool_iterations = max_tool_iterations
+        self.max_wall_secs = max_wall_secs
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.exhausted: Dict[str, int] = {}
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "ToolLoopBudget":
+        section = ((config or {}).get("graph") or {}).get("tool_budget") or {}
+        return cls(
+            max_tool_iterations=section.get("max_tool_iterations", DEFAULT_MAX_TOOL_ITERATIONS),
+            max_wall_secs=section.get("max_wall_secs", DEFAULT_MAX_WALL_SECS),
+            max_tokens=section.get("max_tokens", DEFAULT_MAX_TURN_TOKENS),
+        )
+
+    def elapsed(self, state: AgentState) -> float:
+        return time.monotonic() - state.get("turn_started", time.monotonic())
+
+    def remaining_secs(self, state: AgentState) -> float:
+        return max(0.0, self.max_wall_secs - self.elapsed(state))
+
+    def exhausted_reason(self, state: AgentState) -> Optional[str]:
+        """返回已用完的预算项，未用完时返回 None"""
+        if state.get("tool_iterations", 0) >= self.max_tool_iterations:
+            return "iterations"
+        if self.elapsed(state) >= self.max_wall_secs:
+            return "wall_time"
+        if state.get("tokens_used", 0) >= self.max_tokens:
+            return "tokens"
+        return None
+
+    def record_turn(self):
+        with self._lock:
+            self.turns += 1
+
+    def record_exhausted(self, reason: str):
+        with self._lock:
+            self.exhausted[reason] = self.exhausted.get(reason, 0) + 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            by_reason = dict(self.exhausted)
+            turns = self.turns
+        hit = sum(by_reason.values())
+        return {
+            "turns": turns,
+            "exhausted": hit,
+            "exhausted_rate": round(hit / turns, 3) if turns else 0.0,
+            "by_reason": by_reason,
+        }
 
 # 3. 节点函数
-def router_node(state: AgentState, client: ChatOpenAI) -> Dict:
+def _item_header(state: AgentState) -> str:
+    """带上商品ID，模型才能用 get_item_details 查询详细参数"""
+    return f"(商品ID: {state['item_id']}) " if state.get('item_id') else ""
+
+def _build_agent_messages(state: AgentState, system_prompt: str) -> List[BaseMessage]:
+    """静态指令在前、商品信息其次、对话历史最后，保证前缀在多轮调用间保持不变"""
+    return [
+        SystemMessage(content=system_prompt),
+        SystemMessage(content=f"【商品信息】{_item_header(state)}{state['item_description']}"),
+        *state['chat_history'],
+    ]
+
+def _log_usage(agent_name: str, response: AIMessage, latency: float = 0.0):
+    """记录token用量及命中前缀缓存的token数，并写入用量统计"""
+    usage = getattr(response, "usage_metadata", None) or {}
+    cached = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+    if usage:
+        logger.debug(
+            f"{agent_name} token用量: prompt={usage.get('input_tokens', 0)}, "
+            f"completion={usage.get('output_tokens', 0)}, cached={cached}"
+        )
+    model = (getattr(response, "response_metadata", None) or {}).get("model_name")
+    get_usage_recorder().record(
+        f"graph_{agent_name.lower()}",
+        model,
+        {
+            "prompt_tokens": usage.get("input_tokens", 0),
+            "completion_tokens": usage.get("output_tokens", 0),
+            "cached_tokens": cached,
+        },
+        latency,
+    )
+
+async def _invoke_llm(client: ChatOpenAI, messages: List[BaseMessage], agent_name: str) -> AIMessage:
+    start = time.perf_counter()
+    response = await client.ainvoke(messages)
+    _log_usage(agent_name, response, time.perf_counter() - start)
+    return response
+
+def _tokens_after(state: AgentState, response: AIMessage) -> int:
+    """累加本轮已消耗的token数"""
+    usage = getattr(response, "usage_metadata", None) or {}
+    return state.get("tokens_used", 0) + usage.get("total_tokens", 0)
+
+async def router_node(state: AgentState, client: ChatOpenAI, budget: Optional[ToolLoopBudget] = None) -> Dict:
     logger.info("Executing LLM-driven router")
-    with open(os.path.join("prompts", "router_prompt.txt"), "r", encoding="utf-8") as f:
-        system_prompt = f.read()
+    system_prompt = get_prompt_registry().static("router")
     messages = [SystemMessage(content=system_prompt), HumanMessage(content=state['user_message'])]
-    response = client.invoke(messages)
+    response = await _invoke_llm(client, messages, "Router")
     intent = response.content.strip().lower()
     if intent not in ['tech', 'price', 'default']:
         intent = 'default'
     logger.info(f"LLM-driven intent detected: {intent}")
-    return {"intent": intent, "chat_history": [HumanMessage(content=state['user_message'])]}
+    if budget is not None:
+        budget.record_turn()
+    return {
+        "intent": intent,
+        "chat_history": [HumanMessage(content=state['user_message'])],
+        "turn_started": time.monotonic(),
+        "tool_iterations": 0,
+        "tokens_used": _tokens_after({}, response),
+    }
 
-def base_agent_node(state: AgentState, client: ChatOpenAI, system_prompt: str, agent_name: str) -> Dict:
+async def base_agent_node(state: AgentState, client: ChatOpenAI, system_prompt: str, agent_name: str) -> Dict:
     logger.info(f"Executing {agent_name} Agent (no tools)")
-    messages = [SystemMessage(content=f"【商品信息】{state['item_description']}\n{system_prompt}"), *state['chat_history']]
-    response = client.invoke(messages)
-    return {"final_reply": response.content, "chat_history": [response]}
+    messages = _build_agent_messages(state, system_prompt)
+    response = await _invoke_llm(client, messages, agent_name)
+    return {"final_reply": response.content, "chat_history": [response], "tokens_used": _tokens_after(state, response)}
 
-def price_agent_node(state: AgentState, client: ChatOpenAI) -> Dict:
-    with open(os.path.join("prompts", "price_prompt.txt"), "r", encoding="utf-8") as f:
-        prompt = f.read()
-    return base_agent_node(state, client, prompt, "Price")
+async def price_agent_node(state: AgentState, client: ChatOpenAI) -> Dict:
+    prompt = get_prompt_registry().static("price")
+    return await base_agent_node(state, client, prompt, "Price")
 
-def default_agent_node(state: AgentState, client: ChatOpenAI) -> Dict:
+async def default_agent_node(state: AgentState, client: ChatOpenAI) -> Dict:
     logger.info("Executing Default Agent (with potential tools)")
-    with open(os.path.join("prompts", "default_prompt.txt"), "r", encoding="utf-8") as f:
-        system_prompt = f.read()
-    messages = [SystemMessage(content=f"【商品信息】{state['item_description']}\n{system_prompt}"), *state['chat_history']]
-    response = client.invoke(messages)
+    system_prompt = get_prompt_registry().static("default")
+    messages = _build_agent_messages(state, system_prompt)
+    response = await _invoke_llm(client, messages, "Default")
     if not response.tool_calls:
         logger.info(f"Default agent generated a direct reply: {response.content}")
-        return {"final_reply": response.content, "chat_history": [response]}
+        return {"final_reply": response.content, "chat_history": [response], "tokens_used": _tokens_after(state, response)}
     else:
         logger.info(f"Default agent decided to call tools: {response.tool_calls}")
-        return {"tool_calls": response.tool_calls, "chat_history": [response]}
+        return {"tool_calls": response.tool_calls, "chat_history": [response], "tokens_used": _tokens_after(state, response)}
 
-def tech_agent_node(state: AgentState, client: ChatOpenAI) -> Dict:
+async def tech_agent_node(state: AgentState, client: ChatOpenAI) -> Dict:
 
     logger.info("Executing Tech Agent (with tools)")
-    with open(os.path.join("prompts", "tech_prompt.txt"), "r", encoding="utf-8") as f:
-        system_prompt = f.read()
-    messages = [SystemMessage(content=f"【商品信息】{state['item_description']}\n{system_prompt}"), *state['chat_history']]
-    response = client.invoke(messages)
+    system_prompt = get_prompt_registry().static("tech")
+    messages = _build_agent_messages(state, system_prompt)
+    response = await _invoke_llm(client, messages, "Tech")
     if not response.tool_calls:
         logger.info(f"Tech agent generated a direct reply: {response.content}")
-        return {"final_reply": response.content, "chat_history": [response]}
+        return {"final_reply": response.content, "chat_history": [response], "tokens_used": _tokens_after(state, response)}
     else:
         logger.info(f"Tech agent decided to call tools: {response.tool_calls}")
-        return {"tool_calls": response.tool_calls, "chat_history": [response]}
+        return {"tool_calls": response.tool_calls, "chat_history": [response], "tokens_used": _tokens_after(state, response)}
 
 
 
 def safety_filter_node(state: AgentState) -> Dict:
     reply = state['final_reply']
-    blocked_phrases = ["微信", "QQ", "支付宝", "银行卡", "线下"]
-    if any(p in reply for p in blocked_phrases):
-        logger.warning(f"Blocked sensitive word in reply: {reply}")
-        return {"final_reply": "[安全提醒]请通过平台沟通"}
+    safety = get_safety_filter()
+    hit = safety.find(reply)
+    if hit is not None:
+        logger.warning(f"Blocked sensitive word ({hit}) in reply: {reply}")
+        return {"final_reply": safety.replacement}
     return {}
 
-def should_continue(state: AgentState) -> str:
+def should_continue(state: AgentState, budget: Optional[ToolLoopBudget] = None) -> str:
     if state.get("tool_calls"):
+        if budget is not None and budget.exhausted_reason(state):
+            return "final_answer"
         return "tool_node"
     else:
         return "safety_filter"
 
-def tool_node(state: AgentState) -> Dict:
+def return_to_agent(state: AgentState) -> str:
+    """工具执行完后回到发起调用的Agent"""
+    return "tech_agent" if state.get("intent") == "tech" else "default_agent"
+
+async def final_answer_node(state: AgentState, client: ChatOpenAI, budget: ToolLoopBudget) -> Dict:
+    """预算用完时不再执行工具，不带工具地生成最终回复"""
+    reason = budget.exhausted_reason(state) or "unknown"
+    budget.record_exhausted(reason)
+    stats = budget.stats()
+    logger.warning(
+        f"工具循环预算已用完({reason})：工具轮次 {state.get('tool_iterations', 0)}，"
+        f"耗时 {budget.elapsed(state):.1f} 秒，token {state.get('tokens_used', 0)}；"
+        f"累计触发率 {stats['exhausted']}/{stats['turns']}"
+    )
+    # 未执行的工具调用也要有对应的工具结果，否则对话历史不合法
+    skipped = [
+        ToolMessage(content="工具调用预算已用完，未执行。", tool_call_id=tool_call['id'])
+        for tool_call in state.get("tool_calls") or []
+    ]
+    prompt = get_prompt_registry().static("tech" if state.get("intent") == "tech" else "default")
+    messages = _build_agent_messages(state, prompt) + skipped + [SystemMessage(content=FORCE_FINAL_INSTRUCTION)]
+    response = await _invoke_llm(client, messages, "Final")
+    return {
+        "final_reply": response.content,
+        "chat_history": skipped + [response],
+        "tool_calls": None,
+        "tokens_used": _tokens_after(state, response),
+    }
+
+async def _run_tool(tool_call: dict, tool_map: Dict, timeouts: Dict[str, float],
+                    max_timeout: Optional[float] = None) -> ToolMessage:
+    """执行单个工具调用，出错或超时都以错误信息作为工具结果返回给模型"""
+    tool_name = tool_call['name']
+    if tool_name not in tool_map:
+        result = f"Error executing tool {tool_name}: unknown tool"
+    else:
+        timeout = timeouts.get(tool_name, DEFAULT_TOOL_TIMEOUT)
+        if max_timeout is not None:
+            timeout = max(0.01, min(timeout, max_timeout))
+        start = time.perf_counter()
+        try:
+            # 同步工具由 ainvoke 放到线程池执行；超时只放弃等待，线程中的调用会自行结束
+            result = await asyncio.wait_for(tool_map[tool_name].ainvoke(tool_call['args']), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"工具 {tool_name} 超过 {timeout} 秒未返回")
+            result = f"Error executing tool {tool_name}: timed out after {timeout}s"
+        except Exception as e:
+            result = f"Error executing tool {tool_name}: {e}"
+        logger.debug(f"工具 {tool_name} 耗时 {time.perf_counter() - start:.2f} 秒")
+    return ToolMessage(content=str(result), tool_call_id=tool_call['id'])
+
+async def tool_node(state: AgentState, tool_map: Dict, timeouts: Dict[str, float], parallel: bool = True,
+                    budget: Optional[ToolLoopBudget] = None) -> Dict:
+    """执行模型请求的工具调用；互不依赖的调用并发执行，本轮耗时取决于最慢的工具而不是总和"""
     if not state.get("tool_calls"):
         return {}
     logger.info(f"Executing tools: {state['tool_calls']}")
-    tool_map = {"get_item_details": get_item_details, "tavily_web_search": tavily_web_search, "log_customer_request": log_customer_request}
-    tool_messages = []
-    for tool_call in state["tool_calls"]:
-        tool_name = tool_call['name']
-        if tool_name in tool_map:
-            try:
-                result = tool_map[tool_name].invoke(tool_call['args'])
-            except Exception as e:
-                result = f"Error executing tool {tool_name}: {e}"
-            tool_messages.append(ToolMessage(content=str(result), tool_call_id=tool_call['id']))
-    return {"chat_history": tool_messages, "tool_calls": None}
+    # 工具超时同样不超过本轮剩余的时间预算
+    max_timeout = budget.remaining_secs(state) if budget is not None else None
+    if parallel:
+        tool_messages = list(await asyncio.gather(
+            *(_run_tool(tool_call, tool_map, timeouts, max_timeout) for tool_call in state["tool_calls"])
+        ))
+    else:
+        tool_messages = [await _run_tool(tool_call, tool_map, timeouts, max_timeout) for tool_call in state["tool_calls"]]
+    # gather 保持调用顺序，ToolMessage 与 AIMessage 中的 tool_calls 一一对应
+    return {"chat_history": tool_messages, "tool_calls": None, "tool_iterations": state.get("tool_iterations", 0) + 1}
 
 # 4. 图构建器
 class XianyuGraphBuilder:
-    def __init__(self):
+    def __init__(self, config: Optional[Dict] = None, tools: Optional[List] = None):
+        """
+        Args:
+            config: 完整配置，读取其中的 graph 段（parallel_tools、tool_timeouts、tool_budget）
+            tools: 可用工具，默认为商品详情、网络搜索和记录买家需求
+        """
+        section = (config or {}).get("graph") or {}
+        self.parallel_tools = section.get("parallel_tools", True)
+        self.tool_timeouts = {**DEFAULT_TOOL_TIMEOUTS, **(section.get("tool_timeouts") or {})}
+        self.budget = ToolLoopBudget.from_config(config)
+        self.tools = list(tools) if tools is not None else [get_item_details, tavily_web_search, log_customer_request]
         self.client = ChatOpenAI(
             api_key=os.getenv("API_KEY"),
             base_url=os.getenv("MODEL_BASE_URL", "http://127.0.0.1:8080/v1"),
@@ -170,7 +412,7 @@ class XianyuGraphBuilder:
         )
         if not self.client.openai_api_key:
             raise ValueError("API_KEY not found in environment.")
-        self.tool_client = self.client.bind_tools([get_item_details, tavily_web_search, log_customer_request])
+        self.tool_client = self.client.bind_tools(self.tools)
        # self.context_manager = ChatContextManager()
         
         # 将 context_manager 注入到工具函数中
@@ -181,27 +423,75 @@ class XianyuGraphBuilder:
         self._build_graph()
 
     def _build_graph(self):
-        self.graph.add_node("router", functools.partial(router_node, client=self.client))
+        self.graph.add_node("router", functools.partial(router_node, client=self.client, budget=self.budget))
         self.graph.add_node("price_agent", functools.partial(price_agent_node, client=self.client))
         self.graph.add_node("default_agent", functools.partial(default_agent_node, client=self.tool_client))
         self.graph.add_node("tech_agent", functools.partial(tech_agent_node, client=self.tool_client))
-        self.graph.add_node("tool_node", tool_node)
+        self.graph.add_node("tool_node", functools.partial(
+            tool_node,
+            tool_map={t.name: t for t in self.tools},
+            timeouts=self.tool_timeouts,
+            parallel=self.parallel_tools,
+            budget=self.budget,
+        ))
+        self.graph.add_node("final_answer", functools.partial(final_answer_node, client=self.client, budget=self.budget))
         self.graph.add_node("safety_filter", safety_filter_node)
 
         self.graph.set_entry_point("router")
         self.graph.add_conditional_edges("router", lambda s: s["intent"], {"price": "price_agent", "tech": "tech_agent", "default": "default_agent"})
-        self.graph.add_conditional_edges("tech_agent", should_continue, {"tool_node": "tool_node", "safety_filter": "safety_filter"})
-        self.graph.add_conditional_edges("default_agent", should_continue, {"tool_node": "tool_node", "safety_filter": "safety_filter"})
-        self.graph.add_edge('tool_node', 'tech_agent')
+        tool_edges = {"tool_node": "tool_node", "final_answer": "final_answer", "safety_filter": "safety_filter"}
+        continue_with_budget = functools.partial(should_continue, budget=self.budget)
+        self.graph.add_conditional_edges("tech_agent", continue_with_budget, tool_edges)
+        self.graph.add_conditional_edges("default_agent", continue_with_budget, tool_edges)
+        self.graph.add_edge('final_answer', 'safety_filter')
+        self.graph.add_conditional_edges("tool_node", return_to_agent, {"tech_agent": "tech_agent", "default_agent": "default_agent"})
         self.graph.add_edge('price_agent', 'safety_filter')
-        self.graph.add_edge('default_agent', 'safety_filter')
         self.graph.add_edge('safety_filter', END)
 
-    def compile(self):
-        return self.graph.compile()
+    def compile(self, checkpointer=None):
+        """checkpointer 不为空时，以会话ID为 thread_id 在多轮之间保留图状态"""
+        return self.graph.compile(checkpointer=checkpointer)
+
+_compiled_graph = None
+_tool_budget: Optional[ToolLoopBudget] = None
+_graph_lock = threading.Lock()
+
+def _load_config(config_path: str) -> Dict:
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.error(f"加载图配置时出错: {e}")
+        return {}
+
+def get_graph(config_path: str = "config.json"):
+    """
+    进程内共享的已编译图
+
+    模型客户端、工具绑定和图结构只构建一次，可被并发的 ainvoke 复用。会话状态由检查点存储按
+    thread_id 保存，调用时通过 thread_config(chat_id) 指定会话，每轮只需传入新消息。
+    """
+    global _compiled_graph, _tool_budget
+    if _compiled_graph is None:
+        with _graph_lock:
+            if _compiled_graph is None:
+                config = _load_config(config_path)
+                builder = XianyuGraphBuilder(config)
+                _tool_budget = builder.budget
+                checkpoint_section = (config.get("graph") or {}).get("checkpointer") or {}
+                checkpointer = SqliteCheckpointSaver.from_config(config) if checkpoint_section.get("enabled", True) else None
+                _compiled_graph = builder.compile(checkpointer)
+                logger.info("XianyuGraph 已编译")
+    return _compiled_graph
+
+def thread_config(chat_id: str) -> Dict:
+    """以会话ID作为检查点的 thread_id"""
+    return {"configurable": {"thread_id": str(chat_id)}}
 
-def get_graph():
-    builder = XianyuGraphBuilder()
-    return builder.compile()
+def tool_budget_stats() -> Dict:
+    """共享图的工具循环预算触发统计"""
+    return _tool_budget.stats() if _tool_budget is not None else {}
 
 
@@ -0,0 +1,46 @@
+import os
+from typing import Dict, List, NamedTuple, Optional
+
+# 与调整前完全一致的调用参数，未配置的Agent沿用这些值
+DEFAULT_MAX_TOKENS = 500
+DEFAULT_TEMPERATURE = 0.4
+DEFAULT_TOP_P = 0.8
+
+
+class AgentProfile(NamedTuple):
+    """单个Agent的大模型调用参数"""
+    model: Optional[str] = None
+    max_tokens: int = DEFAULT_MAX_TOKENS
+    temperature: float = DEFAULT_TEMPERATURE
+    top_p: float = DEFAULT_TOP_P
+    timeout: Optional[float] = None
+    stop: Optional[List[str]] = None
+
+    @classmethod
+    def from_dict(cls, spec: Optional[Dict], base: "AgentProfile" = None) -> "AgentProfile":
+        """以 base 为默认值，覆盖 spec（config.json 中 agent_profiles 的一项）给出的字段，忽略未知字段"""
+        base = base or cls()
+        return base._replace(**{k: v for k, v in (spec or {}).items() if k in cls._fields})
+
+    def resolve_model(self) -> str:
+        """未指定模型时使用环境变量 MODEL_NAME"""
+        return self.model or os.getenv("MODEL_NAME", "qwen-max")
+
+    def request_params(self, temperature: Optional[float] = None) -> Dict:
+        """
+        生成 chat.completions.create 的参数
+
+        Args:
+            temperature: 调用方动态计算的温度（如议价Agent），优先于配置
+        """
+        params = {
+            "model": self.resolve_model(),
+            "temperature": self.temperature if temperature is None else temperature,
+            "max_tokens": self.max_tokens,
+            "top_p": self.top_p,
+        }
+        if self.timeout:
+            params["timeout"] = self.timeout
+        if self.stop:
+            params["stop"] = list(self.stop)
+        return params
@@ -0,0 +1,231 @@
+import math
+import re
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from loguru import logger
+
+# 第N次议价时相对标价累计可让的比例，超出列表长度后保持最后一档
+DEFAULT_CONCESSION_SCHEDULE = (0.03, 0.06, 0.08, 0.10)
+DEFAULT_FLOOR_PCT = 0.88
+# 出价低于标价的这个比例视为无诚意砍价，直接拒绝
+DEFAULT_DECLINE_BELOW_PCT = 0.5
+# 解析出的出价低于标价的这个比例时多半是解析错了（如数量、型号），交给大模型处理
+DEFAULT_MIN_OFFER_PCT = 0.2
+
+# 相对标价的让价说法：“少50”、“便宜100块”、“优惠个30元”；“最少”、“至少”、“多少”中的“少”不算
+_DISCOUNT_RE = re.compile(r'(?:(?<![最至多])少|便宜|优惠|减|让|抹)\s*(?:个|了)?\s*(\d+(?:\.\d+)?)\s*(?:块钱|块|元)?')
+# “最少800”、“至少800”即使不带单位也是买家的报价
+_AT_LEAST_RE = re.compile(r'(?:最少|至少)\s*(\d+(?:\.\d+)?)')
+_RATE_RE = re.compile(r'(\d+(?:\.\d+)?)\s*折')
+_PRICE_RE = re.compile(r'(\d+(?:\.\d+)?)\s*(?:块钱|块|元)')
+# 紧跟在这些词之后的金额是参照价格，不是买家的出价
+_REFERENCE_RE = re.compile(r'(?:原价|标价|售价|现价|定价|标|挂|买的时候|买成|新的|新品|官网|京东|淘宝|别家|别人)'
+                           r'[^\d，,。.！!？?；;\s]{0,3}\s*$')
+# 多件打包的报价（“两个一起200元”）不是单件出价
+_BUNDLE_RE = re.compile(r'(?:(?:[2-9]|\d{2,}|[两俩二三四五六七八九十])\s*(?:个|件|台|只|套|副|双|部)|一起|打包)')
+
+DEFAULT_TEMPLATES: Dict[str, List[str]] = {
+    "accept": [
+        "可以的，{price}元就出给您了，直接拍下我改价。",
+        "行，{price}元成交，拍下后我这边改价~",
+    ],
+    "counter": [
+        "{offer}元有点低了，{product_name}{price}元可以出，拍下我改价。",
+        "理解您想便宜点，{price}元吧，这个价很实在了。",
+        "{price}元可以的，再低真没利润了，诚心要直接拍。",
+    ],
+    "final": [
+        "最低{price}元了，不能再少了，诚心要的话拍下改价。",
+        "{price}元已经是底价了，真的不能再低了。",
+    ],
+    "decline": [
+        "{offer}元差得有点多了，{product_name}{price}元可以出哦。",
+        "这个价格实在出不了，{price}元的话可以考虑。",
+    ],
+}
+
+
+class BargainPolicy(NamedTuple):
+    """单个商品的议价底线与让价节奏"""
+    list_price: float
+    floor: float
+    schedule: Sequence[float]
+    decline_below: float
+
+
+class BargainDecision(NamedTuple):
+    """
+    议价决定
+
+    action 为 accept / counter / final / decline / llm，llm 表示没有可靠的数字出价（没有数字、有歧义或低得不合理），
+    交给大模型处理。
+    """
+    action: str
+    price: Optional[float]
+    offer: float
+    floor: Optional[float]
+
+
+def parse_offer(user_msg: str, list_price: float) -> float:
+    """
+    从买家消息中解析出价
+
+    “少50”、“便宜100块”按标价减去让价计算，“9折”按标价打折；直接报价时跳过原价、标价等参照金额。
+    解析出多个不同的出价、多件打包报价、或没有可用的数字时返回0，交给大模型理解。
+    """
+    if _BUNDLE_RE.search(user_msg):
+        return 0.0
+    candidates = []
+    taken = []
+    if list_price > 0:
+        for match in _DISCOUNT_RE.finditer(user_msg):
+            candidates.append(list_price - float(match.group(1)))
+            taken.append(match.span())
+        for match in _RATE_RE.finditer(user_msg):
+            rate = float(match.group(1))
+            if 1 <= rate < 100:
+                candidates.append(list_price * (rate / 10 if rate < 10 else rate / 100))
+                taken.append(match.span())
+    for match in _AT_LEAST_RE.finditer(user_msg):
+        candidates.append(float(match.group(1)))
+        taken.append(match.span())
+    for match in _PRICE_RE.finditer(user_msg):
+        if any(start <= match.start() < end for start, end in taken):
+            continue
+        if _REFERENCE_RE.search(user_msg[:match.start()]):
+            continue
+        candidates.append(float(match.group(1)))
+
+    offers = {round(offer, 2) for offer in candidates}
+    return offers.pop() if len(offers) == 1 else 0.0
+
+
+def _round_price(price: float) -> float:
+    """还价取整到元，向上取整保证不低于底线"""
+    return float(math.ceil(price - 1e-9))
+
+
+class BargainEngine:
+    """
+    基于规则的议价引擎
+
+    根据商品底价、让价节奏、买家出价和已议价次数直接给出接受/还价/拒绝的决定，结果稳定可预期；
+    只有买家没有给出具体数字时才需要大模型参与。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        floor_pct: float = DEFAULT_FLOOR_PCT,
+        schedule: Sequence[float] = DEFAULT_CONCESSION_SCHEDULE,
+        decline_below_pct: float = DEFAULT_DECLINE_BELOW_PCT,
+        items: Optional[Dict[str, Dict]] = None,
+        templates: Optional[Dict[str, List[str]]] = None,
+        phrasing: str = "template",
+        min_offer_pct: float = DEFAULT_MIN_OFFER_PCT,
+    ):
+        """
+        Args:
+            floor_pct: 未单独配置的商品，底价为标价乘以该比例
+            schedule: 第N次议价时相对标价累计可让的比例
+            decline_below_pct: 出价低于标价乘以该比例时直接拒绝
+            items: 按商品ID覆盖 floor_price / floor_pct / schedule / decline_below_pct
+            templates: 各决定对应的回复模板
+            phrasing: template 使用模板回复；llm 把决定交给议价Agent组织语言
+            min_offer_pct: 出价低于标价乘以该比例时不按规则决定，交给大模型
+        """
+        if phrasing not in ("template", "llm"):
+            raise ValueError(f"未知的议价回复方式: {phrasing}")
+        self.enabled = enabled
+        self.floor_pct = floor_pct
+        self.schedule = tuple(schedule) or (0.0,)
+        self.decline_below_pct = decline_below_pct
+        self.items = {str(k): v for k, v in (items or {}).items()}
+        self.templates = {**DEFAULT_TEMPLATES, **(templates or {})}
+        self.phrasing = phrasing
+        self.min_offer_pct = min_offer_pct
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "BargainEngine":
+        section = config.get("bargaining") or {}
+        return cls(
+            enabled=section.get("enabled", True),
+            floor_pct=section.get("floor_pct", DEFAULT_FLOOR_PCT),
+            schedule=section.get("schedule", DEFAULT_CONCESSION_SCHEDULE),
+            decline_below_pct=section.get("decline_below_pct", DEFAULT_DECLINE_BELOW_PCT),
+            items=section.get("items"),
+            templates=section.get("templates"),
+            phrasing=section.get("phrasing", "template"),
+            min_offer_pct=section.get("min_offer_pct", DEFAULT_MIN_OFFER_PCT),
+        )
+
+    def policy_for(self, item_id, list_price: float) -> BargainPolicy:
+        spec = self.items.get(str(item_id), {}) if item_id is not None else {}
+        floor = spec.get("floor_price")
+        if floor is None:
+            floor = list_price * spec.get("floor_pct", self.floor_pct)
+        return BargainPolicy(
+            list_price=list_price,
+            floor=min(float(floor), list_price),
+            schedule=tuple(spec.get("schedule", self.schedule)) or (0.0,),
+            decline_below=list_price * spec.get("decline_below_pct", self.decline_below_pct),
+        )
+
+    def decide(self, item_id, list_price: float, offer: float, bargain_count: int) -> BargainDecision:
+        """
+        Args:
+            item_id: 商品ID，用于查找单独配置的底价
+            list_price: 当前标价
+            offer: 买家出价，0表示没有解析到数字
+            bargain_count: 本轮之前已经议价的次数
+        """
+        if offer <= 0 or list_price <= 0 or offer < list_price * self.min_offer_pct:
+            return BargainDecision("llm", None, offer, None)
+
+        policy = self.policy_for(item_id, list_price)
+        if offer >= list_price:
+            return BargainDecision("accept", list_price, offer, policy.floor)
+
+        floor = _round_price(policy.floor)
+        step = min(bargain_count, len(policy.schedule) - 1)
+        allowed = min(max(floor, _round_price(list_price * (1 - policy.schedule[step]))), list_price)
+        if offer >= allowed:
+            return BargainDecision("accept", offer, offer, policy.floor)
+        if offer < policy.decline_below:
+            return BargainDecision("decline", allowed, offer, policy.floor)
+        at_floor = allowed <= floor or bargain_count >= len(policy.schedule) - 1
+        return BargainDecision("final" if at_floor else "counter", allowed, offer, policy.floor)
+
+    def render(self, decision: BargainDecision, product_name: str, bargain_count: int = 0) -> str:
+        """按决定填充回复模板，同一次议价总是选同一个模板，重放结果一致"""
+        options = self.templates.get(decision.action) or DEFAULT_TEMPLATES[decision.action]
+        template = options[bargain_count % len(options)]
+        return template.format(
+            product_name=product_name,
+            price=_format_price(decision.price),
+            offer=_format_price(decision.offer),
+        )
+
+    @staticmethod
+    def describe(decision: BargainDecision) -> str:
+        """供大模型组织语言时使用的决定说明"""
+        price = _format_price(decision.price)
+        if decision.action == "accept":
+            return f"接受买家出价{price}元，引导买家拍下改价"
+        if decision.action == "final":
+            return f"还价{price}元，这是底价，不能再低"
+        if decision.action == "decline":
+            return f"买家出价过低，婉拒并说明{price}元可以出"
+        return f"还价{price}元，不得低于此价"
+
+    def log_decision(self, item_id, decision: BargainDecision):
+        logger.info(
+            f"议价决定: 商品 {item_id}, 出价 {decision.offer}, 结果 {decision.action}"
+            + (f", 价格 {decision.price}, 底价 {decision.floor}" if decision.price is not None else "")
+        )
+
+
+def _format_price(price: Optional[float]) -> str:
+    if price is None:
+        return ""
+    return str(int(price)) if float(price).is_integer() else f"{price:.2f}"
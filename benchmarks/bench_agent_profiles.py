@@ -0,0 +1,105 @@
+"""
+Agent调用档位基准
+
+在本地替身服务上对比两组调用参数：所有Agent统一使用 qwen-max/500 token（调整前的行为），
+与 config.json 中 agent_profiles 配置的分档参数。替身服务按模型模拟首token延迟与逐token生成速度，
+生成长度受请求的 max_tokens 限制，因此结果反映的是模型选择与输出预算对延迟的影响。
+
+用法:
+    python benchmarks/bench_agent_profiles.py [--calls 20] [--scale 0.2]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import OpenAI  # noqa: E402
+
+from llm_usage import configure_usage_recorder  # noqa: E402
+from utils.mock_llm_server import MockLLMServer, _estimate_tokens  # noqa: E402
+from XianyuAgent import ClassifyAgent, DefaultAgent, PriceAgent, TechAgent  # noqa: E402
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.json")
+
+# 模拟的模型速度：(首token延迟秒, 每个输出token秒)
+MODEL_SPEED = {
+    "qwen-max": (0.25, 0.020),
+    "qwen-plus": (0.15, 0.012),
+    "qwen-turbo": (0.06, 0.005),
+}
+
+AGENTS = {
+    "classify": (ClassifyAgent, "能再便宜点吗"),
+    "default": (DefaultAgent, "在吗"),
+    "price": (PriceAgent, "100出吗"),
+    "tech": (TechAgent, "电池健康度多少"),
+}
+
+LONG_REPLY = "亲，这款商品成色很好，功能都正常，支持当面验货，" * 12
+
+
+def _reply(body):
+    system = body["messages"][0]["content"]
+    return "price" if system.startswith("classify") else LONG_REPLY
+
+
+def _latency(scale):
+    def latency(body):
+        ttft, per_token = MODEL_SPEED.get(body.get("model"), MODEL_SPEED["qwen-max"])
+        output_tokens = min(_estimate_tokens(_reply(body)), body.get("max_tokens") or 10 ** 6)
+        return (ttft + per_token * output_tokens) * scale
+    return latency
+
+
+def run(server, profiles, calls):
+    client = OpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+    results = {}
+    for name, (agent_cls, message) in AGENTS.items():
+        agent = agent_cls(client, name, lambda x: x, profiles.get(name))
+        latencies = []
+        for _ in range(calls):
+            start = time.perf_counter()
+            agent.generate(user_msg=message, item_desc="iPhone 13 128G", context=[])
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        results[name] = {
+            "model": agent.profile.resolve_model(),
+            "max_tokens": agent.profile.max_tokens,
+            "p50": statistics.median(latencies),
+            "p95": latencies[min(len(latencies) - 1, int(round(0.95 * (len(latencies) - 1))))],
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent调用档位基准")
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--scale", type=float, default=0.2, help="模拟延迟的缩放系数")
+    args = parser.parse_args()
+
+    with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+        tiered = json.load(f).get("agent_profiles", {})
+    uniform = {name: {"model": "qwen-max", "max_tokens": 500} for name in AGENTS}
+
+    configure_usage_recorder({"llm_usage": {"db_path": os.path.join(tempfile.mkdtemp(), "usage.db")}})
+    with MockLLMServer(latency=_latency(args.scale), reply=_reply) as server:
+        baseline = run(server, uniform, args.calls)
+        candidate = run(server, tiered, args.calls)
+
+    print(f"{'agent':<10}{'uniform':>28}{'tiered':>28}{'p50 speedup':>14}")
+    for name in AGENTS:
+        b, c = baseline[name], candidate[name]
+        print(f"{name:<10}"
+              f"{b['model'] + '/' + str(b['max_tokens']):>14}{b['p50']:>7.0f}/{b['p95']:<6.0f}"
+              f"{c['model'] + '/' + str(c['max_tokens']):>14}{c['p50']:>7.0f}/{c['p95']:<6.0f}"
+              f"{b['p50'] / c['p50']:>13.2f}x")
+    print("(延迟单位 ms，格式 p50/p95)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+会话数据库访问基准
+
+按 handle_message 处理一条消息时的数据库调用顺序（查商品、查最后商品、写买家消息、读上下文、
+加议价次数、读议价次数、写回复、更新最后商品、更新摘要）回放若干条消息，比较：
+  legacy: 每次调用新建连接，默认回滚日志模式（改造前的行为）
+  pool:   常驻连接池，WAL + synchronous=NORMAL
+  batched: 连接池 + 写后合并队列
+  cached: 连接池 + 写后合并队列 + 会话历史内存缓存
+
+另外测量写入吞吐：--writers 个会话并发只写（消息、议价次数、最后商品），统计全部落库所需时间
+（legacy 多连接并发写会频繁报 database is locked，不参与吞吐对比）。
+
+用法:
+    python benchmarks/bench_context_db.py [--messages 300] [--chats 20] [--writers 50] [--rounds 20]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import aiosqlite  # noqa: E402
+from loguru import logger  # noqa: E402
+
+from context_manager import ChatContextManager  # noqa: E402
+from history_cache import ChatHistoryCache  # noqa: E402
+from utils.sqlite_pool import SqlitePool  # noqa: E402
+from utils.write_behind import WriteBehindQueue  # noqa: E402
+
+ITEM = {"itemId": "bench_item", "title": "雅马哈功放 A-S501", "desc": "九成新，功率：85W", "soldPrice": "1800"}
+
+
+class LegacyPool:
+    """每次调用新建连接，复现改造前 async with sqlite3.connect(db_path) 的开销"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    @asynccontextmanager
+    async def writer(self):
+        async with aiosqlite.connect(self.db_path) as conn:
+            yield conn
+
+    reader = writer
+
+    async def close(self):
+        pass
+
+
+async def handle(manager, chat_id, message):
+    item_id = ITEM["itemId"]
+    await manager.get_item_info(item_id)
+    await manager.get_last_item_id(chat_id)
+    await manager.add_message_by_chat(chat_id, "buyer", item_id, "user", message)
+    await manager.get_context_for_item(chat_id, item_id)
+    await manager.increment_bargain_count_for_item(chat_id, item_id)
+    await manager.get_bargain_count_for_item(chat_id, item_id)
+    await manager.add_message_by_chat(chat_id, "seller", item_id, "assistant", f"回复：{message}")
+    await manager.update_last_item_id(chat_id, item_id)
+    await manager.update_summary(chat_id, item_id)
+
+
+async def run(manager, messages, chats):
+    await manager._init_db()
+    await manager.save_item_info(ITEM["itemId"], ITEM)
+    latencies = []
+    for i in range(messages):
+        start = time.perf_counter()
+        await handle(manager, f"chat_{i % chats}", f"第{i}条消息，能便宜点吗")
+        latencies.append((time.perf_counter() - start) * 1000)
+    await manager.close()
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(0.95 * (len(latencies) - 1))],
+        "total": sum(latencies),
+    }
+
+
+async def write_load(manager, writers, rounds):
+    """并发会话只写入，返回每秒落库的写操作数（含最终提交）"""
+    await manager._init_db()
+    item_id = ITEM["itemId"]
+
+    async def chat(chat_id):
+        for i in range(rounds):
+            await manager.add_message_by_chat(chat_id, "buyer", item_id, "user", f"第{i}条消息")
+            await manager.increment_bargain_count_for_item(chat_id, item_id)
+            await manager.add_message_by_chat(chat_id, "seller", item_id, "assistant", f"回复{i}")
+            await manager.update_last_item_id(chat_id, item_id)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(chat(f"chat_{n}") for n in range(writers)))
+    await manager.flush()
+    elapsed = time.perf_counter() - start
+    await manager.close()
+    return writers * rounds * 4 / elapsed
+
+
+def make_manager(name, db_path):
+    if name == "legacy":
+        return ChatContextManager(db_path=db_path, pool=LegacyPool(db_path))
+    pool = SqlitePool(db_path)
+    writes = WriteBehindQueue(pool) if name in ("batched", "cached") else None
+    history = ChatHistoryCache() if name == "cached" else None
+    return ChatContextManager(db_path=db_path, pool=pool, write_behind=writes, history_cache=history)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话数据库访问基准")
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--writers", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    workdir = tempfile.mkdtemp()
+    modes = ("legacy", "pool", "batched", "cached")
+    results, throughput = {}, {}
+    for name in modes:
+        db_path = os.path.join(workdir, f"{name}.db")
+        results[name] = asyncio.run(run(make_manager(name, db_path), args.messages, args.chats))
+        if name != "legacy":
+            db_path = os.path.join(workdir, f"{name}_load.db")
+            throughput[name] = asyncio.run(write_load(make_manager(name, db_path), args.writers, args.rounds))
+
+    print(f"{args.messages} 条消息，{args.chats} 个会话，每条消息 9 次数据库调用；"
+          f"写入吞吐为 {args.writers} 个会话并发各写 {args.rounds * 4} 次")
+    print(f"{'mode':<9}{'p50 ms':>10}{'p95 ms':>10}{'total ms':>12}{'writes/s':>12}")
+    for name in modes:
+        r = results[name]
+        writes = f"{throughput[name]:>12.0f}" if name in throughput else f"{'-':>12}"
+        print(f"{name:<9}{r['p50']:>10.2f}{r['p95']:>10.2f}{r['total']:>12.0f}{writes}")
+    print(f"p50 加速: {results['legacy']['p50'] / results['pool']['p50']:.1f}x，"
+          f"写入吞吐提升: {throughput['batched'] / throughput['pool']:.1f}x（相对连接池逐条提交），"
+          f"缓存 p50 加速: {results['batched']['p50'] / results['cached']['p50']:.1f}x（相对 batched）")
+
+
+if __name__ == "__main__":
+    main()
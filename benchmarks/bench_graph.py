@@ -0,0 +1,113 @@
+"""
+XianyuGraph 单轮延迟基准
+
+在本地替身服务上运行技术咨询的一轮对话：路由 -> 技术Agent发起两个工具调用 -> 工具执行 -> 技术Agent作答。
+对比调整前的执行方式（每轮重新构建并编译图、工具逐个执行）与编译一次、工具并发执行的方式。
+工具用同名的替身代替，按 --search-latency / --details-latency 模拟耗时。
+
+用法:
+    python benchmarks/bench_graph.py [--turns 20] [--llm-latency 0.1] [--search-latency 0.4] [--details-latency 0.3]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.tools import tool  # noqa: E402
+from pydantic import BaseModel, Field  # noqa: E402
+
+from llm_usage import configure_usage_recorder  # noqa: E402
+from utils.mock_llm_server import MockLLMServer  # noqa: E402
+import XianyuGraph  # noqa: E402
+
+
+class SearchArgs(BaseModel):
+    query: str = Field(description="The search query to use with Tavily.")
+
+
+class DetailsArgs(BaseModel):
+    item_id: str = Field(description="The ID of the item to get details for.")
+
+
+def _make_tools(search_latency, details_latency):
+    @tool("tavily_web_search", args_schema=SearchArgs)
+    def slow_search(query: str) -> str:
+        """Use Tavily to search the web for up-to-date information."""
+        time.sleep(search_latency)
+        return "网络搜索结果：\nA-S501 额定功率 85W"
+
+    @tool("get_item_details", args_schema=DetailsArgs)
+    def slow_details(item_id: str) -> str:
+        """Call this to get detailed technical specifications of an item."""
+        time.sleep(details_latency)
+        return '{"power_output": "85W"}'
+
+    return [slow_search, slow_details]
+
+
+def _reply(body):
+    messages = body.get("messages", [])
+    if any(m.get("role") == "tool" for m in messages):
+        return "这台功放额定功率85W，带两声道音箱没问题。"
+    if body.get("tools"):
+        return {"tool_calls": [
+            {"name": "tavily_web_search", "args": {"query": "雅马哈 A-S501 功率"}},
+            {"name": "get_item_details", "args": {"item_id": "item_123"}},
+        ]}
+    return "tech"
+
+
+STATE = {
+    "user_message": "这台功放功率多大，能带得动落地箱吗？",
+    "item_description": "九成新雅马哈功放 A-S501",
+    "chat_history": [],
+    "intent": "",
+    "bargain_count": 0,
+    "final_reply": "",
+}
+
+
+async def run(turns, config, tools, compile_once):
+    graph = XianyuGraph.XianyuGraphBuilder(config, tools).compile() if compile_once else None
+    latencies = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        turn_graph = graph or XianyuGraph.XianyuGraphBuilder(config, tools).compile()
+        result = await turn_graph.ainvoke(dict(STATE))
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert result["final_reply"]
+    latencies.sort()
+    return statistics.median(latencies), latencies[min(len(latencies) - 1, int(round(0.95 * (len(latencies) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="XianyuGraph 单轮延迟基准")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.1)
+    parser.add_argument("--search-latency", type=float, default=0.4)
+    parser.add_argument("--details-latency", type=float, default=0.3)
+    args = parser.parse_args()
+
+    configure_usage_recorder({"llm_usage": {"db_path": os.path.join(tempfile.mkdtemp(), "usage.db")}})
+    tools = _make_tools(args.search_latency, args.details_latency)
+    with MockLLMServer(latency=args.llm_latency, reply=_reply) as server:
+        os.environ["API_KEY"] = "test"
+        os.environ["MODEL_BASE_URL"] = server.base_url
+        baseline = asyncio.run(run(args.turns, {"graph": {"parallel_tools": False}}, tools, compile_once=False))
+        candidate = asyncio.run(run(args.turns, {"graph": {"parallel_tools": True}}, tools, compile_once=True))
+
+    print(f"{'mode':<28}{'p50':>10}{'p95':>10}")
+    print(f"{'rebuild + serial tools':<28}{baseline[0]:>10.0f}{baseline[1]:>10.0f}")
+    print(f"{'compiled + parallel tools':<28}{candidate[0]:>10.0f}{candidate[1]:>10.0f}")
+    print(f"(延迟单位 ms；3次模型调用约 {3 * args.llm_latency * 1000:.0f} ms，"
+          f"工具串行 {(args.search_latency + args.details_latency) * 1000:.0f} ms / "
+          f"并发 {max(args.search_latency, args.details_latency) * 1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
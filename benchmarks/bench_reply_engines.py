@@ -0,0 +1,169 @@
+"""
+回复引擎 A/B 回放基准
+
+把对话语料分别回放给 XianyuReplyBot（bot）与 XianyuGraph（graph）两个回复引擎，模型调用全部打到本地替身服务，
+统计每轮回复的延迟分位数、每轮大模型调用次数与token数，用于决定是否把流量切到图引擎。
+
+语料：logs/conversations_*.txt 中按会话分组的买家消息；另外把 benchmarks/data/buyer_messages.txt
+按 --turns-per-chat 条一组切成会话。替身服务按输出长度模拟首token延迟与生成速度。
+
+用法:
+    python benchmarks/bench_reply_engines.py [--chats 10] [--turns-per-chat 4] [--scale 0.2]
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from loguru import logger  # noqa: E402
+
+from graph_checkpoint import SqliteCheckpointSaver  # noqa: E402
+from llm_usage import configure_usage_recorder  # noqa: E402
+from prompt_registry import get_prompt_registry  # noqa: E402
+from reply_engine import BotEngine, GraphEngine  # noqa: E402
+from utils.mock_llm_server import MockLLMServer, _estimate_tokens  # noqa: E402
+from utils.reporting_utils import iter_logged_conversations  # noqa: E402
+
+CORPUS_PATH = os.path.join(ROOT, "benchmarks", "data", "buyer_messages.txt")
+CONFIG_PATH = os.path.join(ROOT, "config.json")
+
+ITEM_INFO = {
+    "itemId": "bench_item",
+    "title": "雅马哈功放 A-S501",
+    "desc": "九成新雅马哈功放，型号A-S501，功率：85W，无拆修，支持当面验货",
+    "soldPrice": "1800",
+}
+
+REPLY = "亲，这台功放成色很好，功能都正常，支持当面验货，喜欢可以直接拍下哦~"
+PRICE_RE = re.compile(r"\d|便宜|优惠|价|少点|砍")
+TECH_RE = re.compile(r"参数|功率|型号|配置|支持|兼容|区别|多大|多少瓦|音质")
+
+
+def load_conversations(turns_per_chat):
+    chats = OrderedDict()
+    for turn in iter_logged_conversations(os.path.join(ROOT, "logs")):
+        if turn["user_message"]:
+            chats.setdefault(f"log_{turn['chat_id']}", []).append(turn["user_message"])
+    with open(CORPUS_PATH, "r", encoding="utf-8") as f:
+        messages = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    for i in range(0, len(messages), turns_per_chat):
+        chats[f"corpus_{i // turns_per_chat}"] = messages[i:i + turns_per_chat]
+    return list(chats.items())
+
+
+def _label(body):
+    user = next((m.get("content", "") for m in reversed(body.get("messages", [])) if m.get("role") == "user"), "")
+    if PRICE_RE.search(user):
+        return "price"
+    return "tech" if TECH_RE.search(user) else "default"
+
+
+def make_reply(router_prompt, classify_prompt):
+    def reply(body):
+        system = str(body.get("messages", [{}])[0].get("content", ""))
+        if system == router_prompt or (classify_prompt and system.startswith(classify_prompt)):
+            return _label(body)
+        return REPLY
+    return reply
+
+
+def make_latency(reply, scale):
+    def latency(body):
+        output = reply(body)
+        return (0.2 + 0.015 * min(_estimate_tokens(output), body.get("max_tokens") or 10 ** 6)) * scale
+    return latency
+
+
+async def replay(engine, conversations, server):
+    latencies, calls, prompt_tokens, completion_tokens = [], [], [], []
+    for chat_id, messages in conversations:
+        context = []
+        for message in messages:
+            before = (len(server.requests), server.prompt_tokens, server.completion_tokens)
+            start = time.perf_counter()
+            result = await engine.generate(message, ITEM_INFO, list(context),
+                                           chat_id=f"{engine.name}_{chat_id}", item_id=ITEM_INFO["itemId"])
+            latencies.append((time.perf_counter() - start) * 1000)
+            calls.append(len(server.requests) - before[0])
+            prompt_tokens.append(server.prompt_tokens - before[1])
+            completion_tokens.append(server.completion_tokens - before[2])
+            context += [{"role": "user", "content": message}, {"role": "assistant", "content": result.reply}]
+    latencies.sort()
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(round(p * (len(latencies) - 1))))]
+
+    return {
+        "turns": len(latencies),
+        "p50": statistics.median(latencies),
+        "p95": pct(0.95),
+        "p99": pct(0.99),
+        "calls": statistics.mean(calls),
+        "prompt_tokens": statistics.mean(prompt_tokens),
+        "completion_tokens": statistics.mean(completion_tokens),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回复引擎 A/B 回放基准")
+    parser.add_argument("--chats", type=int, default=10, help="回放的会话数上限")
+    parser.add_argument("--turns-per-chat", type=int, default=4)
+    parser.add_argument("--scale", type=float, default=0.2, help="模拟延迟的缩放系数")
+    parser.add_argument("--engines", default="bot,graph")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    conversations = load_conversations(args.turns_per_chat)[:args.chats]
+
+    # 引擎会写意图标签、搜索决策等日志，回放在临时目录中进行，不污染真实数据
+    prompts = get_prompt_registry()
+    workdir = tempfile.mkdtemp()
+    config["llm_usage"] = {"db_path": os.path.join(workdir, "usage.db")}
+    config["search_cache"] = dict(config.get("search_cache") or {}, db_path=os.path.join(workdir, "search.db"))
+    configure_usage_recorder(config)
+    reply = make_reply(prompts.static("router"), prompts.text("classify")[:30])
+
+    with MockLLMServer(latency=make_latency(reply, args.scale), reply=reply) as server:
+        os.environ["API_KEY"] = "test"
+        os.environ["MODEL_BASE_URL"] = server.base_url
+        from XianyuAgent import XianyuReplyBot
+        from XianyuGraph import XianyuGraphBuilder
+
+        engines = {
+            "bot": lambda: BotEngine(XianyuReplyBot(config, prompts)),
+            "graph": lambda: GraphEngine(XianyuGraphBuilder(config).compile(
+                SqliteCheckpointSaver(os.path.join(workdir, "graph.db")))),
+        }
+        # 引擎在仓库目录下构建（读取意图规则等配置），回放时再切到临时目录
+        selected = {name: engines[name]() for name in args.engines.split(",")}
+        results = {}
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            for name, engine in selected.items():
+                results[name] = asyncio.run(replay(engine, conversations, server))
+        finally:
+            os.chdir(cwd)
+
+    print(f"{len(conversations)} 个会话，模拟延迟缩放 {args.scale}")
+    print(f"{'engine':<8}{'turns':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'calls/turn':>12}{'prompt tok':>12}{'compl tok':>11}")
+    for name, r in results.items():
+        print(f"{name:<8}{r['turns']:>7}{r['p50']:>9.0f}{r['p95']:>9.0f}{r['p99']:>9.0f}"
+              f"{r['calls']:>12.2f}{r['prompt_tokens']:>12.0f}{r['completion_tokens']:>11.0f}")
+    print("(延迟单位 ms，token 为每轮平均值)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from loguru import logger
+
+from utils.deadline import DeadlineExceeded, deadline_in, remaining_or
+
+DEFAULT_WAIT_SECS = 10.0
+
+
+class ClassifyBatcher:
+    """
+    意图分类请求的微批处理器
+
+    多个会话同时需要大模型分类时，在一个很短的时间窗内收集请求，合并成一次大模型调用，
+    由模型返回按顺序排列的标签列表，再分发给各自等待的会话。
+    单条请求不会因为批处理而多等超过一个时间窗。
+
+    批次在收集线程之外执行，因此每条请求提交时保存调用方的 contextvars 上下文：
+    批次在剩余时限最短的请求的上下文中执行，各请求的上下文（会话/商品ID）一并交给分类函数。
+    """
+
+    def __init__(
+        self,
+        classify_batch: Callable[[List[str], List[contextvars.Context]], List[Optional[str]]],
+        window_ms: float = 15,
+        max_batch: int = 16,
+        max_inflight: int = 4,
+    ):
+        """
+        Args:
+            classify_batch: 批量分类函数，输入消息列表与各自提交时的上下文，返回等长的标签列表（无法识别的位置为None）
+            window_ms: 收集请求的时间窗
+            max_batch: 单批最多的消息数
+            max_inflight: 同时在途的批次数
+        """
+        self._classify_batch = classify_batch
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue: "queue.Queue" = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="classify-batch")
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self._thread = threading.Thread(target=self._collect_loop, name="classify-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, user_msg: str) -> Future:
+        future: Future = Future()
+        self._queue.put((user_msg, future, contextvars.copy_context()))
+        return future
+
+    def classify(self, user_msg: str, timeout: Optional[float] = None) -> Optional[str]:
+        """提交一条消息并等待其标签；未指定 timeout 时最多等到回复时限的剩余时间"""
+        if timeout is None:
+            timeout = remaining_or(DEFAULT_WAIT_SECS)
+        return self.submit(user_msg).result(timeout)
+
+    def _collect_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # 批次交给线程池执行，收集线程立即开始下一个时间窗
+            self._executor.submit(self._flush, batch)
+
+    @staticmethod
+    def _remaining(ctx: contextvars.Context) -> float:
+        deadline = deadline_in(ctx)
+        return float("inf") if deadline is None else deadline.remaining()
+
+    def _flush(self, batch):
+        # 已超出回复时限的请求不再参与批次
+        for _, future, ctx in batch:
+            if self._remaining(ctx) <= 0:
+                future.set_exception(DeadlineExceeded("classify"))
+        batch = [entry for entry in batch if not entry[1].done()]
+        if not batch:
+            return
+        with self._lock:
+            self.requests += len(batch)
+            self.batches += 1
+        messages = [msg for msg, _, _ in batch]
+        contexts = [ctx for _, _, ctx in batch]
+        # 在时限最紧的请求的上下文中调用，大模型超时不超过任何一条请求的剩余时间
+        lead = min(contexts, key=self._remaining)
+        try:
+            labels = lead.run(self._classify_batch, messages, contexts)
+        except Exception as e:
+            logger.error(f"批量意图分类失败: {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        if len(labels) != len(batch):
+            labels = [None] * len(batch)
+        for (_, future, _), label in zip(batch, labels):
+            future.set_result(label)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "batches": self.batches,
+                "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            }
@@ -0,0 +1,115 @@
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 对话摘要以 system 消息的形式放在上下文最前面，用此前缀识别
+SUMMARY_PREFIX = "[对话摘要]"
+
+_CJK_RE = re.compile(r'[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]')
+_PRICE_RE = re.compile(r'(\d+\.?\d*)\s*(?:块|元)')
+
+DEFAULT_AGENT_BUDGETS = {
+    'classify': 300,
+    'price': 800,
+    'tech': 1000,
+    'default': 800,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算token数
+
+    中文及全角字符约1字1个token，其余字符约4个字符1个token。
+    只用于预算控制，不追求与具体分词器完全一致。
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _compact(content: str, limit: int) -> str:
+    content = " ".join(content.split())
+    return content if len(content) <= limit else content[:limit] + "…"
+
+
+def fold_summary(summary: str, messages: Sequence[Tuple[str, str]], max_tokens: int = 200) -> str:
+    """
+    将新移出窗口的消息增量合并进已有摘要
+
+    摘要首行记录双方出现过的报价，其余每行是一条消息的压缩版本；
+    超出预算时从最早的消息行开始丢弃，报价行始终保留。
+
+    Args:
+        summary: 已有摘要
+        messages: 新增的 (role, content) 序列，按时间顺序
+        max_tokens: 摘要的token上限
+    """
+    lines = summary.splitlines() if summary else []
+    offers = []
+    if lines and lines[0].startswith("报价记录:"):
+        offers = [o for o in lines[0][len("报价记录:"):].strip().split("，") if o]
+        lines = lines[1:]
+
+    for role, content in messages:
+        speaker = "买家" if role == "user" else "卖家"
+        offers.extend(f"{speaker}{m.group(1)}" for m in _PRICE_RE.finditer(content))
+        lines.append(f"{speaker}: {_compact(content, 40)}")
+
+    header = [f"报价记录: {'，'.join(offers[-6:])}"] if offers else []
+    if estimate_tokens(header[0] if header else "") > max_tokens:
+        header = []
+    while lines and estimate_tokens("\n".join(header + lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(header + lines)
+
+
+class ContextBudget:
+    """
+    按token预算组装对话历史
+
+    摘要优先保留，然后从最新的消息开始向前填充，直到用完对应Agent的预算。
+    """
+
+    def __init__(self, agent_budgets: Optional[Dict[str, int]] = None, default_budget: int = 800):
+        self.agent_budgets = dict(DEFAULT_AGENT_BUDGETS)
+        self.agent_budgets.update(agent_budgets or {})
+        self.default_budget = default_budget
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "ContextBudget":
+        section = config.get("context_budget") or {}
+        return cls(section.get("agent_budgets"), section.get("default_budget", 800))
+
+    def budget_for(self, agent_name: Optional[str]) -> int:
+        return self.agent_budgets.get(agent_name, self.default_budget)
+
+    def select(self, context: List[Dict], agent_name: Optional[str] = None) -> Tuple[str, List[Dict]]:
+        """
+        在预算内挑选摘要与最近的消息
+
+        Returns:
+            tuple: (摘要文本, 按时间顺序排列的 user/assistant 消息)
+        """
+        remaining = self.budget_for(agent_name)
+        summary = ""
+        for msg in context:
+            if msg.get('role') == 'system' and msg.get('content', '').startswith(SUMMARY_PREFIX):
+                summary = msg['content'][len(SUMMARY_PREFIX):].strip()
+                break
+        if summary:
+            # 摘要最多占一半预算，避免挤掉最近的原文
+            summary = fold_summary(summary, [], max_tokens=remaining // 2)
+            remaining -= estimate_tokens(summary)
+
+        recent = []
+        for msg in reversed(context):
+            if msg.get('role') not in ('user', 'assistant'):
+                continue
+            cost = estimate_tokens(msg['content']) + 2
+            if cost > remaining:
+                break
+            recent.append(msg)
+            remaining -= cost
+        recent.reverse()
+        return summary, recent
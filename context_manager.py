@@ -1,9 +1,21 @@
-import aiosqlite as sqlite3
 import os
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional
 from loguru import logger
 
+from context_budget import SUMMARY_PREFIX, fold_summary
+from utils.sqlite_pool import SqlitePool
+from web_search import DEFAULT_TTL_SECS, normalize_query
+
+
+class TurnContext(NamedTuple):
+    """回复一条消息所需的会话数据，在同一个读事务中读取"""
+    item_info: Optional[Dict]
+    last_item_id: Optional[str]
+    messages: List[Dict]
+    bargain_count: int
+
 
 class ChatContextManager:
     """
@@ -13,18 +25,35 @@ class ChatContextManager:
     支持按会话ID检索对话历史，以及议价次数统计。
     """
 
-    def __init__(self, max_history=100, db_path="data/chat_history.db"):
+    def __init__(self, max_history=100, db_path="data/chat_history.db", recent_turns=6,
+                 summary_max_tokens=200, summarizer=None, pool=None, write_behind=None, trim_margin=20,
+                 history_cache=None):
         """
         初始化聊天上下文管理器
 
         Args:
-            max_history: 每个对话保留的最大消息数
+            max_history: 每个对话保留的最大消息数（两次裁剪之间最多超出 trim_margin - 1 条）
             db_path: SQLite数据库文件路径
+            recent_turns: 上下文中原样保留的最近对话轮数，更早的消息合并进滚动摘要
+            summary_max_tokens: 滚动摘要的token上限
+            summarizer: 摘要合并函数 (summary, [(role, content)], max_tokens) -> summary
+            pool: 数据库连接池，默认按 db_path 新建
+            write_behind: 写后合并队列（WriteBehindQueue），为 None 时每次写入单独提交
+            trim_margin: 会话消息数超出 max_history 达到该数量时，裁剪掉超出 max_history 的旧消息
+            history_cache: 活跃会话的内存历史缓存（ChatHistoryCache），为 None 时每次从数据库读取
         """
         self.max_history = max_history
         self.db_path = db_path
-        # 在异步环境中，我们不在__init__中直接连接数据库，
-        # 而是在需要时异步连接，或者创建一个异步的初始化方法。
+        self.recent_turns = recent_turns
+        self.summary_max_tokens = summary_max_tokens
+        self.summarizer = summarizer or fold_summary
+        # 连接在首次查询时打开并常驻，所有方法共用一个写连接和少量读连接
+        self.pool = pool or SqlitePool(db_path)
+        # 消息、议价次数、最后商品的写入排队合并提交；读取同一会话前先写完该会话排队中的写入
+        self.writes = write_behind
+        self.trim_margin = max(1, trim_margin)
+        # 命中缓存的会话读取上下文不访问数据库；所有写入同时更新缓存
+        self.history = history_cache
 
     async def _init_db(self):
         """初始化数据库表结构"""
@@ -32,7 +61,7 @@ class ChatContextManager:
         if db_dir and not os.path.exists(db_dir):
             os.makedirs(db_dir)
 
-        async with sqlite3.connect(self.db_path) as conn:
+        async with self.pool.writer() as conn:
             cursor = await conn.cursor()
 
             # 创建消息表
@@ -57,6 +86,19 @@ class ChatContextManager:
                 await cursor.execute("ALTER TABLE messages ADD COLUMN chat_id TEXT")
                 logger.info("已为messages表添加chat_id字段")
 
+            # 会话内的消息序号，按 (chat_id, seq) 排序和裁剪，不再依赖时间字符串排序
+            if "seq" not in columns:
+                await cursor.execute("ALTER TABLE messages ADD COLUMN seq INTEGER")
+                await cursor.execute(
+                    """
+                UPDATE messages SET seq = (
+                    SELECT COUNT(*) FROM messages AS m
+                    WHERE m.chat_id = messages.chat_id AND m.id <= messages.id
+                )
+                """
+                )
+                logger.info("已为messages表添加seq字段")
+
             # 创建索引以加速查询
             await cursor.execute(
                 """
@@ -64,9 +106,18 @@ class ChatContextManager:
             """
             )
 
+            # (chat_id, seq) 覆盖了原来的 chat_id 单列索引，用于取会话最大序号和裁剪
+            await cursor.execute("DROP INDEX IF EXISTS idx_chat_id")
+            await cursor.execute(
+                """
+            CREATE INDEX IF NOT EXISTS idx_chat_seq ON messages (chat_id, seq)
+            """
+            )
+
+            # 读取某会话某商品最近 N 条消息
             await cursor.execute(
                 """
-            CREATE INDEX IF NOT EXISTS idx_chat_id ON messages (chat_id)
+            CREATE INDEX IF NOT EXISTS idx_chat_item_seq ON messages (chat_id, item_id, seq)
             """
             )
 
@@ -113,6 +164,20 @@ class ChatContextManager:
             """
             )
 
+            # 创建滚动对话摘要表，last_message_id 之前的消息已合并进摘要
+            await cursor.execute(
+                """
+            CREATE TABLE IF NOT EXISTS conversation_summaries (
+                chat_id TEXT NOT NULL,
+                item_id TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                last_message_id INTEGER NOT NULL DEFAULT 0,
+                last_updated DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (chat_id, item_id)
+            )
+            """
+            )
+
             # 创建网络搜索缓存表
             await cursor.execute(
                 """
@@ -124,9 +189,51 @@ class ChatContextManager:
             """
             )
 
+            await cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_search_cache_updated ON search_cache (last_updated)"
+            )
+
             await conn.commit()
             logger.info(f"聊天历史数据库初始化完成: {self.db_path}")
 
+    async def close(self):
+        """写完排队中的写入并关闭常驻的数据库连接"""
+        if self.writes is not None:
+            await self.writes.close()
+        await self.pool.close()
+
+    async def flush(self):
+        """立即提交所有排队中的写入"""
+        if self.writes is not None:
+            await self.writes.flush()
+
+    async def _sync(self, chat_id):
+        """读取会话数据前，确保该会话排队中的写入已经提交"""
+        if self.writes is not None and self.writes.pending(chat_id):
+            await self.writes.flush()
+
+    async def _write(self, statements, label, chat_id):
+        """执行一组写语句：有写队列时排队合并提交，否则立即单独提交"""
+        if self.writes is not None:
+            future = self.writes.submit(statements, label, chat_id)
+            # 写入失败时缓存中已有的改动与数据库不一致，丢弃该会话的缓存
+            future.add_done_callback(lambda f: f.cancelled() or f.result() or self._forget(chat_id))
+            return
+        async with self.pool.writer() as conn:
+            cursor = await conn.cursor()
+            try:
+                for sql, params in statements:
+                    await cursor.execute(sql, params)
+                await conn.commit()
+            except Exception as e:
+                logger.error(f"{label}时出错: {e}")
+                await conn.rollback()
+                self._forget(chat_id)
+
+    def _forget(self, chat_id):
+        if self.history is not None:
+            self.history.invalidate(chat_id)
+
     async def save_item_info(self, item_id, item_data):
         """
         保存商品信息到数据库
@@ -135,7 +242,7 @@ class ChatContextManager:
             item_id: 商品ID
             item_data: 商品信息字典
         """
-        async with sqlite3.connect(self.db_path) as conn:
+        async with self.pool.writer() as conn:
             cursor = await conn.cursor()
 
             try:
@@ -182,7 +289,7 @@ class ChatContextManager:
         Returns:
             dict: 商品信息字典，如果不存在返回None
         """
-        async with sqlite3.connect(self.db_path) as conn:
+        async with self.pool.reader() as conn:
             cursor = await conn.cursor()
 
             try:
@@ -207,111 +314,246 @@ class ChatContextManager:
             role: 消息角色 (user/assistant)
             content: 消息内容
         """
-        async with sqlite3.connect(self.db_path) as conn:
-            cursor = await conn.cursor()
+        max_seq = "(SELECT MAX(seq) FROM messages WHERE chat_id = ?)"
+        min_seq = "(SELECT MIN(seq) FROM messages WHERE chat_id = ?)"
+        statements = [
+            # 插入新消息，序号为该会话当前最大序号 + 1（idx_chat_seq 上的一次查找，无排序）
+            (
+                f"""
+                INSERT INTO messages (user_id, item_id, role, content, timestamp, chat_id, seq)
+                VALUES (?, ?, ?, ?, ?, ?, COALESCE({max_seq}, 0) + 1)
+                """,
+                (user_id, item_id, role, content, datetime.now().isoformat(), chat_id, chat_id),
+            ),
+            # 分摊裁剪：会话消息数（序号连续，即最大与最小序号之差加一）达到 max_history + trim_margin
+            # 才删除超出 max_history 的旧消息，其余时候条件在扫描前即为假，只多两次索引查找。
+            # 按消息数而不是按序号判断，写队列把同一会话的多条插入排在删除之前执行时也不会漏掉裁剪
+            (
+                f"""
+                DELETE FROM messages
+                WHERE chat_id = ? AND {max_seq} - {min_seq} + 1 >= ? AND seq <= {max_seq} - ?
+                """,
+                (chat_id, chat_id, chat_id, self.max_history + self.trim_margin, chat_id, self.max_history),
+            ),
+        ]
+
+        if self.history is not None:
+            self.history.append(chat_id, item_id, role, content)
+        await self._write(statements, "添加消息到数据库", chat_id)
 
-            try:
-                # 插入新消息，使用chat_id作为额外标识
-                await cursor.execute(
-                    "INSERT INTO messages (user_id, item_id, role, content, timestamp, chat_id) VALUES (?, ?, ?, ?, ?, ?)",
-                    (user_id, item_id, role, content, datetime.now().isoformat(), chat_id),
-                )
+    async def get_context_for_item(self, chat_id, item_id):
+        """
+        基于会话ID获取对话历史
 
-                # 检查是否需要清理旧消息（基于chat_id）
-                await cursor.execute(
-                    """
-                    SELECT id FROM messages 
-                    WHERE chat_id = ? 
-                    ORDER BY timestamp DESC 
-                    LIMIT ?, 1
-                    """,
-                    (chat_id, self.max_history),
-                )
+        只返回最近 recent_turns 轮原文，更早的内容以滚动摘要的形式放在最前面，
+        因此上下文大小不随对话长度增长。议价次数以系统消息附在末尾；
+        回复流程使用 load_turn_context，议价次数单独返回。
 
-                oldest_to_keep = await cursor.fetchone()
-                if oldest_to_keep:
-                    await cursor.execute(
-                        "DELETE FROM messages WHERE chat_id = ? AND id < ?",
-                        (chat_id, oldest_to_keep[0]),
-                    )
+        Args:
+            chat_id: 会话ID
 
-                await conn.commit()
-            except Exception as e:
-                logger.error(f"添加消息到数据库时出错: {e}")
-                await conn.rollback()
+        Returns:
+            list: 包含对话历史的列表
+        """
+        turn = await self._turn_context(chat_id, item_id, with_item_info=False)
+        messages = turn.messages
+        # 议价次数作为系统消息添加到上下文中
+        if turn.bargain_count > 0:
+            messages.append(
+                {"role": "system", "content": f"关于此商品的议价次数: {turn.bargain_count}"}
+            )
+        return messages
 
-    async def get_context_for_item(self, chat_id, item_id):
+    async def load_turn_context(self, chat_id, item_id) -> TurnContext:
         """
-        基于会话ID获取对话历史
+        一次读取回复一条消息所需的全部数据
+
+        会话在历史缓存中时直接由内存返回，不读数据库；否则商品信息、会话最后交互的商品、
+        最近对话（含滚动摘要）与议价次数在同一个读事务中查询，看到的是同一时刻的快照，并放入缓存。
+        议价次数单独返回，不再作为系统消息混入对话历史。
 
         Args:
             chat_id: 会话ID
+            item_id: 商品ID
 
         Returns:
-            list: 包含对话历史的列表
+            TurnContext: 商品不在数据库中、或由缓存返回时 item_info 为 None（由调用方经 ItemStore 获取）
         """
-        async with sqlite3.connect(self.db_path) as conn:
-            cursor = await conn.cursor()
+        return await self._turn_context(chat_id, item_id, with_item_info=True)
+
+    async def _turn_context(self, chat_id, item_id, with_item_info):
+        if self.history is not None:
+            cached = self.history.get(chat_id, item_id)
+            if cached is not None:
+                chat, item = cached
+                return TurnContext(None, chat.last_item_id, self._format_history(item.summary, item.messages),
+                                   item.bargain_count)
+
+        await self._sync(chat_id)
+        token = self.history.begin_load(chat_id) if self.history is not None else None
+        try:
+            async with self.pool.reader() as conn:
+                cursor = await conn.cursor()
+                await cursor.execute("BEGIN")
+                item_info = None
+                if with_item_info:
+                    await cursor.execute("SELECT data FROM items WHERE item_id = ?", (item_id,))
+                    row = await cursor.fetchone()
+                    item_info = json.loads(row[0]) if row else None
+
+                await cursor.execute(
+                    "SELECT last_item_id FROM chat_session_state WHERE chat_id = ?", (chat_id,)
+                )
+                row = await cursor.fetchone()
+                last_item_id = row[0] if row else None
 
-            try:
-                # 注意：这里的查询逻辑可能需要根据实际需求调整
-                # 例如，是否只看当前商品的对话，还是包含一些通用对话
                 await cursor.execute(
                     """
                     SELECT role, content FROM messages 
                     WHERE chat_id = ? AND item_id = ?
-                    ORDER BY timestamp ASC
+                    ORDER BY seq DESC
                     LIMIT ?
                     """,
-                    (chat_id, item_id, self.max_history),
+                    (chat_id, item_id, self._recent_message_limit()),
                 )
+                rows = list(reversed(await cursor.fetchall()))
 
-                messages = [
-                    {"role": role, "content": content}
-                    for role, content in await cursor.fetchall()
-                ]
+                await cursor.execute(
+                    "SELECT summary, last_message_id FROM conversation_summaries WHERE chat_id = ? AND item_id = ?",
+                    (chat_id, item_id),
+                )
+                summary, last_message_id = await cursor.fetchone() or ("", 0)
+                bargain_count = await self._read_bargain_count(cursor, chat_id, item_id)
 
-                # 获取特定商品的议价次数并添加到上下文中
-                bargain_count = await self.get_bargain_count_for_item(chat_id, item_id)
-                if bargain_count > 0:
-                    messages.append(
-                        {"role": "system", "content": f"关于此商品的议价次数: {bargain_count}"}
+                unsummarized = 0
+                if token is not None:
+                    # 缓存据此判断何时需要更新摘要
+                    await cursor.execute(
+                        "SELECT COUNT(*) FROM messages WHERE chat_id = ? AND item_id = ? AND id > ?",
+                        (chat_id, item_id, last_message_id),
                     )
+                    unsummarized = (await cursor.fetchone())[0]
+                await conn.commit()
+        except Exception as e:
+            logger.error(f"加载会话上下文时出错: {e}")
+            return TurnContext(None, None, [], 0)
+        finally:
+            if token is not None:
+                self.history.cancel_load(chat_id, token)
+
+        # 该会话仍有排队或正在提交的写入时，读到的可能是提交前的快照，只用于本轮，不放入缓存
+        if token is not None and not (self.writes is not None and self.writes.pending(chat_id)):
+            self.history.finish_load(chat_id, token, item_id, last_item_id, rows, summary, bargain_count,
+                                     unsummarized, self._recent_message_limit())
+        return TurnContext(item_info, last_item_id, self._format_history(summary, rows), bargain_count)
+
+    @staticmethod
+    def _format_history(summary, rows):
+        """最近的原文消息，有滚动摘要时放在最前面"""
+        messages = [{"role": "system", "content": f"{SUMMARY_PREFIX} {summary}"}] if summary else []
+        messages.extend({"role": role, "content": content} for role, content in rows)
+        return messages
 
-            except Exception as e:
-                logger.error(f"获取对话历史时出错: {e}")
-                messages = []
+    @staticmethod
+    async def _read_bargain_count(cursor, chat_id, item_id):
+        await cursor.execute(
+            "SELECT count FROM chat_item_bargain_counts WHERE chat_id = ? AND item_id = ?", (chat_id, item_id)
+        )
+        row = await cursor.fetchone()
+        return row[0] if row else 0
 
-        return messages
+    def _recent_message_limit(self):
+        if self.recent_turns:
+            return min(self.recent_turns * 2, self.max_history)
+        return self.max_history
 
-    async def increment_bargain_count_for_item(self, chat_id, item_id):
+    async def update_summary(self, chat_id, item_id):
         """
-        基于会话ID增加议价次数
+        将移出最近窗口的消息增量合并进滚动摘要
+
+        每次只读取上次摘要之后新增的消息，开销与对话总长度无关。
 
         Args:
             chat_id: 会话ID
+            item_id: 商品ID
         """
-        async with sqlite3.connect(self.db_path) as conn:
+        if not self.recent_turns:
+            return
+        cached = self.history.peek(chat_id, item_id) if self.history is not None else None
+        if cached is not None and cached.unsummarized <= self._recent_message_limit():
+            # 缓存确知没有消息移出最近窗口，无需读取数据库
+            return
+        await self._sync(chat_id)
+        async with self.pool.writer() as conn:
             cursor = await conn.cursor()
 
             try:
-                # 使用UPSERT语法直接基于(chat_id, item_id)增加议价次数
+                await cursor.execute(
+                    "SELECT summary, last_message_id FROM conversation_summaries WHERE chat_id = ? AND item_id = ?",
+                    (chat_id, item_id),
+                )
+                row = await cursor.fetchone()
+                summary, last_message_id = row if row else ("", 0)
+
                 await cursor.execute(
                     """
-                    INSERT INTO chat_item_bargain_counts (chat_id, item_id, count, last_updated)
-                    VALUES (?, ?, 1, ?)
-                    ON CONFLICT(chat_id, item_id) 
-                    DO UPDATE SET count = count + 1, last_updated = ?
+                    SELECT id, role, content FROM messages
+                    WHERE chat_id = ? AND item_id = ? AND id > ?
+                    ORDER BY seq ASC
                     """,
-                    (chat_id, item_id, datetime.now().isoformat(), datetime.now().isoformat()),
+                    (chat_id, item_id, last_message_id),
+                )
+                pending = await cursor.fetchall()
+                overflow = pending[:-self._recent_message_limit()] if len(pending) > self._recent_message_limit() else []
+                if not overflow:
+                    if self.history is not None:
+                        self.history.set_summary(chat_id, item_id, summary, len(pending))
+                    return
+
+                summary = self.summarizer(
+                    summary,
+                    [(role, content) for _, role, content in overflow if role in ("user", "assistant")],
+                    self.summary_max_tokens,
+                )
+                await cursor.execute(
+                    """
+                    INSERT INTO conversation_summaries (chat_id, item_id, summary, last_message_id, last_updated)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(chat_id, item_id)
+                    DO UPDATE SET summary = excluded.summary, last_message_id = excluded.last_message_id,
+                                  last_updated = excluded.last_updated
+                    """,
+                    (chat_id, item_id, summary, overflow[-1][0], datetime.now().isoformat()),
                 )
-
                 await conn.commit()
-                logger.debug(f"会话 {chat_id} 对商品 {item_id} 的议价次数已增加")
+                if self.history is not None:
+                    self.history.set_summary(chat_id, item_id, summary, len(pending) - len(overflow))
             except Exception as e:
-                logger.error(f"增加议价次数时出错: {e}")
+                logger.error(f"更新对话摘要时出错: {e}")
                 await conn.rollback()
 
+    async def increment_bargain_count_for_item(self, chat_id, item_id):
+        """
+        基于会话ID增加议价次数
+
+        Args:
+            chat_id: 会话ID
+        """
+        timestamp = datetime.now().isoformat()
+        if self.history is not None:
+            self.history.add_bargain(chat_id, item_id)
+        # 使用UPSERT语法直接基于(chat_id, item_id)增加议价次数
+        await self._write([(
+            """
+            INSERT INTO chat_item_bargain_counts (chat_id, item_id, count, last_updated)
+            VALUES (?, ?, 1, ?)
+            ON CONFLICT(chat_id, item_id) 
+            DO UPDATE SET count = count + 1, last_updated = ?
+            """,
+            (chat_id, item_id, timestamp, timestamp),
+        )], "增加议价次数", chat_id)
+        logger.debug(f"会话 {chat_id} 对商品 {item_id} 的议价次数已增加")
+
     async def get_bargain_count_for_item(self, chat_id, item_id):
         """
         基于会话ID获取议价次数
@@ -322,7 +564,11 @@ class ChatContextManager:
         Returns:
             int: 议价次数
         """
-        async with sqlite3.connect(self.db_path) as conn:
+        cached = self.history.peek(chat_id, item_id) if self.history is not None else None
+        if cached is not None:
+            return cached.bargain_count
+        await self._sync(chat_id)
+        async with self.pool.reader() as conn:
             cursor = await conn.cursor()
 
             try:
@@ -346,7 +592,11 @@ class ChatContextManager:
         Returns:
             str: 商品ID，如果不存在则返回None
         """
-        async with sqlite3.connect(self.db_path) as conn:
+        cached = self.history.peek_chat(chat_id) if self.history is not None else None
+        if cached is not None:
+            return cached.last_item_id
+        await self._sync(chat_id)
+        async with self.pool.reader() as conn:
             cursor = await conn.cursor()
             try:
                 await cursor.execute(
@@ -366,35 +616,39 @@ class ChatContextManager:
             chat_id: 会话ID
             item_id: 新的商品ID
         """
-        async with sqlite3.connect(self.db_path) as conn:
-            try:
-                await conn.execute(
-                    """
-                    INSERT INTO chat_session_state (chat_id, last_item_id, last_updated)
-                    VALUES (?, ?, ?)
-                    ON CONFLICT(chat_id) 
-                    DO UPDATE SET last_item_id = ?, last_updated = ?
-                    """,
-                    (chat_id, item_id, datetime.now().isoformat(), item_id, datetime.now().isoformat()),
-                )
-                await conn.commit()
-            except Exception as e:
-                logger.error(f"更新最后商品ID时出错: {e}")
-                await conn.rollback()
-
-    async def get_search_cache(self, query):
-        """获取网络搜索缓存"""
-        async with sqlite3.connect(self.db_path) as conn:
+        timestamp = datetime.now().isoformat()
+        if self.history is not None:
+            self.history.set_last_item(chat_id, item_id)
+        await self._write([(
+            """
+            INSERT INTO chat_session_state (chat_id, last_item_id, last_updated)
+            VALUES (?, ?, ?)
+            ON CONFLICT(chat_id) 
+            DO UPDATE SET last_item_id = ?, last_updated = ?
+            """,
+            (chat_id, item_id, timestamp, item_id, timestamp),
+        )], "更新最后商品ID", chat_id)
+
+    async def get_search_cache(self, query, ttl_secs=DEFAULT_TTL_SECS):
+        """获取未过期的网络搜索缓存，键与 web_search.SearchCache 一致"""
+        cutoff = (datetime.now() - timedelta(seconds=ttl_secs)).isoformat()
+        async with self.pool.reader() as conn:
             cursor = await conn.cursor()
-            await cursor.execute("SELECT results FROM search_cache WHERE query = ?", (query,))
+            await cursor.execute(
+                "SELECT results FROM search_cache WHERE query = ? AND last_updated >= ?",
+                (normalize_query(query), cutoff),
+            )
             result = await cursor.fetchone()
             return result[0] if result else None
 
     async def save_search_cache(self, query, results):
-        """保存网络搜索缓存"""
-        async with sqlite3.connect(self.db_path) as conn:
+        """保存网络搜索缓存，已存在的查询直接覆盖"""
+        async with self.pool.writer() as conn:
             await conn.execute(
-                "INSERT INTO search_cache (query, results, last_updated) VALUES (?, ?, ?)",
-                (query, results, datetime.now().isoformat()),
+                """
+                INSERT INTO search_cache (query, results, last_updated) VALUES (?, ?, ?)
+                ON CONFLICT(query) DO UPDATE SET results = excluded.results, last_updated = excluded.last_updated
+                """,
+                (normalize_query(query), results, datetime.now().isoformat()),
             )
             await conn.commit()
@@ -0,0 +1,381 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langgraph.checkpoint.base import BaseCheckpointSaver, CheckpointTuple
+from loguru import logger
+
+try:
+    from langgraph.checkpoint.base import WRITES_IDX_MAP
+except ImportError:  # 旧版本没有特殊写入通道的固定序号
+    WRITES_IDX_MAP = {}
+
+DEFAULT_DB_PATH = "data/chat_history.db"
+DEFAULT_KEEP_LAST = 10
+DEFAULT_MAX_AGE_DAYS = 30
+
+
+def _pack(typed: Tuple[str, bytes]) -> Tuple[str, bytes]:
+    type_, data = typed
+    return type_, zlib.compress(data)
+
+
+def _unpack(type_: str, blob: bytes) -> Tuple[str, bytes]:
+    return type_, zlib.decompress(blob)
+
+
+class SqliteCheckpointSaver(BaseCheckpointSaver):
+    """
+    基于 chat_history.db 的 LangGraph 检查点存储
+
+    每个会话（chat_id）是一个 thread。检查点本身不含通道值，通道值按 (通道, 版本) 单独存放，
+    未变化的通道（商品描述等）不会在每一步重复序列化；所有数据经 zlib 压缩后写入。
+    每个会话只保留最近 keep_last 个检查点，超过 max_age_days 未活动的会话整体清除。
+    """
+
+    def __init__(
+        self,
+        db_path: str = DEFAULT_DB_PATH,
+        keep_last: int = DEFAULT_KEEP_LAST,
+        max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+        serde=None,
+    ):
+        super().__init__(serde=serde)
+        self.db_path = db_path
+        self.keep_last = max(1, keep_last)
+        self.max_age_days = max_age_days
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._init_db()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "SqliteCheckpointSaver":
+        section = ((config or {}).get("graph") or {}).get("checkpointer") or {}
+        return cls(
+            db_path=section.get("db_path", DEFAULT_DB_PATH),
+            keep_last=section.get("keep_last", DEFAULT_KEEP_LAST),
+            max_age_days=section.get("max_age_days", DEFAULT_MAX_AGE_DAYS),
+        )
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def _init_db(self):
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        with self._connect() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS graph_checkpoints (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    parent_checkpoint_id TEXT,
+                    type TEXT,
+                    checkpoint BLOB NOT NULL,
+                    metadata_type TEXT,
+                    metadata BLOB,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+                );
+                CREATE TABLE IF NOT EXISTS graph_blobs (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    channel TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    blob BLOB,
+                    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+                );
+                CREATE TABLE IF NOT EXISTS graph_writes (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    task_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    channel TEXT NOT NULL,
+                    type TEXT,
+                    blob BLOB,
+                    task_path TEXT NOT NULL DEFAULT '',
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+                );
+                CREATE INDEX IF NOT EXISTS idx_graph_checkpoints_created ON graph_checkpoints (created_at);
+                """
+            )
+
+    # ---- 读取 ----
+
+    def get_tuple(self, config: Dict) -> Optional[CheckpointTuple]:
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        checkpoint_id = configurable.get("checkpoint_id")
+        with self._connect() as conn:
+            if checkpoint_id:
+                row = conn.execute(
+                    """
+                    SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint,
+                           metadata_type, metadata
+                    FROM graph_checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?
+                    """,
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = conn.execute(
+                    """
+                    SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint,
+                           metadata_type, metadata
+                    FROM graph_checkpoints WHERE thread_id = ? AND checkpoint_ns = ?
+                    ORDER BY checkpoint_id DESC LIMIT 1
+                    """,
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            return self._to_tuple(conn, row) if row else None
+
+    def list(
+        self,
+        config: Optional[Dict],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[Dict] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            checkpoint_ns = config["configurable"].get("checkpoint_ns")
+            if checkpoint_ns is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if config["configurable"].get("checkpoint_id"):
+                clauses.append("checkpoint_id = ?")
+                params.append(config["configurable"]["checkpoint_id"])
+        if before:
+            clauses.append("checkpoint_id < ?")
+            params.append(before["configurable"]["checkpoint_id"])
+        query = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+            "metadata_type, metadata FROM graph_checkpoints"
+            + (f" WHERE {' AND '.join(clauses)}" if clauses else "")
+            + " ORDER BY checkpoint_id DESC"
+        )
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+            count = 0
+            for row in rows:
+                result = self._to_tuple(conn, row)
+                if filter and not all(result.metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                yield result
+                count += 1
+                if limit is not None and count >= limit:
+                    break
+
+    def _to_tuple(self, conn, row) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_id, type_, blob, metadata_type, metadata = row
+        checkpoint = self.serde.loads_typed(_unpack(type_, blob))
+        checkpoint["channel_values"] = self._load_blobs(conn, thread_id, checkpoint_ns, checkpoint["channel_versions"])
+        writes = conn.execute(
+            """
+            SELECT task_id, channel, type, blob FROM graph_writes
+            WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?
+            ORDER BY task_id, idx
+            """,
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {
+                "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id,
+            }},
+            checkpoint=checkpoint,
+            metadata=self.serde.loads_typed(_unpack(metadata_type, metadata)) if metadata is not None else {},
+            parent_config={"configurable": {
+                "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id,
+            }} if parent_id else None,
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed(_unpack(w_type, w_blob)))
+                for task_id, channel, w_type, w_blob in writes
+            ],
+        )
+
+    def _load_blobs(self, conn, thread_id: str, checkpoint_ns: str, versions: Dict) -> Dict[str, Any]:
+        if not versions:
+            return {}
+        keys = [(channel, str(version)) for channel, version in versions.items()]
+        rows = conn.execute(
+            f"""
+            SELECT channel, type, blob FROM graph_blobs
+            WHERE thread_id = ? AND checkpoint_ns = ? AND ({' OR '.join(['(channel = ? AND version = ?)'] * len(keys))})
+            """,
+            [thread_id, checkpoint_ns, *[v for key in keys for v in key]],
+        ).fetchall()
+        return {
+            channel: self.serde.loads_typed(_unpack(type_, blob))
+            for channel, type_, blob in rows
+            if type_ != "empty"
+        }
+
+    # ---- 写入 ----
+
+    def put(self, config: Dict, checkpoint: Dict, metadata: Dict, new_versions: Dict) -> Dict:
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        stored = dict(checkpoint)
+        values = stored.pop("channel_values", {}) or {}
+        # 只有本步更新过的通道才需要写入新版本
+        blobs = []
+        for channel, version in new_versions.items():
+            if channel in values:
+                type_, blob = _pack(self.serde.dumps_typed(values[channel]))
+            else:
+                type_, blob = "empty", None
+            blobs.append((thread_id, checkpoint_ns, channel, str(version), type_, blob))
+        type_, blob = _pack(self.serde.dumps_typed(stored))
+        metadata_type, metadata_blob = _pack(self.serde.dumps_typed(dict(metadata or {})))
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO graph_blobs (thread_id, checkpoint_ns, channel, version, type, blob) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                blobs,
+            )
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO graph_checkpoints
+                (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint,
+                 metadata_type, metadata, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (thread_id, checkpoint_ns, checkpoint["id"], configurable.get("checkpoint_id"),
+                 type_, blob, metadata_type, metadata_blob, time.time()),
+            )
+            self._maybe_prune(conn, thread_id, checkpoint_ns)
+        return {"configurable": {
+            "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"],
+        }}
+
+    def put_writes(self, config: Dict, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        configurable = config["configurable"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, blob = _pack(self.serde.dumps_typed(value))
+            rows.append((
+                configurable["thread_id"], configurable.get("checkpoint_ns", ""), configurable["checkpoint_id"],
+                task_id, WRITES_IDX_MAP.get(channel, idx), channel, type_, blob, task_path,
+            ))
+        # 错误、中断等特殊通道的写入覆盖旧值，普通写入只保留第一次
+        verb = "INSERT OR REPLACE" if all(w[0] in WRITES_IDX_MAP for w in writes) else "INSERT OR IGNORE"
+        with self._connect() as conn:
+            conn.executemany(
+                f"{verb} INTO graph_writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, "
+                f"type, blob, task_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._connect() as conn:
+            for table in ("graph_checkpoints", "graph_blobs", "graph_writes"):
+                conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    # ---- 清理 ----
+
+    def _maybe_prune(self, conn, thread_id: str, checkpoint_ns: str):
+        """检查点数超过 keep_last 的两倍才裁剪，裁剪开销按写入次数摊销"""
+        count = conn.execute(
+            "SELECT COUNT(*) FROM graph_checkpoints WHERE thread_id = ? AND checkpoint_ns = ?",
+            (thread_id, checkpoint_ns),
+        ).fetchone()[0]
+        if count > 2 * self.keep_last:
+            self._prune_thread(conn, thread_id, checkpoint_ns)
+        with self._lock:
+            self._puts += 1
+            expire = self._puts % 200 == 1
+        if expire:
+            self._expire_threads(conn)
+
+    def _prune_thread(self, conn, thread_id: str, checkpoint_ns: str):
+        rows = conn.execute(
+            """
+            SELECT checkpoint_id, type, checkpoint FROM graph_checkpoints
+            WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC
+            """,
+            (thread_id, checkpoint_ns),
+        ).fetchall()
+        kept, dropped = rows[:self.keep_last], rows[self.keep_last:]
+        if not dropped:
+            return
+        oldest_kept = kept[-1][0]
+        conn.execute(
+            "DELETE FROM graph_checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+            (thread_id, checkpoint_ns, oldest_kept),
+        )
+        conn.execute(
+            "DELETE FROM graph_writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+            (thread_id, checkpoint_ns, oldest_kept),
+        )
+        # 保留仍被剩余检查点引用的通道版本
+        referenced = set()
+        for _, type_, blob in kept:
+            versions = self.serde.loads_typed(_unpack(type_, blob)).get("channel_versions", {})
+            referenced.update((channel, str(version)) for channel, version in versions.items())
+        stale = [
+            (thread_id, checkpoint_ns, channel, version)
+            for channel, version in conn.execute(
+                "SELECT channel, version FROM graph_blobs WHERE thread_id = ? AND checkpoint_ns = ?",
+                (thread_id, checkpoint_ns),
+            ).fetchall()
+            if (channel, version) not in referenced
+        ]
+        conn.executemany(
+            "DELETE FROM graph_blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+            stale,
+        )
+        logger.debug(f"会话 {thread_id} 清理了 {len(dropped)} 个旧检查点、{len(stale)} 个通道版本")
+
+    def _expire_threads(self, conn):
+        if not self.max_age_days:
+            return
+        cutoff = time.time() - self.max_age_days * 86400
+        threads = [row[0] for row in conn.execute(
+            "SELECT thread_id FROM graph_checkpoints GROUP BY thread_id HAVING MAX(created_at) < ?",
+            (cutoff,),
+        ).fetchall()]
+        for table in ("graph_checkpoints", "graph_blobs", "graph_writes"):
+            conn.executemany(f"DELETE FROM {table} WHERE thread_id = ?", [(t,) for t in threads])
+        if threads:
+            logger.info(f"清除了 {len(threads)} 个超过 {self.max_age_days} 天未活动的会话检查点")
+
+    # ---- 异步接口：图以 ainvoke 运行，sqlite 调用放到线程中执行 ----
+
+    async def aget_tuple(self, config: Dict) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[Dict],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[Dict] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        results: List[CheckpointTuple] = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for result in results:
+            yield result
+
+    async def aput(self, config: Dict, checkpoint: Dict, metadata: Dict, new_versions: Dict) -> Dict:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: Dict, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
@@ -0,0 +1,185 @@
+import sys
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+# 每条消息在元组、deque 槽位上的大致额外开销
+_MESSAGE_OVERHEAD = 72
+_CHAT_OVERHEAD = 512
+
+
+class ItemHistory:
+    """某会话中某商品的最近消息与相关状态"""
+
+    __slots__ = ("messages", "summary", "bargain_count", "unsummarized")
+
+    def __init__(self, messages: Deque[Tuple[str, str]], summary: str, bargain_count: int, unsummarized: int):
+        self.messages = messages
+        self.summary = summary
+        self.bargain_count = bargain_count
+        # 上次摘要之后的消息数，未超出最近窗口时摘要无需更新
+        self.unsummarized = unsummarized
+
+
+class ChatHistory:
+    __slots__ = ("last_item_id", "items", "size")
+
+    def __init__(self, last_item_id: Optional[str]):
+        self.last_item_id = last_item_id
+        self.items: Dict[str, ItemHistory] = {}
+        self.size = _CHAT_OVERHEAD
+
+
+def _message_size(role: str, content: str) -> int:
+    return sys.getsizeof(content) + _MESSAGE_OVERHEAD
+
+
+class ChatHistoryCache:
+    """
+    活跃会话历史的内存缓存
+
+    按会话保存每个商品最近 N 条消息的环形缓冲（(role, content) 元组）、滚动摘要、议价次数和最后交互的商品，
+    整体按最近使用淘汰，占用不超过 max_bytes。缓存只由 ChatContextManager 在从数据库完整读取一次后建立，
+    之后所有写入同时更新缓存（写穿），因此命中时与数据库内容一致，一轮对话不需要读数据库。
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._chats: "OrderedDict[str, ChatHistory]" = OrderedDict()
+        self._bytes = 0
+        # 正在从数据库加载的会话及各次加载的标记；加载期间有写入则放弃安装，避免装入旧快照
+        self._loading: Dict[str, List[list]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional["ChatHistoryCache"]:
+        """读取 history_cache 配置，未启用时返回 None"""
+        section = config.get("history_cache") or {}
+        if not section.get("enabled", True):
+            return None
+        return cls(max_bytes=int(section.get("max_mb", DEFAULT_MAX_BYTES / 1024 / 1024) * 1024 * 1024))
+
+    def get(self, chat_id: str, item_id: str) -> Optional[Tuple[ChatHistory, ItemHistory]]:
+        chat = self._chats.get(chat_id)
+        item = chat.items.get(item_id) if chat is not None else None
+        if item is None:
+            self.misses += 1
+            return None
+        self._chats.move_to_end(chat_id)
+        self.hits += 1
+        return chat, item
+
+    def peek_chat(self, chat_id: str) -> Optional[ChatHistory]:
+        """不计入命中统计的会话级查询（最后交互的商品）"""
+        return self._chats.get(chat_id)
+
+    def peek(self, chat_id: str, item_id: str) -> Optional[ItemHistory]:
+        """不计入命中统计、不改变淘汰顺序的查询"""
+        chat = self._chats.get(chat_id)
+        return chat.items.get(item_id) if chat is not None else None
+
+    def begin_load(self, chat_id: str) -> list:
+        """在读数据库之前调用，返回的标记交给 finish_load"""
+        token = [False]
+        self._loading.setdefault(chat_id, []).append(token)
+        return token
+
+    def cancel_load(self, chat_id: str, token: list):
+        tokens = [t for t in self._loading.get(chat_id, ()) if t is not token]
+        if tokens:
+            self._loading[chat_id] = tokens
+        else:
+            self._loading.pop(chat_id, None)
+
+    def finish_load(self, chat_id: str, token: list, item_id: str, last_item_id: Optional[str], rows,
+                    summary: str, bargain_count: int, unsummarized: int, ring_size: int):
+        """安装从数据库读出的会话数据；加载期间该会话有写入时丢弃"""
+        self.cancel_load(chat_id, token)
+        if token[0]:
+            return
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = ChatHistory(last_item_id)
+            self._bytes += chat.size
+        else:
+            chat.last_item_id = last_item_id
+            self._drop_item(chat, item_id)
+        messages = deque(rows, maxlen=ring_size)
+        chat.items[item_id] = ItemHistory(messages, summary or "", bargain_count, unsummarized)
+        self._grow(chat, sum(_message_size(role, content) for role, content in messages) + sys.getsizeof(summary or ""))
+        self._chats.move_to_end(chat_id)
+        self._evict()
+
+    def _touch_write(self, chat_id: str) -> Optional[ChatHistory]:
+        for token in self._loading.get(chat_id, ()):
+            token[0] = True
+        return self._chats.get(chat_id)
+
+    def append(self, chat_id: str, item_id: str, role: str, content: str):
+        chat = self._touch_write(chat_id)
+        item = chat.items.get(item_id) if chat is not None else None
+        if item is None:
+            return
+        if len(item.messages) == item.messages.maxlen:
+            self._grow(chat, -_message_size(*item.messages[0]))
+        item.messages.append((role, content))
+        item.unsummarized += 1
+        self._grow(chat, _message_size(role, content))
+        self._evict()
+
+    def add_bargain(self, chat_id: str, item_id: str):
+        chat = self._touch_write(chat_id)
+        item = chat.items.get(item_id) if chat is not None else None
+        if item is not None:
+            item.bargain_count += 1
+
+    def set_last_item(self, chat_id: str, item_id: str):
+        chat = self._touch_write(chat_id)
+        if chat is not None:
+            chat.last_item_id = item_id
+
+    def set_summary(self, chat_id: str, item_id: str, summary: str, unsummarized: int):
+        chat = self._touch_write(chat_id)
+        item = chat.items.get(item_id) if chat is not None else None
+        if item is None:
+            return
+        self._grow(chat, sys.getsizeof(summary) - sys.getsizeof(item.summary))
+        item.summary = summary
+        item.unsummarized = unsummarized
+
+    def invalidate(self, chat_id: str):
+        self._touch_write(chat_id)
+        chat = self._chats.pop(chat_id, None)
+        if chat is not None:
+            self._bytes -= chat.size
+
+    def _drop_item(self, chat: ChatHistory, item_id: str):
+        item = chat.items.pop(item_id, None)
+        if item is not None:
+            self._grow(chat, -sum(_message_size(r, c) for r, c in item.messages) - sys.getsizeof(item.summary))
+
+    def _grow(self, chat: ChatHistory, delta: int):
+        chat.size += delta
+        self._bytes += delta
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._chats) > 1:
+            chat_id, chat = self._chats.popitem(last=False)
+            self._bytes -= chat.size
+            self.evictions += 1
+            logger.debug(f"会话历史缓存已满，淘汰会话: {chat_id}")
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "chats": len(self._chats),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,247 @@
+"""
+本地意图分类器
+
+基于字符 n-gram 的多项式朴素贝叶斯模型，纯 Python 实现，单条消息推理在微秒级。
+关键词规则未命中时先由它判断，只有置信度不足时才调用 ClassifyAgent。
+
+训练数据来自 logs/intent_labels.jsonl（线上 ClassifyAgent 的分类结果会自动记录到此），
+也可以用 label 子命令让大模型为 logs/conversations_*.txt 中的历史消息补充标签。
+
+用法:
+    python intent_classifier.py label      # 用大模型为历史对话中未标注的消息打标签
+    python intent_classifier.py train      # 训练并保存模型
+    python intent_classifier.py evaluate   # 留出集上评估与大模型标签的一致率和单条耗时
+"""
+import argparse
+import json
+import math
+import os
+import random
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from intent_matcher import clean_text
+from utils.reporting_utils import iter_logged_conversations, load_intent_labels, log_intent_label
+
+INTENT_LABELS = ("price", "tech", "default")
+DEFAULT_MODEL_PATH = "data/intent_model.json"
+
+
+def normalize_label(label: str) -> Optional[str]:
+    """将大模型输出规整为合法标签，无法识别时返回None"""
+    label = (label or "").strip().strip("`'\"。.").lower()
+    return label if label in INTENT_LABELS else None
+
+
+def char_ngrams(text: str, n_min: int = 1, n_max: int = 3) -> List[str]:
+    """提取清洗后文本的字符 n-gram"""
+    text = clean_text(text)
+    grams = []
+    for n in range(n_min, n_max + 1):
+        grams.extend(text[i:i + n] for i in range(len(text) - n + 1))
+    return grams
+
+
+class NaiveBayesIntentClassifier:
+    """字符 n-gram 多项式朴素贝叶斯分类器"""
+
+    def __init__(self, n_max: int = 3, alpha: float = 1.0):
+        self.n_max = n_max
+        self.alpha = alpha
+        self.labels: List[str] = []
+        self.class_log_prior: Dict[str, float] = {}
+        self.feature_log_prob: Dict[str, Dict[str, float]] = {}
+        self.unseen_log_prob: Dict[str, float] = {}
+
+    def fit(self, samples: Iterable[Tuple[str, str]]) -> "NaiveBayesIntentClassifier":
+        """
+        训练模型
+
+        Args:
+            samples: (消息, 标签) 序列
+        """
+        class_counts = Counter()
+        feature_counts: Dict[str, Counter] = {}
+        vocabulary = set()
+        for text, label in samples:
+            grams = char_ngrams(text, 1, self.n_max)
+            class_counts[label] += 1
+            feature_counts.setdefault(label, Counter()).update(grams)
+            vocabulary.update(grams)
+
+        total = sum(class_counts.values())
+        if not total:
+            raise ValueError("没有可用的训练样本")
+
+        self.labels = sorted(class_counts)
+        vocab_size = len(vocabulary)
+        for label in self.labels:
+            counts = feature_counts[label]
+            denominator = sum(counts.values()) + self.alpha * vocab_size
+            self.class_log_prior[label] = math.log(class_counts[label] / total)
+            self.feature_log_prob[label] = {
+                gram: math.log((count + self.alpha) / denominator) for gram, count in counts.items()
+            }
+            self.unseen_log_prob[label] = math.log(self.alpha / denominator)
+        return self
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        """返回各标签的后验概率"""
+        grams = char_ngrams(text, 1, self.n_max)
+        scores = {}
+        for label in self.labels:
+            probs = self.feature_log_prob[label]
+            unseen = self.unseen_log_prob[label]
+            scores[label] = self.class_log_prior[label] + sum(probs.get(g, unseen) for g in grams)
+        top = max(scores.values())
+        exp_scores = {label: math.exp(score - top) for label, score in scores.items()}
+        norm = sum(exp_scores.values())
+        return {label: value / norm for label, value in exp_scores.items()}
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """返回 (最可能的标签, 置信度)"""
+        proba = self.predict_proba(text)
+        label = max(proba, key=proba.get)
+        return label, proba[label]
+
+    def save(self, path: str = DEFAULT_MODEL_PATH):
+        model_dir = os.path.dirname(path)
+        if model_dir and not os.path.exists(model_dir):
+            os.makedirs(model_dir)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "n_max": self.n_max,
+                "alpha": self.alpha,
+                "labels": self.labels,
+                "class_log_prior": self.class_log_prior,
+                "feature_log_prob": self.feature_log_prob,
+                "unseen_log_prob": self.unseen_log_prob,
+            }, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_MODEL_PATH) -> "NaiveBayesIntentClassifier":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        model = cls(n_max=data["n_max"], alpha=data["alpha"])
+        model.labels = data["labels"]
+        model.class_log_prior = data["class_log_prior"]
+        model.feature_log_prob = data["feature_log_prob"]
+        model.unseen_log_prob = data["unseen_log_prob"]
+        return model
+
+
+def load_local_classifier(config: Dict) -> Optional[NaiveBayesIntentClassifier]:
+    """按 config.json 的 intent_classifier 段加载模型，未启用或模型不存在时返回None"""
+    section = config.get("intent_classifier") or {}
+    if not section.get("enabled", False):
+        return None
+    model_path = section.get("model_path", DEFAULT_MODEL_PATH)
+    if not os.path.exists(model_path):
+        logger.warning(f"本地意图分类模型不存在: {model_path}，将直接使用大模型分类")
+        return None
+    try:
+        model = NaiveBayesIntentClassifier.load(model_path)
+        logger.info(f"已加载本地意图分类模型: {model_path}")
+        return model
+    except Exception as e:
+        logger.error(f"加载本地意图分类模型时出错: {e}")
+        return None
+
+
+def _labeled_samples() -> List[Tuple[str, str]]:
+    samples = []
+    for message, label in load_intent_labels().items():
+        label = normalize_label(label)
+        if label:
+            samples.append((message, label))
+    return samples
+
+
+def _split(samples, holdout: float, seed: int):
+    samples = list(samples)
+    random.Random(seed).shuffle(samples)
+    cut = int(len(samples) * (1 - holdout))
+    return samples[:cut], samples[cut:]
+
+
+def cmd_label(args):
+    from dotenv import load_dotenv
+    from XianyuAgent import XianyuReplyBot
+
+    load_dotenv()
+    labeled = load_intent_labels()
+    pending = []
+    for turn in iter_logged_conversations():
+        msg = turn["user_message"]
+        if msg and msg not in labeled and msg not in pending:
+            pending.append(msg)
+    pending = pending[:args.limit] if args.limit else pending
+    logger.info(f"待标注消息: {len(pending)} 条")
+
+    bot = XianyuReplyBot()
+    for msg in pending:
+        label = normalize_label(bot.agents['classify'].generate(user_msg=msg, item_desc="", context=""))
+        if label:
+            log_intent_label(msg, label, source="llm")
+
+
+def cmd_train(args):
+    samples = _labeled_samples()
+    model = NaiveBayesIntentClassifier(n_max=args.n_max).fit(samples)
+    model.save(args.model)
+    print(f"训练样本: {len(samples)} 条，标签分布: {dict(Counter(label for _, label in samples))}")
+    print(f"模型已保存到 {args.model}")
+
+
+def cmd_evaluate(args):
+    train_set, test_set = _split(_labeled_samples(), args.holdout, args.seed)
+    if not train_set or not test_set:
+        print("标注数据不足，无法评估")
+        return
+    model = NaiveBayesIntentClassifier(n_max=args.n_max).fit(train_set)
+
+    correct = confident = confident_correct = 0
+    start = time.perf_counter()
+    predictions = [(model.predict(text), label) for text, label in test_set]
+    per_message_us = (time.perf_counter() - start) / len(test_set) * 1e6
+    for (pred, conf), label in predictions:
+        correct += pred == label
+        if conf >= args.threshold:
+            confident += 1
+            confident_correct += pred == label
+
+    print(f"训练/测试: {len(train_set)}/{len(test_set)} 条")
+    print(f"与大模型标签一致率: {correct / len(test_set):.2%}")
+    print(f"置信度 >= {args.threshold}: 覆盖 {confident / len(test_set):.2%}，"
+          f"一致率 {confident_correct / confident:.2%}" if confident else f"置信度 >= {args.threshold}: 无样本")
+    print(f"单条推理耗时: {per_message_us:.1f} µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地意图分类器训练与评估")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--n-max", type=int, default=3)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_label = sub.add_parser("label", help="用大模型为历史对话中的消息打标签")
+    p_label.add_argument("--limit", type=int, default=0)
+    p_label.set_defaults(func=cmd_label)
+
+    p_train = sub.add_parser("train", help="训练并保存模型")
+    p_train.set_defaults(func=cmd_train)
+
+    p_eval = sub.add_parser("evaluate", help="评估模型与大模型标签的一致率")
+    p_eval.add_argument("--holdout", type=float, default=0.2)
+    p_eval.add_argument("--threshold", type=float, default=0.85)
+    p_eval.add_argument("--seed", type=int, default=42)
+    p_eval.set_defaults(func=cmd_evaluate)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
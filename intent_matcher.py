@@ -0,0 +1,134 @@
+import json
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional
+
+from loguru import logger
+
+from utils.aho_corasick import AhoCorasick
+
+# 与原有规则保持一致：去掉标点、空白与表情，只保留字母数字和汉字
+_CLEAN_RE = re.compile(r'[^\w\u4e00-\u9fa5]')
+
+DEFAULT_INTENT_RULES = {
+    'tech': {'keywords': ['参数', '规格', '型号', '连接', '对比'], 'patterns': [r'和.+比']},
+    'price': {'keywords': ['便宜', '价', '砍价', '少点'], 'patterns': [r'\d+元', r'能少\d+']},
+    'confirm_discount': {'keywords': ['可以', '好的', '行', 'ok', '嗯'], 'patterns': []},
+    'propose_discount': {'keywords': ['批量', '多件', '都买了'], 'patterns': [r'买\d+件', r'要\d+个']},
+}
+
+# 多个意图同时命中时的优先级（confirm_discount 仅在上一轮为 propose_discount 时生效）
+DEFAULT_INTENT_PRIORITY = ['confirm_discount', 'propose_discount', 'tech', 'price']
+
+
+class IntentMatch(NamedTuple):
+    """一次规则命中，位置基于清洗后的文本"""
+    intent: str
+    start: int
+    end: int
+    term: str
+
+
+def clean_text(text: str) -> str:
+    """规则匹配前的文本清洗"""
+    return _CLEAN_RE.sub('', text).lower()
+
+
+class IntentMatcher:
+    """
+    意图规则匹配器
+
+    规则在构造时一次性编译：所有意图的关键词合并为一个 Aho-Corasick 自动机，扫描一次即可得到
+    全部关键词命中，耗时不随关键词数量线性增长。正则规则很少，各自预编译后逐个扫描；
+    合并成一个交替式时同一起点只会报告第一个命中的分支，不同意图的正则在同一位置命中时会漏掉后者。
+    """
+
+    def __init__(self, rules: Optional[Dict] = None, priority: Optional[List[str]] = None):
+        self.rules = rules if rules is not None else DEFAULT_INTENT_RULES
+        self.priority = list(priority) if priority else list(DEFAULT_INTENT_PRIORITY)
+        for intent in self.rules:
+            if intent not in self.priority:
+                self.priority.append(intent)
+
+        self._automaton = AhoCorasick(
+            (kw.lower(), intent)
+            for intent, rule in self.rules.items()
+            for kw in rule.get('keywords', [])
+        )
+
+        # 零宽前瞻包裹，使不同起点上的重叠命中都能被找到
+        self._patterns = [
+            (re.compile(f"(?=({pattern}))"), intent)
+            for intent, rule in self.rules.items()
+            for pattern in rule.get('patterns', [])
+        ]
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "IntentMatcher":
+        """从 config.json 中的 intent_rules 段构建，缺失时使用默认规则"""
+        section = config.get("intent_rules") or {}
+        return cls(section.get("rules"), section.get("priority"))
+
+    def match(self, user_msg: str) -> List[IntentMatch]:
+        """返回所有命中的规则，按起始位置排序"""
+        text = clean_text(user_msg)
+        matches = [
+            IntentMatch(intent, start, end, term)
+            for start, end, term, intent in self._automaton.iter_matches(text)
+        ]
+        for pattern_re, intent in self._patterns:
+            for m in pattern_re.finditer(text):
+                start, end = m.span(1)
+                matches.append(IntentMatch(intent, start, end, m.group(1)))
+        matches.sort(key=lambda x: (x.start, x.end))
+        return matches
+
+    def matched_intents(self, user_msg: str) -> Dict[str, List[IntentMatch]]:
+        """按意图分组的命中结果"""
+        grouped: Dict[str, List[IntentMatch]] = {}
+        for m in self.match(user_msg):
+            grouped.setdefault(m.intent, []).append(m)
+        return grouped
+
+    def best_intent(self, user_msg: str, last_intent: Optional[str] = None) -> Optional[str]:
+        """按优先级选出最终意图，未命中任何规则时返回None"""
+        grouped = self.matched_intents(user_msg)
+        for intent in self.priority:
+            if intent not in grouped:
+                continue
+            if intent == 'confirm_discount' and last_intent != 'propose_discount':
+                continue
+            return intent
+        return None
+
+
+class IntentRuleSource:
+    """
+    意图规则的配置来源
+
+    记录配置文件的修改时间，只有文件变化时才重新编译规则，供热更新使用。
+    """
+
+    def __init__(self, config_path: str = "config.json"):
+        self.config_path = config_path
+        self._mtime = None
+
+    def load(self) -> IntentMatcher:
+        """读取配置并编译规则，配置不可用时退回默认规则"""
+        config = {}
+        try:
+            self._mtime = os.path.getmtime(self.config_path)
+            with open(self.config_path, "r", encoding="utf-8") as f:
+                config = json.load(f)
+        except FileNotFoundError:
+            logger.debug(f"未找到意图规则配置 {self.config_path}，使用默认规则")
+        except Exception as e:
+            logger.error(f"加载意图规则配置时出错: {e}")
+        return IntentMatcher.from_config(config)
+
+    def changed(self) -> bool:
+        """配置文件自上次加载后是否发生变化"""
+        try:
+            return os.path.getmtime(self.config_path) != self._mtime
+        except OSError:
+            return False
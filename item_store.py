@@ -0,0 +1,169 @@
+import asyncio
+import re
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional
+
+from loguru import logger
+
+DEFAULT_MAX_ENTRIES = 500
+
+# 商品描述中 "内存：8G"、"尺寸: 6.1寸" 这类键值对
+_DESC_ATTR_RE = re.compile(r"([\u4e00-\u9fa5A-Za-z]{1,8})\s*[:：]\s*([^\s,，;；。、]+)")
+
+
+class ItemRecord(NamedTuple):
+    """商品原始数据与解析出的属性"""
+    item_id: str
+    raw: Dict
+    attributes: Dict[str, str]
+
+    def details(self) -> Dict:
+        """供工具返回给模型的精简信息"""
+        return {
+            "item_id": self.item_id,
+            "title": self.raw.get("title", ""),
+            "price": self.raw.get("soldPrice"),
+            "original_price": self.raw.get("originalPrice"),
+            "attributes": self.attributes,
+            "desc": self.raw.get("desc", ""),
+        }
+
+
+def parse_item_attributes(item: Dict) -> Dict[str, str]:
+    """从商品数据中提取属性：平台结构化标签优先，其次是描述里的键值对"""
+    attributes: Dict[str, str] = {}
+    for match in _DESC_ATTR_RE.finditer(item.get("desc") or ""):
+        attributes.setdefault(match.group(1), match.group(2))
+    for label in item.get("cpvLabels") or []:
+        if isinstance(label, dict) and label.get("propertyName") and label.get("valueName"):
+            attributes[label["propertyName"]] = label["valueName"]
+    for label in item.get("itemLabelExtList") or []:
+        if isinstance(label, dict) and label.get("propertyText") and label.get("text"):
+            attributes[label["propertyText"]] = label["text"]
+    return attributes
+
+
+class ItemStore:
+    """
+    商品信息的读取入口
+
+    依次查内存缓存、数据库 items 表，都未命中时调用闲鱼接口获取并写回数据库。内存中保存解析后的
+    属性，按最近使用淘汰；同一商品的并发请求只会触发一次接口调用，调用方超时放弃等待也不会中断这次获取。
+    """
+
+    def __init__(
+        self,
+        context_manager,
+        fetch: Optional[Callable[[str], Awaitable[Dict]]] = None,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        """
+        Args:
+            context_manager: ChatContextManager，提供 items 表的读写
+            fetch: 异步获取商品接口数据的函数，返回 XianyuApis.get_item_info 的结果
+            max_entries: 内存中最多缓存的商品数
+        """
+        self.context_manager = context_manager
+        self.fetch = fetch
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, ItemRecord]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.db_hits = 0
+        self.fetches = 0
+        self.coalesced = 0
+
+    @classmethod
+    def from_config(cls, config: Dict, context_manager, fetch=None) -> "ItemStore":
+        section = config.get("item_store") or {}
+        return cls(context_manager, fetch, max_entries=section.get("max_entries", DEFAULT_MAX_ENTRIES))
+
+    def _remember(self, item_id: str, raw: Dict) -> ItemRecord:
+        record = ItemRecord(item_id, raw, parse_item_attributes(raw))
+        self._cache[item_id] = record
+        self._cache.move_to_end(item_id)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return record
+
+    async def get_record(self, item_id: str) -> Optional[ItemRecord]:
+        item_id = str(item_id)
+        record = self._cache.get(item_id)
+        if record is not None:
+            self._cache.move_to_end(item_id)
+            self.hits += 1
+            return record
+
+        future = self._inflight.get(item_id)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            future = asyncio.ensure_future(self._load(item_id))
+            self._inflight[item_id] = future
+            future.add_done_callback(lambda _: self._inflight.pop(item_id, None))
+        # shield：某个调用方超时被取消时，获取仍然完成并写入缓存，供其他调用方使用
+        return await asyncio.shield(future)
+
+    async def get(self, item_id: str) -> Optional[Dict]:
+        """返回商品原始数据（itemDO），获取失败时返回 None"""
+        record = await self.get_record(item_id)
+        return record.raw if record is not None else None
+
+    async def _load(self, item_id: str) -> Optional[ItemRecord]:
+        raw = await self.context_manager.get_item_info(item_id)
+        if raw:
+            self.db_hits += 1
+            logger.info(f"从数据库获取商品信息: {item_id}")
+            return self._remember(item_id, raw)
+        if self.fetch is None:
+            return None
+
+        logger.info(f"从API获取商品信息: {item_id}")
+        self.fetches += 1
+        try:
+            api_result = await self.fetch(item_id)
+        except Exception as e:
+            logger.warning(f"获取商品信息失败: {e}")
+            return None
+        if not isinstance(api_result, dict) or 'itemDO' not in (api_result.get('data') or {}):
+            logger.warning(f"获取商品信息失败: {api_result}")
+            return None
+        raw = api_result['data']['itemDO']
+        # 保存商品信息到数据库
+        await self.context_manager.save_item_info(item_id, raw)
+        return self._remember(item_id, raw)
+
+    def prime(self, item_id: str, raw: Dict) -> ItemRecord:
+        """放入调用方已经读到的商品数据（如随会话上下文一起读出），已缓存时直接返回缓存"""
+        item_id = str(item_id)
+        record = self._cache.get(item_id)
+        if record is not None:
+            self._cache.move_to_end(item_id)
+            return record
+        return self._remember(item_id, raw)
+
+    def invalidate(self, item_id: str):
+        self._cache.pop(str(item_id), None)
+
+    def stats(self) -> Dict:
+        return {
+            "cached": len(self._cache),
+            "hits": self.hits,
+            "db_hits": self.db_hits,
+            "fetches": self.fetches,
+            "coalesced": self.coalesced,
+        }
+
+
+_store: Optional[ItemStore] = None
+
+
+def configure_item_store(store: ItemStore) -> ItemStore:
+    """设置进程内共享的商品信息入口，供 XianyuGraph 的工具使用"""
+    global _store
+    _store = store
+    return _store
+
+
+def get_item_store() -> Optional[ItemStore]:
+    return _store
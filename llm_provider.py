@@ -0,0 +1,306 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+from loguru import logger
+from openai import APIStatusError, OpenAI
+
+from utils.deadline import current_deadline, remaining_or
+
+# 这些 4xx 与端点当时的状态有关（超时、限流），换一个端点可能成功
+RETRYABLE_CLIENT_STATUS = (408, 429)
+
+
+def is_retryable(error: Exception) -> bool:
+    """请求本身有误（其余 4xx）时换端点也不会成功，应直接失败"""
+    if isinstance(error, APIStatusError):
+        status = error.status_code
+        return not (400 <= status < 500) or status in RETRYABLE_CLIENT_STATUS
+    return True
+
+
+class EndpointStats:
+    """单个端点的滑动窗口延迟与错误率统计"""
+
+    def __init__(self, window: int = 200):
+        self._latencies = deque(maxlen=window)
+        self._outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.consecutive_failures = 0
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self._outcomes.append(ok)
+            if ok:
+                self._latencies.append(latency)
+                self.consecutive_failures = 0
+            else:
+                self.consecutive_failures += 1
+
+    @property
+    def samples(self) -> int:
+        return len(self._latencies)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            if not self._latencies:
+                return None
+            ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+        return ordered[index]
+
+    @property
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._outcomes:
+                return 0.0
+            return 1 - sum(self._outcomes) / len(self._outcomes)
+
+    def snapshot(self) -> Dict:
+        return {
+            "samples": self.samples,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "error_rate": round(self.error_rate, 3),
+        }
+
+
+class Endpoint:
+    """
+    一个 OpenAI 兼容的模型服务端点
+
+    调用方（各 Agent 的配置）指定的模型优先；models 把调用方的模型名映射为该端点上的名称，
+    model 只在调用方未指定模型时使用。timeout 为调用方未指定超时时单次请求的超时。
+    """
+
+    def __init__(self, name: str, client, model: Optional[str] = None, stats_window: int = 200,
+                 models: Optional[Dict[str, str]] = None, timeout: Optional[float] = None):
+        self.name = name
+        self.client = client
+        self.model = model
+        self.models = models or {}
+        self.timeout = timeout
+        self.stats = EndpointStats(stats_window)
+        self.cooldown_until = 0.0
+
+    def call(self, **kwargs):
+        model = kwargs.get("model")
+        if model:
+            kwargs["model"] = self.models.get(model, model)
+        elif self.model:
+            kwargs["model"] = self.model
+        start = time.perf_counter()
+        try:
+            response = self.client.chat.completions.create(**kwargs)
+        except Exception as e:
+            # 请求错误不代表端点不健康，不计入错误率
+            if is_retryable(e):
+                self.stats.record(time.perf_counter() - start, False)
+            raise
+        self.stats.record(time.perf_counter() - start, True)
+        return response
+
+
+class _Completions:
+    def __init__(self, pool):
+        self._pool = pool
+
+    def create(self, **kwargs):
+        return self._pool.create(**kwargs)
+
+
+class _Chat:
+    def __init__(self, pool):
+        self.completions = _Completions(pool)
+
+
+class ProviderPool:
+    """
+    多端点大模型调用池
+
+    对外提供与 OpenAI 客户端相同的 chat.completions.create 接口，Agent无需改动即可使用。
+    每次调用选择当前最快的健康端点；开启对冲后，若主请求超过该端点的 p95 仍未返回，
+    则向次优端点发出同样的请求，采用先返回的结果，另一个请求被放弃（结果丢弃，不再等待）。
+    对冲等待从主请求真正开始执行时计时，在线程池中排队的时间不会触发对冲。
+    每次尝试的超时不超过当前回复时限的剩余时间，时限用完后不再尝试后续端点。
+    """
+
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        hedge: bool = False,
+        hedge_min_delay: float = 0.3,
+        hedge_min_samples: int = 20,
+        max_error_rate: float = 0.5,
+        failure_cooldown: float = 30.0,
+        max_workers: int = 16,
+    ):
+        if not endpoints:
+            raise ValueError("ProviderPool 至少需要一个端点")
+        self.endpoints = endpoints
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.max_error_rate = max_error_rate
+        self.failure_cooldown = failure_cooldown
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-pool")
+        self.chat = _Chat(self)
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "ProviderPool":
+        """
+        按 config.json 的 llm_providers 段构建；未配置端点时使用环境变量中的单一端点，
+        行为与直接使用 OpenAI 客户端一致
+        """
+        section = config.get("llm_providers") or {}
+        endpoints = []
+        for spec in section.get("endpoints", []):
+            api_key = os.getenv(spec.get("api_key_env", "API_KEY"), spec.get("api_key", ""))
+            client = OpenAI(api_key=api_key, base_url=spec["base_url"], timeout=spec.get("timeout", 60))
+            endpoints.append(Endpoint(spec.get("name", spec["base_url"]), client, spec.get("model"),
+                                      models=spec.get("models"), timeout=spec.get("timeout", 60)))
+        if not endpoints:
+            client = OpenAI(
+                api_key=os.getenv("API_KEY"),
+                base_url=os.getenv("MODEL_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1"),
+            )
+            endpoints.append(Endpoint("default", client))
+
+        hedge = section.get("hedge") or {}
+        return cls(
+            endpoints,
+            hedge=hedge.get("enabled", False),
+            hedge_min_delay=hedge.get("min_delay_ms", 300) / 1000,
+            hedge_min_samples=hedge.get("min_samples", 20),
+            max_workers=hedge.get("max_workers", 16),
+            max_error_rate=section.get("max_error_rate", 0.5),
+            failure_cooldown=section.get("failure_cooldown_secs", 30),
+        )
+
+    def _healthy(self, endpoint: Endpoint, now: float) -> bool:
+        if endpoint.cooldown_until > now:
+            return False
+        return endpoint.stats.error_rate <= self.max_error_rate or endpoint.stats.samples < 5
+
+    def ranked_endpoints(self) -> List[Endpoint]:
+        """健康端点按 p50 升序排列，尚无样本的端点排在最前以便探测；全部不健康时按错误率排序"""
+        now = time.monotonic()
+        healthy = [e for e in self.endpoints if self._healthy(e, now)]
+        if not healthy:
+            return sorted(self.endpoints, key=lambda e: e.stats.error_rate)
+
+        def latency_key(e: Endpoint):
+            p50 = e.stats.percentile(50)
+            return (0, 0.0) if p50 is None else (1, p50)
+
+        return sorted(healthy, key=latency_key)
+
+    def _hedge_delay(self, endpoint: Endpoint) -> Optional[float]:
+        if endpoint.stats.samples < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, endpoint.stats.percentile(95) or 0.0)
+
+    def _mark_failure(self, endpoint: Endpoint, error: Exception):
+        logger.warning(f"模型端点 {endpoint.name} 调用失败: {error}")
+        if endpoint.stats.consecutive_failures >= 3:
+            endpoint.cooldown_until = time.monotonic() + self.failure_cooldown
+            logger.warning(f"模型端点 {endpoint.name} 连续失败，暂停使用 {self.failure_cooldown:.0f} 秒")
+
+    def create(self, **kwargs):
+        ranked = self.ranked_endpoints()
+        primary = ranked[0]
+        if self.hedge and len(ranked) > 1:
+            delay = self._hedge_delay(primary)
+            if delay is not None:
+                return self._create_hedged(primary, ranked[1], delay, ranked[2:], kwargs)
+
+        return self._try_in_order(ranked, kwargs)
+
+    @staticmethod
+    def _attempt_kwargs(endpoint: Endpoint, kwargs) -> Dict:
+        """单次尝试的参数：超时取调用方（或端点）的设置与回复时限剩余时间中较小者"""
+        timeout = kwargs.get("timeout", endpoint.timeout)
+        deadline = current_deadline()
+        if deadline is not None:
+            timeout = remaining_or(deadline.remaining() if timeout is None else timeout)
+        return kwargs if timeout is None else {**kwargs, "timeout": timeout}
+
+    def _submit(self, endpoint: Endpoint, kwargs):
+        """在线程池中发起请求，返回 (future, 请求开始执行的事件)"""
+        started = threading.Event()
+        attempt = self._attempt_kwargs(endpoint, kwargs)
+
+        def run():
+            started.set()
+            return endpoint.call(**attempt)
+
+        return self._executor.submit(run), started
+
+    def _try_in_order(self, endpoints: List[Endpoint], kwargs, last_error: Optional[Exception] = None):
+        for endpoint in endpoints:
+            deadline = current_deadline()
+            if last_error is not None and deadline is not None and deadline.expired:
+                logger.warning(f"回复时限已用完，不再尝试端点 {endpoint.name}")
+                break
+            try:
+                return endpoint.call(**self._attempt_kwargs(endpoint, kwargs))
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                self._mark_failure(endpoint, e)
+                last_error = e
+        raise last_error
+
+    def _create_hedged(self, primary: Endpoint, secondary: Endpoint, delay: float, rest: List[Endpoint], kwargs):
+        future, started = self._submit(primary, kwargs)
+        futures = {future: primary}
+        # 线程池排队的时间不计入对冲等待，否则本地拥塞时会对冲出更多请求
+        started.wait()
+        done, _ = wait(futures, timeout=delay)
+        if not done:
+            self.hedges_fired += 1
+            logger.debug(f"端点 {primary.name} 超过 {delay * 1000:.0f}ms 未返回，对冲请求 {secondary.name}")
+            futures[self._submit(secondary, kwargs)[0]] = secondary
+        elif next(iter(done)).exception() is not None:
+            error = next(iter(done)).exception()
+            if not is_retryable(error):
+                raise error
+            # 主端点很快就失败了，直接改用次优端点
+            futures[self._submit(secondary, kwargs)[0]] = secondary
+
+        last_error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                endpoint = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    if not is_retryable(e):
+                        for loser in pending:
+                            loser.cancel()
+                        raise
+                    self._mark_failure(endpoint, e)
+                    last_error = e
+                    continue
+                for loser in pending:
+                    loser.cancel()
+                if endpoint is secondary:
+                    self.hedges_won += 1
+                return result
+
+        # 主备都失败时依次尝试剩余端点
+        return self._try_in_order(rest, kwargs, last_error)
+
+    def stats(self) -> Dict:
+        return {
+            "endpoints": {e.name: e.stats.snapshot() for e in self.endpoints},
+            "hedges_fired": self.hedges_fired,
+            "hedges_won": self.hedges_won,
+        }
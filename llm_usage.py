@@ -0,0 +1,320 @@
+"""
+大模型调用用量、延迟与费用统计
+
+每次大模型调用记录 prompt/completion/缓存命中token数、延迟、模型、Agent以及会话/商品ID，
+由后台线程批量写入 data/llm_usage.db。会话与商品ID通过 usage_context 在调用链上传递。
+
+用法:
+    python llm_usage.py report [--days 7] [--top 10]
+"""
+import argparse
+import atexit
+import contextvars
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+DEFAULT_USAGE_DB = "data/llm_usage.db"
+
+_call_context: contextvars.ContextVar = contextvars.ContextVar("llm_call_context", default={})
+
+
+@contextmanager
+def usage_context(**fields):
+    """在此范围内的大模型调用都会带上给定的 chat_id / item_id 等字段"""
+    token = _call_context.set({**_call_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+
+def current_usage_context() -> Dict:
+    return _call_context.get()
+
+
+def usage_context_in(ctx: contextvars.Context) -> Dict:
+    """读取另一个上下文（如 contextvars.copy_context() 的快照）中的调用字段"""
+    return ctx.get(_call_context, {})
+
+
+class UsageRecorder:
+    """
+    大模型调用记录器
+
+    record() 只把记录放入内存队列，调用方不承担任何磁盘开销；
+    后台线程每隔 flush_interval 秒或攒够 batch_size 条时合并为一个事务写入。
+    """
+
+    def __init__(self, db_path: str = DEFAULT_USAGE_DB, pricing: Optional[Dict] = None,
+                 flush_interval: float = 1.0, batch_size: int = 200):
+        self.db_path = db_path
+        self.pricing = pricing or {}
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # 已提示过未配置单价的模型，每个模型只警告一次
+        self._unpriced: set = set()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._init_db()
+                self._thread = threading.Thread(target=self._writer_loop, name="llm-usage-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _init_db(self):
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_calls (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    ts DATETIME NOT NULL,
+                    agent TEXT NOT NULL,
+                    model TEXT,
+                    chat_id TEXT,
+                    item_id TEXT,
+                    prompt_tokens INTEGER DEFAULT 0,
+                    completion_tokens INTEGER DEFAULT 0,
+                    cached_tokens INTEGER DEFAULT 0,
+                    latency_ms REAL,
+                    cost REAL DEFAULT 0,
+                    ok INTEGER DEFAULT 1
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_ts ON llm_calls (ts)")
+
+    def cost(self, model: Optional[str], prompt_tokens: int, completion_tokens: int, cached_tokens: int) -> float:
+        """按 config.json 中 llm_pricing 的每千token单价计算费用，未配置的模型费用记为0并警告"""
+        price = self.pricing.get(model or "", {})
+        if not price:
+            if model not in self._unpriced:
+                self._unpriced.add(model)
+                logger.warning(f"模型 {model} 未在 llm_pricing 中配置单价，其调用费用按0记录，花费统计会偏低")
+            return 0.0
+        uncached = max(prompt_tokens - cached_tokens, 0)
+        return (
+            uncached * price.get("input_per_1k", 0.0)
+            + cached_tokens * price.get("cached_input_per_1k", price.get("input_per_1k", 0.0))
+            + completion_tokens * price.get("output_per_1k", 0.0)
+        ) / 1000
+
+    def record(self, agent: str, model: Optional[str], usage: Optional[Dict], latency: float, ok: bool = True, **fields):
+        """
+        记录一次调用
+
+        Args:
+            agent: Agent名称
+            model: 模型名
+            usage: 包含 prompt_tokens / completion_tokens / cached_tokens 的字典
+            latency: 调用耗时（秒）
+            ok: 调用是否成功
+            fields: 额外覆盖上下文中的 chat_id / item_id
+        """
+        usage = usage or {}
+        ctx = {**current_usage_context(), **fields}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+        cached_tokens = usage.get("cached_tokens", 0)
+        self._ensure_started()
+        self._queue.put((
+            datetime.now().isoformat(timespec="milliseconds"),
+            agent,
+            model,
+            ctx.get("chat_id"),
+            ctx.get("item_id"),
+            prompt_tokens,
+            completion_tokens,
+            cached_tokens,
+            round(latency * 1000, 1),
+            self.cost(model, prompt_tokens, completion_tokens, cached_tokens),
+            int(ok),
+        ))
+
+    def _writer_loop(self):
+        while True:
+            rows, flushed = [], []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if isinstance(item, threading.Event):
+                    # flush() 的请求：立即写入已收集的记录
+                    flushed.append(item)
+                    break
+                rows.append(item)
+                remaining = deadline - time.monotonic()
+                if len(rows) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if rows:
+                self._write(rows)
+            for event in flushed:
+                event.set()
+
+    def _write(self, rows: List[tuple]):
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.executemany(
+                    """
+                    INSERT INTO llm_calls (ts, agent, model, chat_id, item_id, prompt_tokens, completion_tokens,
+                                           cached_tokens, latency_ms, cost, ok)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    rows,
+                )
+        except Exception as e:
+            logger.error(f"写入大模型用量记录时出错: {e}")
+
+    def flush(self, timeout: float = 5.0):
+        """等待已记录的调用全部写入（用于退出前与报表生成前）"""
+        if self._thread is None:
+            return
+        event = threading.Event()
+        self._queue.put(event)
+        event.wait(timeout)
+
+
+_recorder: Optional[UsageRecorder] = None
+
+
+def configure_usage_recorder(config: Dict) -> UsageRecorder:
+    """按 config.json 创建进程内共享的记录器"""
+    global _recorder
+    section = config.get("llm_usage") or {}
+    _recorder = UsageRecorder(section.get("db_path", DEFAULT_USAGE_DB), config.get("llm_pricing"))
+    return _recorder
+
+
+def get_usage_recorder() -> UsageRecorder:
+    global _recorder
+    if _recorder is None:
+        _recorder = UsageRecorder()
+    return _recorder
+
+
+def _percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def build_report(db_path: str = DEFAULT_USAGE_DB, days: int = 7, top: int = 10) -> Dict:
+    """汇总最近 days 天的调用：按Agent的量与延迟分位数、花费最多的商品与会话"""
+    since = (datetime.now() - timedelta(days=days)).isoformat()
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute(
+            "SELECT agent, model, latency_ms, prompt_tokens, completion_tokens, cached_tokens, cost, ok "
+            "FROM llm_calls WHERE ts >= ?",
+            (since,),
+        ).fetchall()
+        top_items = conn.execute(
+            "SELECT item_id, COUNT(*), SUM(prompt_tokens + completion_tokens), SUM(cost) FROM llm_calls "
+            "WHERE ts >= ? AND item_id IS NOT NULL GROUP BY item_id ORDER BY SUM(cost) DESC, "
+            "SUM(prompt_tokens + completion_tokens) DESC LIMIT ?",
+            (since, top),
+        ).fetchall()
+        top_chats = conn.execute(
+            "SELECT chat_id, COUNT(*), SUM(prompt_tokens + completion_tokens), SUM(cost) FROM llm_calls "
+            "WHERE ts >= ? AND chat_id IS NOT NULL GROUP BY chat_id ORDER BY SUM(cost) DESC, "
+            "SUM(prompt_tokens + completion_tokens) DESC LIMIT ?",
+            (since, top),
+        ).fetchall()
+
+    agents: Dict[str, Dict] = {}
+    for agent, model, latency, prompt, completion, cached, cost, ok in rows:
+        entry = agents.setdefault(agent, {
+            "calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0,
+            "cached_tokens": 0, "cost": 0.0, "models": set(), "latencies": [],
+        })
+        entry["calls"] += 1
+        entry["errors"] += 0 if ok else 1
+        entry["prompt_tokens"] += prompt
+        entry["completion_tokens"] += completion
+        entry["cached_tokens"] += cached
+        entry["cost"] += cost
+        entry["models"].add(model)
+        if ok:
+            entry["latencies"].append(latency)
+    for entry in agents.values():
+        latencies = entry.pop("latencies")
+        entry["p50_ms"] = _percentile(latencies, 50)
+        entry["p95_ms"] = _percentile(latencies, 95)
+        entry["models"] = sorted(m for m in entry["models"] if m)
+
+    return {
+        "agents": agents,
+        "search_gate": _search_savings(agents),
+        "top_items": [dict(zip(("item_id", "calls", "tokens", "cost"), row)) for row in top_items],
+        "top_chats": [dict(zip(("chat_id", "calls", "tokens", "cost"), row)) for row in top_chats],
+    }
+
+
+def _search_savings(agents: Dict[str, Dict]) -> Optional[Dict]:
+    """按带搜索与不带搜索的技术咨询平均值，估算门控跳过搜索节省的费用与延迟"""
+    plain, search = agents.get("tech"), agents.get("tech_search")
+    if not plain or not search:
+        return None
+    cost_per_call = search["cost"] / search["calls"] - plain["cost"] / plain["calls"]
+    return {
+        "skipped": plain["calls"],
+        "searched": search["calls"],
+        "cost_saved": plain["calls"] * cost_per_call,
+        "p50_saved_ms": search["p50_ms"] - plain["p50_ms"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="大模型用量与费用报表")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("--db", default=DEFAULT_USAGE_DB)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"用量数据库不存在: {args.db}")
+        return
+    report = build_report(args.db, args.days, args.top)
+
+    print(f"===== 最近 {args.days} 天按Agent汇总 =====")
+    print(f"{'agent':<18}{'calls':>7}{'err':>5}{'prompt':>10}{'cached':>9}{'output':>9}{'cost':>10}{'p50ms':>8}{'p95ms':>8}  models")
+    for agent, e in sorted(report["agents"].items(), key=lambda kv: -kv[1]["cost"]):
+        print(f"{agent:<18}{e['calls']:>7}{e['errors']:>5}{e['prompt_tokens']:>10}{e['cached_tokens']:>9}"
+              f"{e['completion_tokens']:>9}{e['cost']:>10.4f}{e['p50_ms']:>8.0f}{e['p95_ms']:>8.0f}  {','.join(e['models'])}")
+
+    savings = report["search_gate"]
+    if savings:
+        print(f"\n搜索门控: 跳过 {savings['skipped']} 次 / 搜索 {savings['searched']} 次，"
+              f"估算节省费用 {savings['cost_saved']:.4f}，每次 p50 节省 {savings['p50_saved_ms']:.0f}ms")
+
+    print(f"\n===== 花费最多的商品 Top {args.top} =====")
+    for row in report["top_items"]:
+        print(f"{row['item_id']:<24} calls={row['calls']:<6} tokens={row['tokens']:<8} cost={row['cost']:.4f}")
+
+    print(f"\n===== 花费最多的会话 Top {args.top} =====")
+    for row in report["top_chats"]:
+        print(f"{row['chat_id']:<24} calls={row['calls']:<6} tokens={row['tokens']:<8} cost={row['cost']:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,13 @@ from utils.xianyu_utils import generate_mid, generate_uuid, trans_cookies, gener
 from utils.reporting_utils import log_daily_event, log_daily_conversation
 from XianyuAgent import XianyuReplyBot
 from context_manager import ChatContextManager
+from history_cache import ChatHistoryCache
+from llm_usage import usage_context
+from utils.deadline import DeadlineExceeded, DeadlinePolicy, deadline_scope
+from utils.sqlite_pool import SqlitePool
+from utils.write_behind import WriteBehindQueue
+from item_store import ItemStore, configure_item_store
+from reply_engine import BotEngine, EngineSelector, GraphEngine
 
 
 class XianyuLive:
@@ -28,17 +35,37 @@ class XianyuLive:
         self.base_url = self.config["api_endpoints"]["websocket_url"]
         self.cookies_str = cookies_str
         self.bot = bot
+        # 回复引擎按账号或会话比例在 XianyuReplyBot 与 XianyuGraph 之间选择
+        self.engines = EngineSelector.from_config(self.config, {"bot": BotEngine(bot), "graph": GraphEngine()})
         self.cookies = trans_cookies(cookies_str)
         self.xianyu.session.cookies.update(self.cookies)  # 直接使用 session.cookies.update
         self.myid = self.cookies['unb']
         self.device_id = generate_device_id(self.myid)
-        self.context_manager = ChatContextManager()
+        budget_config = self.config.get("context_budget", {})
+        db_path = "data/chat_history.db"
+        db_pool = SqlitePool.from_config(self.config, db_path)
+        self.context_manager = ChatContextManager(
+            db_path=db_path,
+            recent_turns=budget_config.get("recent_turns", 6),
+            summary_max_tokens=budget_config.get("summary_max_tokens", 200),
+            pool=db_pool,
+            write_behind=WriteBehindQueue.from_config(self.config, db_pool),
+            history_cache=ChatHistoryCache.from_config(self.config),
+        )
+        # 商品信息入口，XianyuGraph 的 get_item_details 工具也通过它查询
+        self.item_store = configure_item_store(ItemStore.from_config(
+            self.config,
+            self.context_manager,
+            fetch=lambda item_id: asyncio.to_thread(self.xianyu.get_item_info, item_id),
+        ))
         
         # 加载行为调整配置
         behavior_config = self.config.get("behavior_tuning", {})
         delays = behavior_config.get("delays", {})
         self.reply_min_secs = delays.get("reply_min_secs", 2.0)
         self.reply_max_secs = delays.get("reply_max_secs", 5.0)
+        # 单条消息从收到到发出首条回复的时限
+        self.deadline_policy = DeadlinePolicy.from_config(self.config)
 
     async def initialize(self):
         await self.context_manager._init_db()
@@ -394,7 +421,8 @@ class XianyuLive:
                 logger.debug(f"原始消息: {message}")
                 return
 
-            # 处理聊天消息
+            # 处理聊天消息，回复时限从此刻开始计算
+            deadline = self.deadline_policy.new_deadline()
             create_time = int(message["1"]["5"])
             send_user_name = message["1"]["10"]["reminderTitle"]
             send_user_id = message["1"]["10"]["senderUserId"]
@@ -443,29 +471,39 @@ class XianyuLive:
             if self.is_system_message(message):
                 logger.debug("系统消息，跳过处理")
                 return
-            # 从数据库中获取商品信息，如果不存在则从API获取并保存
-            item_info = await self.context_manager.get_item_info(item_id)
-            if not item_info:
-                logger.info(f"从API获取商品信息: {item_id}")
-                api_result = self.xianyu.get_item_info(item_id)
-                if 'data' in api_result and 'itemDO' in api_result['data']:
-                    item_info = api_result['data']['itemDO']
-                    # 保存商品信息到数据库
-                    await self.context_manager.save_item_info(item_id, item_info)
-                else:
-                    logger.warning(f"获取商品信息失败: {api_result}")
-                    return
+            # 商品信息、最后交互的商品、对话历史与议价次数在一个读事务中取出
+            turn = await self.context_manager.load_turn_context(chat_id, item_id)
+            item_info = turn.item_info
+            timed_out = False
+            if item_info:
+                self.item_store.prime(item_id, item_info)
             else:
-                logger.info(f"从数据库获取商品信息: {item_id}")
+                # 数据库中没有该商品时从API获取并保存
+                try:
+                    if deadline is None:
+                        item_info = await self.item_store.get(item_id)
+                    else:
+                        # 接口请求在线程中读取该阶段的子时限，重试不会超出预算
+                        with deadline_scope(deadline.child("item_lookup")):
+                            item_info = await deadline.run("item_lookup", self.item_store.get(item_id))
+                except DeadlineExceeded as e:
+                    logger.warning(f"会话 {chat_id} {e}")
+                    item_info, timed_out = None, True
+            if not item_info:
+                logger.warning(f"获取商品信息失败: {item_id}")
+                if timed_out or (deadline is not None and deadline.expired):
+                    await self._send_fallback(websocket, chat_id, send_user_id, send_user_name, item_id, send_message)
+                return
                 
             item_description = f"{item_info['desc']};当前商品售卖价格为:{str(item_info['soldPrice'])}"
             
             # --- 上下文切换检测 ---
-            last_item_id = await self.context_manager.get_last_item_id(chat_id)
+            last_item_id = turn.last_item_id
             context_switched = last_item_id is not None and last_item_id != item_id
             
-            # 获取特定于该商品的对话上下文
-            context = await self.context_manager.get_context_for_item(chat_id, item_id)
+            # 特定于该商品的对话上下文
+            context = turn.messages
+            bargain_count = turn.bargain_count
 
             # 如果是第一次咨询，记录事件
             if not context:
@@ -477,39 +515,101 @@ class XianyuLive:
                 context.insert(0, {"role": "system", "content": "[系统提示] 用户刚刚切换到了一个新的商品进行咨询。"})
             
             # --- 生成回复 ---
-            bot_reply = self.bot.generate_reply(
-                send_message,
-                item_info, # 传递完整的商品信息对象
-                context=context
-            )
-            
-            # 检查是否为价格意图，如果是则增加对应商品的议价次数
-            if self.bot.last_intent == "price":
-                await self.context_manager.increment_bargain_count_for_item(chat_id, item_id)
-                bargain_count = await self.context_manager.get_bargain_count_for_item(chat_id, item_id)
-                logger.info(f"用户 {send_user_name} 对商品 {item_id} 的议价次数: {bargain_count}")
-            
-            # 添加机器人回复到上下文
-            await self.context_manager.add_message_by_chat(chat_id, self.myid, item_id, "assistant", bot_reply)
+            engine = self.engines.select(self.myid, chat_id)
+
+            async def generate():
+                with usage_context(chat_id=chat_id, item_id=item_id):
+                    return await engine.generate(
+                        send_message,
+                        item_info, # 传递完整的商品信息对象
+                        context,
+                        chat_id=chat_id,
+                        item_id=item_id,
+                        bargain_count=bargain_count,
+                    )
+
+            if deadline is None:
+                bot_reply, intent = await generate()
+            else:
+                deferred = self.deadline_policy.fallback == "deferred"
+                extra = self.deadline_policy.deferred_grace_secs if deferred else 0.0
+                # 任务创建时复制当前上下文，引擎内部（包括线程中的大模型调用）看到的是该阶段的子时限
+                with deadline_scope(deadline.child("generate", extra)):
+                    task = asyncio.ensure_future(generate())
+                try:
+                    bot_reply, intent = await deadline.run("generate", asyncio.shield(task))
+                except Exception as e:
+                    # 超时或大模型调用失败都不能让买家得不到回复
+                    logger.warning(f"会话 {chat_id} 回复生成未完成({e})，已耗时 {deadline.elapsed():.1f} 秒，发送兜底回复")
+                    await self._send_fallback(websocket, chat_id, send_user_id, send_user_name, item_id, send_message,
+                                              engine)
+                    if deferred and not task.done():
+                        asyncio.create_task(self._deliver_deferred(
+                            task, websocket, chat_id, send_user_id, send_user_name, item_id, send_message,
+                            bargain_count))
+                    else:
+                        task.cancel()
+                    return
 
-            # 更新会话状态，记录最后交互的商品ID
-            await self.context_manager.update_last_item_id(chat_id, item_id)
-            
-            # --- 模拟思考延迟 ---
-            reply_delay = random.uniform(self.reply_min_secs, self.reply_max_secs)
-            logger.info(f"模拟思考，延迟 {reply_delay:.2f} 秒后发送回复...")
-            await asyncio.sleep(reply_delay)
-            # ---------------------
-
-            logger.info(f"机器人回复: {bot_reply}")
-            # 记录对话
-            log_daily_conversation(chat_id, send_user_name, item_id, send_message, bot_reply)
-            await self.send_msg(websocket, chat_id, send_user_id, bot_reply)
+            await self._finish_reply(websocket, chat_id, send_user_id, send_user_name, item_id, send_message,
+                                     bot_reply, intent, deadline, bargain_count)
             
         except Exception as e:
             logger.error(f"处理消息时发生错误: {str(e)}")
             logger.debug(f"原始消息: {message_data}")
 
+    async def _send_fallback(self, websocket, chat_id, send_user_id, send_user_name, item_id, send_message,
+                             engine=None):
+        """按规则能识别的意图发送兜底回复，并记入上下文"""
+        intent = (engine or self.engines.select(self.myid, chat_id)).rule_intent(send_message)
+        reply = self.deadline_policy.canned_reply(intent)
+        await self.context_manager.add_message_by_chat(chat_id, self.myid, item_id, "assistant", reply)
+        log_daily_conversation(chat_id, send_user_name, item_id, send_message, reply)
+        await self.send_msg(websocket, chat_id, send_user_id, reply)
+
+    async def _deliver_deferred(self, task, websocket, chat_id, send_user_id, send_user_name, item_id, send_message,
+                                bargain_count):
+        """兜底回复发出后，真正的回复在宽限期内完成则补发"""
+        try:
+            bot_reply, intent = await asyncio.wait_for(task, timeout=self.deadline_policy.deferred_grace_secs)
+        except Exception as e:
+            logger.warning(f"会话 {chat_id} 的延迟回复未能完成: {e}")
+            return
+        logger.info(f"会话 {chat_id} 补发延迟回复")
+        await self._finish_reply(websocket, chat_id, send_user_id, send_user_name, item_id, send_message,
+                                 bot_reply, intent, None, bargain_count)
+
+    async def _finish_reply(self, websocket, chat_id, send_user_id, send_user_name, item_id, send_message,
+                            bot_reply, intent, deadline, bargain_count):
+        """更新议价次数与上下文，模拟思考延迟后发送回复"""
+        # 检查是否为价格意图，如果是则增加对应商品的议价次数
+        if intent == "price":
+            await self.context_manager.increment_bargain_count_for_item(chat_id, item_id)
+            logger.info(f"用户 {send_user_name} 对商品 {item_id} 的议价次数: {bargain_count + 1}")
+
+        # 添加机器人回复到上下文
+        await self.context_manager.add_message_by_chat(chat_id, self.myid, item_id, "assistant", bot_reply)
+
+        # 更新会话状态，记录最后交互的商品ID
+        await self.context_manager.update_last_item_id(chat_id, item_id)
+
+        # 将移出最近窗口的消息合并进滚动摘要
+        await self.context_manager.update_summary(chat_id, item_id)
+
+        # --- 模拟思考延迟 ---
+        reply_delay = random.uniform(self.reply_min_secs, self.reply_max_secs)
+        if deadline is not None:
+            # 思考延迟同样计入回复时限
+            reply_delay = min(reply_delay, deadline.remaining())
+        logger.info(f"模拟思考，延迟 {reply_delay:.2f} 秒后发送回复...")
+        await asyncio.sleep(reply_delay)
+        # ---------------------
+
+        logger.info(f"机器人回复: {bot_reply}")
+        # 记录对话
+        log_daily_conversation(chat_id, send_user_name, item_id, send_message, bot_reply)
+        await self.send_msg(websocket, chat_id, send_user_id, bot_reply)
+
     async def send_heartbeat(self, ws):
         """发送心跳包并等待响应"""
         try:
@@ -690,9 +790,21 @@ async def main():
     
     # 初始化数据库
     await xianyuLive.initialize()
+
+    # 后台监视提示词与规则配置的变化，回复路径上不再读取磁盘
+    watch_interval = xianyuLive.config.get("prompt_registry", {}).get("watch_interval_secs", 2.0)
+    prompt_watch_task = asyncio.create_task(bot.prompts.watch(watch_interval))
     
     # 常驻进程
-    await xianyuLive.main()
+    try:
+        await xianyuLive.main()
+    finally:
+        prompt_watch_task.cancel()
+        try:
+            await prompt_watch_task
+        except asyncio.CancelledError:
+            pass
+        await xianyuLive.context_manager.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,179 @@
+import asyncio
+import os
+import string
+from typing import Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+# 提示词模板中的占位符在静态指令里替换为对应信息块的标题，具体取值放在后续消息中，
+# 使系统提示词在每次调用间字节级一致，便于服务端前缀缓存命中
+FIELD_LABELS = {
+    'item_desc': '商品信息',
+    'product_name': '商品名称',
+    'original_price': '原价',
+    'context': '对话历史',
+    'user_offer_price': '买家出价',
+    'bargain_count': '议价次数',
+    'search_results': '网络搜索结果',
+    'bargain_decision': '议价决定',
+}
+
+DEFAULT_PROMPT_NAMES = ("classify", "price", "tech", "default", "router")
+
+
+def render_static_prompt(template: str) -> str:
+    """将模板中的占位符替换为信息块标题，得到与具体对话无关的静态指令"""
+    fields = {name for _, name, _, _ in string.Formatter().parse(template) if name}
+    try:
+        return template.format(**{name: f"【{FIELD_LABELS.get(name, name)}】" for name in fields})
+    except (IndexError, KeyError, ValueError):
+        return template
+
+
+class PromptTemplate:
+    """预解析的提示词模板"""
+
+    __slots__ = ("name", "text", "static", "fields", "mtime")
+
+    def __init__(self, name: str, text: str, mtime: float = 0.0):
+        self.name = name
+        self.text = text
+        self.static = render_static_prompt(text)
+        try:
+            self.fields = frozenset(f for _, f, _, _ in string.Formatter().parse(text) if f)
+        except ValueError:
+            self.fields = frozenset()
+        self.mtime = mtime
+
+
+class PromptRegistry:
+    """
+    提示词注册表
+
+    启动时一次性读取并预解析 prompts/ 下的模板，之后回复路径上只做内存查找。
+    后台任务按修改时间检测文件变化，重新加载后整体替换模板字典并通知订阅者，
+    读者总是看到一份完整的新模板集或旧模板集。
+    """
+
+    def __init__(self, prompt_dir: str = "prompts", names=DEFAULT_PROMPT_NAMES):
+        self.prompt_dir = prompt_dir
+        self.names = tuple(names)
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._listeners: List[Callable[[], None]] = []
+        # 额外监视的文件: path -> (mtime, callback)
+        self._watched_files: Dict[str, Tuple[Optional[float], Callable[[], None]]] = {}
+        self.load_all()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.prompt_dir, f"{name}_prompt.txt")
+
+    def _read(self, name: str) -> Optional[PromptTemplate]:
+        path = self._path(name)
+        try:
+            mtime = os.path.getmtime(path)
+            with open(path, "r", encoding="utf-8") as f:
+                return PromptTemplate(name, f.read(), mtime)
+        except FileNotFoundError:
+            logger.warning(f"提示词文件不存在: {path}")
+        except Exception as e:
+            logger.error(f"加载提示词 {path} 时出错: {e}")
+        return None
+
+    def load_all(self):
+        """重新读取全部模板并整体替换"""
+        templates = {}
+        for name in self.names:
+            template = self._read(name)
+            if template is not None:
+                templates[name] = template
+        self._templates = templates
+        logger.info(f"已加载提示词: {', '.join(sorted(templates))}")
+
+    def get(self, name: str) -> Optional[PromptTemplate]:
+        return self._templates.get(name)
+
+    def text(self, name: str) -> str:
+        template = self._templates.get(name)
+        return template.text if template else ""
+
+    def static(self, name: str) -> str:
+        template = self._templates.get(name)
+        return template.static if template else ""
+
+    def add_listener(self, callback: Callable[[], None]):
+        """模板变化后回调，用于重建依赖模板的对象"""
+        self._listeners.append(callback)
+
+    def watch_file(self, path: str, callback: Callable[[], None]):
+        """顺带监视一个非提示词文件（如 config.json），变化时回调"""
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+        self._watched_files[path] = (mtime, callback)
+
+    def refresh(self) -> bool:
+        """
+        检查文件修改时间，只重新加载发生变化的模板
+
+        Returns:
+            bool: 是否有模板被替换
+        """
+        templates = dict(self._templates)
+        changed = []
+        for name in self.names:
+            try:
+                mtime = os.path.getmtime(self._path(name))
+            except OSError:
+                continue
+            current = templates.get(name)
+            if current is None or current.mtime != mtime:
+                template = self._read(name)
+                if template is not None:
+                    templates[name] = template
+                    changed.append(name)
+
+        if changed:
+            self._templates = templates
+            logger.info(f"提示词已热更新: {', '.join(changed)}")
+            for callback in self._listeners:
+                try:
+                    callback()
+                except Exception as e:
+                    logger.error(f"提示词更新回调出错: {e}")
+
+        for path, (mtime, callback) in list(self._watched_files.items()):
+            try:
+                new_mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if new_mtime != mtime:
+                self._watched_files[path] = (new_mtime, callback)
+                try:
+                    callback()
+                except Exception as e:
+                    logger.error(f"文件 {path} 更新回调出错: {e}")
+
+        return bool(changed)
+
+    async def watch(self, interval: float = 2.0):
+        """后台轮询任务，文件状态检查放到线程中执行，不阻塞事件循环"""
+        while True:
+            try:
+                await asyncio.sleep(interval)
+                await asyncio.to_thread(self.refresh)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"提示词监视任务出错: {e}")
+
+
+_default_registry: Optional[PromptRegistry] = None
+
+
+def get_prompt_registry() -> PromptRegistry:
+    """进程内共享的提示词注册表"""
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = PromptRegistry()
+    return _default_registry
@@ -0,0 +1,152 @@
+import asyncio
+import re
+import zlib
+from typing import Dict, List, NamedTuple, Optional
+
+from loguru import logger
+
+ENGINE_NAMES = ("bot", "graph")
+
+
+class ReplyResult(NamedTuple):
+    reply: str
+    intent: Optional[str]
+
+
+def bargain_count_from_context(context: List[Dict]) -> int:
+    """读取 ChatContextManager 注入上下文的议价次数"""
+    for msg in context:
+        if msg.get('role') == 'system' and '议价次数' in msg.get('content', ''):
+            match = re.search(r'议价次数[:：]\s*(\d+)', msg['content'])
+            if match:
+                return int(match.group(1))
+    return 0
+
+
+class ReplyEngine:
+    """
+    回复引擎接口
+
+    generate 为协程，在调用方的上下文中执行：回复时限、用量统计等 contextvar 会随之传入引擎内部。
+    """
+
+    name = "base"
+
+    async def generate(self, user_msg: str, item_info: Dict, context: List[Dict], *,
+                       chat_id: str, item_id: str, bargain_count: Optional[int] = None) -> ReplyResult:
+        """bargain_count 为 None 时从上下文中的议价次数系统消息读取（get_context_for_item 的格式）"""
+        raise NotImplementedError
+
+    def rule_intent(self, user_msg: str) -> Optional[str]:
+        """不调用大模型就能判断的意图，用于选择超时兜底回复"""
+        return None
+
+
+class BotEngine(ReplyEngine):
+    """XianyuReplyBot：规则与分类器路由到各Agent，同步调用放到线程中执行"""
+
+    name = "bot"
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def generate(self, user_msg, item_info, context, *, chat_id, item_id, bargain_count=None) -> ReplyResult:
+        def run():
+            reply = self.bot.generate_reply(user_msg, item_info, context=context, bargain_count=bargain_count,
+                                            chat_id=chat_id)
+            # 意图按会话保存，其他会话在其他线程中的生成不会覆盖它
+            return ReplyResult(reply, self.bot.chat_state(chat_id).last_intent)
+
+        return await asyncio.to_thread(run)
+
+    def rule_intent(self, user_msg: str) -> Optional[str]:
+        return self.bot.router.detect_by_rules(user_msg, None)
+
+
+class GraphEngine(ReplyEngine):
+    """
+    XianyuGraph：大模型路由加工具调用的图
+
+    启用检查点时图自行按会话保存历史，每轮只传入新消息；未启用时由传入的上下文构造历史。
+    """
+
+    name = "graph"
+
+    def __init__(self, graph=None, config_path: str = "config.json"):
+        self._graph = graph
+        self.config_path = config_path
+
+    @property
+    def graph(self):
+        if self._graph is None:
+            # 延迟导入：只在实际选中图引擎时才需要构建模型客户端与图
+            from XianyuGraph import get_graph
+            self._graph = get_graph(self.config_path)
+        return self._graph
+
+    async def generate(self, user_msg, item_info, context, *, chat_id, item_id, bargain_count=None) -> ReplyResult:
+        from langchain_core.messages import AIMessage, HumanMessage
+        from XianyuGraph import thread_config
+
+        graph = self.graph
+        state = {
+            "user_message": user_msg,
+            "item_id": str(item_id),
+            "item_description": f"{item_info.get('desc', '')};当前商品售卖价格为:{item_info.get('soldPrice', '')}",
+            "bargain_count": bargain_count if bargain_count is not None else bargain_count_from_context(context),
+            "final_reply": "",
+            "chat_history": [],
+        }
+        if graph.checkpointer is None:
+            state["chat_history"] = [
+                HumanMessage(content=msg['content']) if msg['role'] == 'user' else AIMessage(content=msg['content'])
+                for msg in context if msg.get('role') in ('user', 'assistant')
+            ]
+            result = await graph.ainvoke(state)
+        else:
+            result = await graph.ainvoke(state, thread_config(chat_id))
+        return ReplyResult(result["final_reply"], result.get("intent"))
+
+
+class EngineSelector:
+    """
+    按账号或会话比例选择回复引擎
+
+    账号单独指定优先；否则按会话ID的哈希把 graph_percentage% 的会话分给图引擎，同一会话始终落在同一引擎。
+    """
+
+    def __init__(self, engines: Dict[str, ReplyEngine], default: str = "bot",
+                 accounts: Optional[Dict[str, str]] = None, graph_percentage: float = 0.0):
+        for name in [default, *(accounts or {}).values()]:
+            if name not in ENGINE_NAMES:
+                raise ValueError(f"未知的回复引擎: {name}")
+        self.engines = engines
+        self.default = default
+        self.accounts = {str(k): v for k, v in (accounts or {}).items()}
+        self.graph_percentage = graph_percentage
+        self.counts: Dict[str, int] = {}
+
+    @classmethod
+    def from_config(cls, config: Dict, engines: Dict[str, ReplyEngine]) -> "EngineSelector":
+        section = config.get("reply_engine") or {}
+        return cls(
+            engines,
+            default=section.get("default", "bot"),
+            accounts=section.get("accounts"),
+            graph_percentage=section.get("graph_percentage", 0.0),
+        )
+
+    def engine_name(self, account_id: str, chat_id: str) -> str:
+        name = self.accounts.get(str(account_id))
+        if name is None:
+            bucket = zlib.crc32(str(chat_id).encode("utf-8")) % 100
+            name = "graph" if bucket < self.graph_percentage else self.default
+        return name
+
+    def select(self, account_id: str, chat_id: str) -> ReplyEngine:
+        name = self.engine_name(account_id, chat_id)
+        if name not in self.engines:
+            logger.warning(f"回复引擎 {name} 不可用，使用 {self.default}")
+            name = self.default
+        self.counts[name] = self.counts.get(name, 0) + 1
+        return self.engines[name]
@@ -0,0 +1,225 @@
+import json
+import unicodedata
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Union
+
+from loguru import logger
+
+from utils.aho_corasick import AhoCorasick
+
+DEFAULT_REPLACEMENT = "[安全提醒]请通过平台沟通"
+
+# 规范词 -> 变体写法；变体与规范词命中时都按规范词上报
+DEFAULT_BLOCKED_PHRASES: Dict[str, List[str]] = {
+    "微信": ["v信", "vx", "wx", "weixin", "wechat"],
+    "QQ": ["扣扣", "企鹅号"],
+    "支付宝": ["zfb", "alipay"],
+    "银行卡": ["银行账号", "银行账户"],
+    "线下": [],
+}
+
+# 逐字符替换的形近/音近字，替换后再参与匹配
+DEFAULT_HOMOGLYPHS: Dict[str, str] = {
+    "薇": "微",
+    "徾": "微",
+    "寶": "宝",
+    "銀": "银",
+    "線": "线",
+    "綫": "线",
+}
+
+# 插在敏感词中间用于规避匹配的分隔符
+SEPARATORS = frozenset(" \t\r\n　-_.·•*~|/\\+#=、'\"`^")
+# 手机号常见的分段写法（138-1234-5678、138 1234 5678）使用的分隔符，其余分隔符在数字之间时视为断开，
+# 不会把日期、分辨率拼成长数字串
+DIGIT_JOINERS = frozenset(" \t　-_－—")
+# 数字之间连续超过这么多个分段分隔符时不再视为同一串
+MAX_DIGIT_GAP = 3
+# 分段的数字串至少要有手机号的长度才算联系方式，避免把以空格分隔的几个价格、数量拼在一起误判
+PHONE_DIGITS = 11
+
+DIGITS = frozenset("0123456789")
+ASCII_LETTERS = frozenset("abcdefghijklmnopqrstuvwxyz")
+
+
+class SafetyFilter:
+    """
+    回复内容安全过滤
+
+    文本先逐字符规范化（全角半角统一、大小写统一、去除分隔符与零宽字符、形近字替换），
+    再由 Aho-Corasick 自动机单次扫描匹配全部敏感词，耗时只与文本长度相关，与规则数量无关。
+    规范化按字符独立进行，因此同一套逻辑既可检查完整回复，也可增量检查流式输出。
+    以英文字母开头或结尾的词（vx、wechat 等）要求该侧不紧邻其他英文字母，
+    避免去掉空格后在普通英文里误命中（如 new xbox 中的 wx）。
+    """
+
+    def __init__(
+        self,
+        phrases: Union[Dict[str, Iterable[str]], Iterable[str]] = None,
+        homoglyphs: Optional[Dict[str, str]] = None,
+        min_digit_run: int = 0,
+        replacement: str = DEFAULT_REPLACEMENT,
+    ):
+        """
+        Args:
+            phrases: 规范词到变体列表的映射，或规范词列表
+            homoglyphs: 逐字符替换表
+            min_digit_run: 连续数字达到该长度即视为联系方式（手机号、QQ号），0表示不检测；
+                以空格、短横线分段的数字串按 max(min_digit_run, PHONE_DIGITS) 判断
+            replacement: 命中时替换整条回复的文本
+        """
+        if phrases is None:
+            phrases = DEFAULT_BLOCKED_PHRASES
+        if not isinstance(phrases, dict):
+            phrases = {phrase: [] for phrase in phrases}
+        self.homoglyphs = dict(DEFAULT_HOMOGLYPHS if homoglyphs is None else homoglyphs)
+        self.min_digit_run = min_digit_run
+        self.min_joined_run = max(min_digit_run, PHONE_DIGITS) if min_digit_run else 0
+        self.replacement = replacement
+        # 每个实例各自缓存，替换表不同的实例互不影响
+        self._normalize_char = lru_cache(maxsize=8192)(self._normalize_char_uncached)
+
+        patterns = []
+        for canonical, variants in phrases.items():
+            for variant in (canonical, *variants):
+                normalized = self.normalize(variant)
+                if normalized:
+                    patterns.append((normalized, canonical))
+        self.automaton = AhoCorasick(patterns)
+        self.max_pattern_len = max((len(p) for p, _ in patterns), default=0)
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "SafetyFilter":
+        section = config.get("safety_filter") or {}
+        return cls(
+            phrases=section.get("phrases"),
+            homoglyphs=section.get("homoglyphs"),
+            min_digit_run=section.get("min_digit_run", 0),
+            replacement=section.get("replacement", DEFAULT_REPLACEMENT),
+        )
+
+    def _normalize_char_uncached(self, ch: str) -> str:
+        if ch in SEPARATORS or unicodedata.category(ch) == "Cf":
+            return ""
+        folded = unicodedata.normalize("NFKC", ch).lower()
+        return "".join(self.homoglyphs.get(c, c) for c in folded if c not in SEPARATORS and not c.isspace())
+
+    def normalize(self, text: str) -> str:
+        return "".join(self._normalize_char(ch) for ch in text)
+
+    def scanner(self) -> "SafetyScanner":
+        return SafetyScanner(self)
+
+    def find(self, text: str) -> Optional[str]:
+        """返回命中的规范词（连续数字命中时为'数字串'），未命中返回None"""
+        scanner = self.scanner()
+        return scanner.feed(text) or scanner.close()
+
+    def is_blocked(self, text: str) -> bool:
+        return self.find(text) is not None
+
+    def apply(self, text: str) -> str:
+        """命中时返回替换文本，否则原样返回"""
+        hit = self.find(text)
+        if hit is None:
+            return text
+        logger.warning(f"回复命中敏感内容({hit})，已替换: {text}")
+        return self.replacement
+
+
+class SafetyScanner:
+    """
+    流式检查器
+
+    逐块喂入模型输出，跨块保留自动机状态与连续数字计数，敏感词被拆在两个块之间也能命中。
+    一旦命中即保持命中状态，调用方应停止发送后续内容。以英文字母结尾的词要看到下一个字符才能确认，
+    输出结束时调用 close()。
+    """
+
+    def __init__(self, safety_filter: SafetyFilter):
+        self._filter = safety_filter
+        self._state = 0
+        self._digit_run = 0
+        # 跨分段分隔符累计的数字个数，以及当前连续的分隔符个数
+        self._joined_run = 0
+        self._gap = 0
+        # 最近的规范化字符，用于检查匹配起点之前是否紧邻英文字母
+        self._recent: deque = deque(maxlen=safety_filter.max_pattern_len + 1)
+        # 已匹配、等待确认其后不紧跟英文字母的词
+        self._pending: Optional[str] = None
+        self.hit: Optional[str] = None
+
+    @property
+    def blocked(self) -> bool:
+        return self.hit is not None
+
+    def feed(self, chunk: str) -> Optional[str]:
+        if self.hit is not None:
+            return self.hit
+        automaton = self._filter.automaton
+        normalize_char = self._filter._normalize_char
+        min_digit_run = self._filter.min_digit_run
+        min_joined_run = self._filter.min_joined_run
+        recent = self._recent
+        state, digit_run, joined_run, gap = self._state, self._digit_run, self._joined_run, self._gap
+        for raw in chunk:
+            normalized = normalize_char(raw)
+            if not normalized and unicodedata.category(raw) != "Cf":
+                # 可见的分隔符断开连续数字；空格、短横线分段时仍累计到分段数字串，零宽字符都不断开
+                digit_run = 0
+                gap += 1
+                if raw not in DIGIT_JOINERS or gap > MAX_DIGIT_GAP:
+                    joined_run = 0
+            for ch in normalized:
+                if self._pending is not None:
+                    if ch not in ASCII_LETTERS:
+                        self.hit = self._pending
+                        return self.hit
+                    self._pending = None
+                if min_digit_run:
+                    if ch in DIGITS:
+                        digit_run, joined_run, gap = digit_run + 1, joined_run + 1, 0
+                    else:
+                        digit_run = joined_run = 0
+                    if digit_run >= min_digit_run or joined_run >= min_joined_run:
+                        self.hit = "数字串"
+                        return self.hit
+                recent.append(ch)
+                state, outputs = automaton.step(state, ch)
+                for pattern, canonical in outputs:
+                    before = len(recent) - len(pattern) - 1
+                    if pattern[0] in ASCII_LETTERS and before >= 0 and recent[before] in ASCII_LETTERS:
+                        continue
+                    if pattern[-1] in ASCII_LETTERS:
+                        self._pending = self._pending or canonical
+                        continue
+                    self.hit = canonical
+                    return self.hit
+        self._state, self._digit_run, self._joined_run, self._gap = state, digit_run, joined_run, gap
+        return None
+
+    def close(self) -> Optional[str]:
+        """输出结束：确认末尾等待中的匹配"""
+        if self.hit is None and self._pending is not None:
+            self.hit = self._pending
+        return self.hit
+
+
+_shared_filter: Optional[SafetyFilter] = None
+
+
+def get_safety_filter(config_path: str = "config.json") -> SafetyFilter:
+    """进程内共享的过滤器，按 config.json 的 safety_filter 段构建"""
+    global _shared_filter
+    if _shared_filter is None:
+        try:
+            with open(config_path, "r", encoding="utf-8") as f:
+                config = json.load(f)
+        except FileNotFoundError:
+            config = {}
+        except Exception as e:
+            logger.error(f"加载安全过滤配置时出错: {e}")
+            config = {}
+        _shared_filter = SafetyFilter.from_config(config)
+    return _shared_filter
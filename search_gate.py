@@ -0,0 +1,112 @@
+import re
+import threading
+import unicodedata
+from typing import Dict, Iterable, List, NamedTuple
+
+# 买家询问的是这件二手商品本身的状况，只能由商品描述或卖家回答，联网搜索没有帮助
+DEFAULT_LOCAL_KEYWORDS = (
+    "几成新", "成色", "划痕", "磕碰", "瑕疵", "磨损", "掉漆", "拆修", "维修过", "进水",
+    "用了多久", "用多久", "买了多久", "发票", "包装", "配件", "发货", "包邮", "自提", "还在吗",
+)
+
+# 询问型号参数、对比、兼容性等通用知识，商品描述通常不会写全
+DEFAULT_SPEC_KEYWORDS = (
+    "参数", "配置", "型号", "处理器", "芯片", "内存", "存储", "续航", "电池容量", "屏幕尺寸", "分辨率",
+    "刷新率", "跑分", "像素", "重量", "尺寸", "功率", "兼容", "支持", "区别", "对比", "哪个好",
+    "发布", "上市", "系统版本", "接口", "协议",
+)
+
+# 计算覆盖度前去掉的疑问语气与虚词
+_FILLER_RE = re.compile(r"请问|是不是|有没有|能不能|可不可以|可以|怎么样|多少|什么|这个|那个|一下|吗|呢|吧|啊|呀|的|了|是|有|么")
+_TERM_RE = re.compile(r"[a-z0-9]+|[\u4e00-\u9fa5]+")
+
+
+class GateDecision(NamedTuple):
+    """是否需要联网搜索的判断结果"""
+    search: bool
+    reason: str
+    coverage: float
+
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def question_terms(user_msg: str) -> List[str]:
+    """提取问题中的关键词：英文数字整词保留，中文按二元组切分"""
+    text = _FILLER_RE.sub(" ", _normalize(user_msg))
+    terms = []
+    for token in _TERM_RE.findall(text):
+        if token.isascii() or len(token) < 2:
+            if len(token) > 1:
+                terms.append(token)
+            continue
+        terms.extend(token[i:i + 2] for i in range(len(token) - 1))
+    return terms
+
+
+class SearchGate:
+    """
+    技术咨询的联网搜索门控
+
+    先看问题是否只涉及商品自身状况（成色、划痕等），再计算问题关键词在商品标题和描述中的覆盖度，
+    只有询问型号参数且描述覆盖不足时才联网搜索。判断只做字符串匹配，耗时可以忽略。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        min_coverage: float = 0.6,
+        local_keywords: Iterable[str] = DEFAULT_LOCAL_KEYWORDS,
+        spec_keywords: Iterable[str] = DEFAULT_SPEC_KEYWORDS,
+    ):
+        self.enabled = enabled
+        self.min_coverage = min_coverage
+        self.local_keywords = tuple(_normalize(k) for k in local_keywords)
+        self.spec_keywords = tuple(_normalize(k) for k in spec_keywords)
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "SearchGate":
+        section = config.get("search_gate") or {}
+        return cls(
+            enabled=section.get("enabled", True),
+            min_coverage=section.get("min_coverage", 0.6),
+            local_keywords=section.get("local_keywords", DEFAULT_LOCAL_KEYWORDS),
+            spec_keywords=section.get("spec_keywords", DEFAULT_SPEC_KEYWORDS),
+        )
+
+    def decide(self, user_msg: str, item_desc: str = "", title: str = "") -> GateDecision:
+        decision = self._decide(user_msg, item_desc, title)
+        with self._lock:
+            self.counts[decision.reason] = self.counts.get(decision.reason, 0) + 1
+        return decision
+
+    def _decide(self, user_msg: str, item_desc: str, title: str) -> GateDecision:
+        if not self.enabled:
+            return GateDecision(True, "disabled", 0.0)
+
+        question = _normalize(user_msg)
+        if any(k in question for k in self.local_keywords):
+            return GateDecision(False, "item_condition", 1.0)
+
+        terms = question_terms(user_msg)
+        known = _normalize(f"{title} {item_desc}")
+        coverage = sum(term in known for term in terms) / len(terms) if terms else 1.0
+        if coverage >= self.min_coverage:
+            return GateDecision(False, "covered_by_desc", coverage)
+        if any(k in question for k in self.spec_keywords):
+            return GateDecision(True, "spec_not_in_desc", coverage)
+        return GateDecision(False, "general", coverage)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts = dict(self.counts)
+        total = sum(counts.values())
+        searched = counts.get("spec_not_in_desc", 0) + counts.get("disabled", 0)
+        return {
+            "decisions": total,
+            "search_rate": round(searched / total, 3) if total else 0.0,
+            "by_reason": counts,
+        }
@@ -0,0 +1,117 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+from loguru import logger
+
+SPECULATION_POLICIES = ("default", "last_intent", "local_classifier")
+
+
+class SpeculationStats:
+    """推测执行的命中统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.attempts = 0
+        self.hits = 0
+        self.by_intent: Dict[str, Dict[str, int]] = {}
+
+    def record(self, predicted: str, actual: str):
+        hit = predicted == actual
+        with self._lock:
+            self.attempts += 1
+            self.hits += hit
+            bucket = self.by_intent.setdefault(predicted, {"attempts": 0, "hits": 0})
+            bucket["attempts"] += 1
+            bucket["hits"] += hit
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.attempts if self.attempts else 0.0
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "attempts": self.attempts,
+                "hits": self.hits,
+                "hit_rate": round(self.hit_rate, 3),
+                "by_intent": {k: dict(v) for k, v in self.by_intent.items()},
+            }
+
+
+class SpeculativeExecutor:
+    """
+    意图分类与回复生成的推测并行执行
+
+    规则未命中时，分类请求与按策略预测出的Agent同时发出；分类结果与预测一致则直接采用
+    推测结果，否则放弃推测结果并按实际意图重新生成。命中时省掉一次串行的大模型往返。
+    """
+
+    def __init__(self, enabled: bool = False, policy: str = "default", intents=("default", "tech", "price"),
+                 max_workers: int = 8):
+        if policy not in SPECULATION_POLICIES:
+            raise ValueError(f"未知的推测策略: {policy}")
+        self.enabled = enabled
+        self.policy = policy
+        self.intents = tuple(intents)
+        self.stats = SpeculationStats()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculation")
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "SpeculativeExecutor":
+        section = config.get("speculation") or {}
+        return cls(
+            enabled=section.get("enabled", False),
+            policy=section.get("policy", "default"),
+            intents=section.get("intents", ("default", "tech", "price")),
+        )
+
+    def predict(self, last_intent: Optional[str], local_classifier=None, user_msg: str = "") -> Optional[str]:
+        """按策略预测最可能的意图，预测结果不在可推测范围内时返回None"""
+        if self.policy == "last_intent":
+            predicted = last_intent if last_intent in self.intents else "default"
+        elif self.policy == "local_classifier" and local_classifier is not None:
+            # 置信度不足以直接采用，但作为推测依据仍然比固定猜测准确
+            predicted = local_classifier.predict(user_msg)[0]
+        else:
+            predicted = "default"
+        return predicted if predicted in self.intents else None
+
+    def _submit(self, fn, *args, **kwargs):
+        # 每个任务使用独立的上下文副本，保留调用方的 contextvars（如会话ID）
+        return self._executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+    def run(
+        self,
+        predicted: str,
+        classify: Callable[[], str],
+        generate: Callable[[str], str],
+    ) -> Tuple[str, str]:
+        """
+        并行执行分类与推测生成
+
+        Args:
+            predicted: 预测的意图
+            classify: 返回实际意图的分类函数
+            generate: 根据意图生成回复的函数
+
+        Returns:
+            tuple: (实际意图, 回复)
+        """
+        speculative = self._submit(generate, predicted)
+        try:
+            actual = classify()
+        except Exception:
+            speculative.cancel()
+            raise
+
+        self.stats.record(predicted, actual)
+        if actual == predicted:
+            logger.debug(f"推测命中: {predicted}，命中率 {self.stats.hit_rate:.1%}")
+            return actual, speculative.result()
+
+        # 同步客户端的请求无法中途终止，这里取消未开始的任务并丢弃已发出请求的结果
+        speculative.cancel()
+        logger.debug(f"推测未命中: 预测 {predicted}，实际 {actual}，命中率 {self.stats.hit_rate:.1%}")
+        return actual, generate(actual)
@@ -0,0 +1,68 @@
+import sqlite3
+
+import pytest
+from openai import OpenAI
+
+from agent_profiles import AgentProfile
+from llm_usage import configure_usage_recorder, get_usage_recorder
+from utils.mock_llm_server import MockLLMServer
+from XianyuAgent import ClassifyAgent, DefaultAgent, PriceAgent
+
+
+@pytest.fixture
+def server(tmp_path):
+    configure_usage_recorder({"llm_usage": {"db_path": str(tmp_path / "usage.db")}})
+    with MockLLMServer(reply="price") as mock:
+        yield mock
+
+
+def _client(server):
+    return OpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+
+
+def test_profile_overrides_defaults():
+    profile = AgentProfile.from_dict({"model": "qwen-turbo", "max_tokens": 8, "unknown": 1})
+    params = profile.request_params()
+    assert params["model"] == "qwen-turbo"
+    assert params["max_tokens"] == 8
+    assert params["temperature"] == 0.4
+    assert "stop" not in params and "timeout" not in params
+    assert profile.request_params(temperature=0.9)["temperature"] == 0.9
+
+
+def test_agents_send_their_profile(server):
+    classify = ClassifyAgent(_client(server), "分类", lambda x: x,
+                             {"model": "qwen-turbo", "max_tokens": 8, "temperature": 0.0, "stop": ["\n"]})
+    assert classify.generate(user_msg="能便宜点吗", item_desc="", context=[]) == "price"
+    body = server.requests[-1]
+    assert (body["model"], body["max_tokens"], body["temperature"], body["stop"]) == ("qwen-turbo", 8, 0.0, ["\n"])
+
+    # 议价Agent的动态温度优先于配置
+    price = PriceAgent(_client(server), "议价", lambda x: x, {"model": "qwen-max", "temperature": 0.1})
+    price.generate(user_msg="100出吗", item_desc="", context=[], bargain_count=2)
+    assert server.requests[-1]["model"] == "qwen-max"
+    assert server.requests[-1]["temperature"] == pytest.approx(0.6)
+
+    # 未配置时保持原有参数
+    DefaultAgent(_client(server), "默认", lambda x: x).generate(user_msg="在吗", item_desc="", context=[])
+    assert server.requests[-1]["max_tokens"] == 500
+    assert server.requests[-1]["temperature"] == 0.7
+
+
+def test_batch_classification_widens_output_budget(server):
+    server.reply = '["price","default","tech"]'
+    classify = ClassifyAgent(_client(server), "分类", lambda x: x, {"max_tokens": 8, "stop": ["\n"]})
+    assert classify.generate_batch(["便宜点", "在吗", "内存多大"]) == ["price", "default", "tech"]
+    assert server.requests[-1]["max_tokens"] == 36
+    assert "stop" not in server.requests[-1]
+
+
+def test_batch_usage_is_recorded_per_chat(server, tmp_path):
+    server.reply = '["price","default"]'
+    classify = ClassifyAgent(_client(server), "分类", lambda x: x)
+    classify.generate_batch(["便宜点", "在吗"], [{"chat_id": "c1", "item_id": "i1"}, {"chat_id": "c2"}])
+    get_usage_recorder().flush()
+    with sqlite3.connect(tmp_path / "usage.db") as conn:
+        rows = conn.execute("SELECT chat_id, item_id, prompt_tokens FROM llm_calls ORDER BY id").fetchall()
+    assert [(chat, item) for chat, item, _ in rows] == [("c1", "i1"), ("c2", None)]
+    assert sum(tokens for _, _, tokens in rows) == server.prompt_tokens
@@ -0,0 +1,87 @@
+import pytest
+
+from bargain_engine import BargainEngine, parse_offer
+
+
+@pytest.fixture
+def engine():
+    return BargainEngine(floor_pct=0.88, schedule=(0.03, 0.06, 0.08, 0.10), decline_below_pct=0.5)
+
+
+@pytest.mark.parametrize("offer, count, action, price", [
+    (0, 0, "llm", None),
+    (1200, 0, "accept", 1000),
+    (980, 0, "accept", 980),
+    (900, 0, "counter", 970),
+    (900, 1, "counter", 940),
+    (900, 3, "accept", 900),
+    (890, 3, "final", 900),
+    (850, 3, "final", 900),
+    (850, 9, "final", 900),
+    (300, 0, "decline", 970),
+])
+def test_decisions_follow_schedule_and_floor(engine, offer, count, action, price):
+    decision = engine.decide("i1", 1000, offer, count)
+    assert (decision.action, decision.price) == (action, price)
+
+
+def test_counter_never_below_offer_or_floor(engine):
+    for count in range(6):
+        for offer in range(500, 1000, 7):
+            decision = engine.decide(None, 999, offer, count)
+            if decision.action in ("counter", "final"):
+                assert decision.price > offer
+                assert decision.price >= 999 * 0.88
+
+
+def test_per_item_floor_overrides_percentage():
+    engine = BargainEngine.from_config({"bargaining": {"items": {"123": {"floor_price": 950, "schedule": [0.02]}}}})
+    assert engine.decide(123, 1000, 900, 5) == engine.decide("123", 1000, 900, 5)
+    assert engine.decide("123", 1000, 900, 5).price == 980
+    assert engine.decide("other", 1000, 900, 5).price == 900
+
+
+def test_render_is_deterministic(engine):
+    decision = engine.decide("i1", 1000, 900, 0)
+    first = engine.render(decision, "罗技鼠标", 0)
+    assert first == engine.render(decision, "罗技鼠标", 0)
+    assert "970" in first
+
+
+@pytest.mark.parametrize("message, offer", [
+    ("900元行吗", 900),
+    ("能少50元吗", 950),
+    ("便宜100块可以吗", 900),
+    ("少个30", 970),
+    ("9折可以吗", 900),
+    ("原价1000元，850元卖吗", 850),
+    ("买的时候1200元，现在900元出吗", 900),
+    ("便宜点800元卖吗", 800),
+    ("能便宜点吗", 0),
+    # “最少/至少”后面是买家的报价，不是让价
+    ("最少800元能卖吗", 800),
+    ("至少800", 800),
+    ("至少800元", 800),
+    ("多少钱能卖", 0),
+    # 多件打包的总价不是单件出价
+    ("两个一起200元", 0),
+    ("3件300元包邮吗", 0),
+    # 两个不同的报价无法确定买家的出价
+    ("1000元的东西850元卖吗", 0),
+])
+def test_parse_offer(message, offer):
+    assert parse_offer(message, 1000) == offer
+
+
+@pytest.mark.parametrize("message, action, price", [
+    ("能少50元吗", "counter", 970),
+    ("便宜20块吧", "accept", 980),
+    ("原价1000元，850元卖吗", "counter", 970),
+    ("最少800元能卖吗", "counter", 970),
+    ("两个一起200元", "llm", None),
+    # 低得不合理的出价多半是解析错了，交给大模型
+    ("100元卖不卖", "llm", None),
+])
+def test_discount_phrasing_is_decided_against_list_price(engine, message, action, price):
+    decision = engine.decide("i1", 1000, parse_offer(message, 1000), 0)
+    assert (decision.action, decision.price) == (action, price)
@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+from classify_batcher import ClassifyBatcher
+from llm_usage import current_usage_context, usage_context, usage_context_in
+from utils.deadline import Deadline, DeadlineExceeded, current_deadline, deadline_scope
+
+
+def test_concurrent_requests_share_one_batch():
+    calls = []
+
+    def classify_batch(messages, contexts):
+        calls.append(list(messages))
+        return ["price" if "元" in m else "default" for m in messages]
+
+    batcher = ClassifyBatcher(classify_batch, window_ms=50, max_batch=16)
+    results = {}
+    threads = [
+        threading.Thread(target=lambda i=i: results.__setitem__(i, batcher.classify(f"{i}元" if i % 2 else "在吗", timeout=2)))
+        for i in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == {i: ("price" if i % 2 else "default") for i in range(8)}
+    assert len(calls) == 1
+    assert batcher.stats()["avg_batch_size"] == 8
+
+
+def test_mismatched_batch_result_yields_none():
+    batcher = ClassifyBatcher(lambda messages, contexts: [], window_ms=1)
+    assert batcher.classify("在吗", timeout=2) is None
+
+
+def test_batch_carries_each_callers_context():
+    seen = {}
+
+    def classify_batch(messages, contexts):
+        seen["chats"] = [usage_context_in(ctx).get("chat_id") for ctx in contexts]
+        seen["deadline"] = current_deadline()
+        return ["default"] * len(messages)
+
+    batcher = ClassifyBatcher(classify_batch, window_ms=50)
+    tight, loose = Deadline(5.0), Deadline(30.0)
+
+    def ask(chat_id, deadline):
+        with usage_context(chat_id=chat_id), deadline_scope(deadline):
+            batcher.classify("在吗")
+
+    threads = [threading.Thread(target=ask, args=args) for args in (("c1", loose), ("c2", tight))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(seen["chats"]) == ["c1", "c2"]
+    # 批次在时限最紧的请求的上下文中执行
+    assert seen["deadline"] is tight
+    assert current_usage_context() == {}
+
+
+def test_wait_is_bounded_by_reply_deadline():
+    batcher = ClassifyBatcher(lambda messages, contexts: time.sleep(1) or ["default"], window_ms=1)
+    start = time.perf_counter()
+    with deadline_scope(Deadline(0.1)), pytest.raises(Exception):
+        batcher.classify("在吗")
+    assert time.perf_counter() - start < 0.5
+
+
+def test_expired_requests_are_not_batched():
+    calls = []
+    batcher = ClassifyBatcher(lambda messages, contexts: calls.append(messages) or ["default"], window_ms=1)
+    with deadline_scope(Deadline(0.0)):
+        future = batcher.submit("在吗")
+    with pytest.raises(DeadlineExceeded):
+        future.result(timeout=2)
+    assert calls == []
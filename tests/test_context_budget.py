@@ -0,0 +1,25 @@
+from context_budget import SUMMARY_PREFIX, ContextBudget, estimate_tokens, fold_summary
+
+
+def test_estimate_tokens_counts_cjk_per_char():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("你好") == 2
+    assert estimate_tokens("abcdefgh") == 2
+
+
+def test_fold_summary_keeps_offers_and_respects_budget():
+    summary = ""
+    for i in range(20):
+        summary = fold_summary(summary, [("user", f"第{i}次出价，{500 + i}元卖吗"), ("assistant", "不行哦")], max_tokens=80)
+        assert estimate_tokens(summary) <= 80
+    assert summary.startswith("报价记录:")
+    assert "买家519" in summary.splitlines()[0]
+
+
+def test_context_budget_keeps_summary_and_newest_messages():
+    context = [{"role": "system", "content": f"{SUMMARY_PREFIX} 买家: 问过发货"}]
+    context += [{"role": "user", "content": f"消息{i}" * 10} for i in range(50)]
+    summary, recent = ContextBudget({"price": 100}).select(context, "price")
+    assert summary == "买家: 问过发货"
+    assert recent and recent[-1]["content"] == "消息49" * 10
+    assert sum(estimate_tokens(m["content"]) for m in recent) + estimate_tokens(summary) <= 100
@@ -0,0 +1,153 @@
+import asyncio
+import sqlite3
+
+from context_manager import ChatContextManager, TurnContext
+from utils.sqlite_pool import SqlitePool
+from utils.write_behind import WriteBehindQueue
+
+ITEM = {"itemId": "i1", "title": "雅马哈功放 A-S501", "desc": "九成新", "soldPrice": "1800"}
+
+
+def _manager(tmp_path, readers=3):
+    db_path = str(tmp_path / "chat.db")
+    pool = SqlitePool(db_path, readers=readers)
+    return ChatContextManager(db_path=db_path, recent_turns=2, pool=pool,
+                              write_behind=WriteBehindQueue(pool, flush_interval_ms=10_000))
+
+
+def _count(db_path, sql):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(sql).fetchone()[0]
+
+
+def test_load_turn_context(tmp_path):
+    manager = _manager(tmp_path)
+
+    async def main():
+        await manager._init_db()
+        await manager.save_item_info("i1", ITEM)
+        await manager.add_message_by_chat("c1", "u1", "i0", "user", "另一个商品")
+        await manager.update_last_item_id("c1", "i0")
+        await manager.add_message_by_chat("c1", "u1", "i1", "user", "能便宜点吗")
+        await manager.add_message_by_chat("c1", "s1", "i1", "assistant", "最低1700")
+        await manager.increment_bargain_count_for_item("c1", "i1")
+        await manager.increment_bargain_count_for_item("c1", "i1")
+        # 排队中的写入在读取前提交
+        turn = await manager.load_turn_context("c1", "i1")
+        missing = await manager.load_turn_context("c2", "i9")
+        await manager.close()
+        return turn, missing
+
+    turn, missing = asyncio.run(main())
+    assert turn.item_info == ITEM
+    assert turn.last_item_id == "i0"
+    assert turn.bargain_count == 2
+    # 议价次数不再混入对话历史
+    assert turn.messages == [
+        {"role": "user", "content": "能便宜点吗"},
+        {"role": "assistant", "content": "最低1700"},
+    ]
+    assert missing == TurnContext(None, None, [], 0)
+
+
+def test_load_turn_context_uses_one_read_transaction(tmp_path):
+    manager = _manager(tmp_path, readers=1)
+    statements = []
+
+    async def main():
+        await manager._init_db()
+        async with manager.pool.reader() as conn:
+            await conn.set_trace_callback(statements.append)
+        await manager.load_turn_context("c1", "i1")
+        await manager.close()
+
+    asyncio.run(main())
+    assert statements[0] == "BEGIN"
+    assert sum(s.strip().startswith("SELECT") for s in statements) == 5
+    assert statements[-1] == "COMMIT"
+
+
+def test_messages_get_per_chat_seq_and_are_trimmed_in_batches(tmp_path):
+    db_path = str(tmp_path / "chat.db")
+    manager = ChatContextManager(db_path=db_path, max_history=5, trim_margin=3, recent_turns=0)
+
+    async def main():
+        await manager._init_db()
+        sizes = []
+        for i in range(20):
+            await manager.add_message_by_chat("c1", "u", "i1", "user", f"消息{i}")
+            await manager.add_message_by_chat("c2", "u", "i1", "user", f"消息{i}")
+            sizes.append(_count(db_path, "SELECT COUNT(*) FROM messages WHERE chat_id = 'c1'"))
+        context = await manager.get_context_for_item("c1", "i1")
+        await manager.close()
+        return sizes, context
+
+    sizes, context = asyncio.run(main())
+    # 消息数到 max_history + trim_margin 时才裁剪，数量不超过 max_history + trim_margin - 1
+    assert max(sizes) == 7
+    assert sizes[7] == 5  # 第8条时裁剪到 max_history
+    assert [m["content"] for m in context] == [f"消息{i}" for i in range(15, 20)]
+    with sqlite3.connect(db_path) as conn:
+        seqs = [r[0] for r in conn.execute("SELECT seq FROM messages WHERE chat_id = 'c2' ORDER BY id")]
+    assert seqs == list(range(16, 21))
+
+
+def test_trim_still_fires_when_one_batch_holds_several_writes_for_a_chat(tmp_path):
+    db_path = str(tmp_path / "chat.db")
+    pool = SqlitePool(db_path)
+    manager = ChatContextManager(db_path=db_path, max_history=5, trim_margin=3, recent_turns=0, pool=pool,
+                                 write_behind=WriteBehindQueue(pool, flush_interval_ms=10_000))
+
+    async def main():
+        await manager._init_db()
+        sizes = []
+        for turn in range(10):
+            # 买家消息与回复在同一批提交，批内所有插入先于删除执行
+            await manager.add_message_by_chat("c1", "u", "i1", "user", f"买家{turn}")
+            await manager.add_message_by_chat("c1", "s", "i1", "assistant", f"卖家{turn}")
+            await manager.flush()
+            sizes.append(_count(db_path, "SELECT COUNT(*) FROM messages WHERE chat_id = 'c1'"))
+        await manager.close()
+        return sizes
+
+    sizes = asyncio.run(main())
+    # 与逐条提交时相同的上限：max_history + trim_margin - 1
+    assert max(sizes) == 7
+
+
+def test_existing_messages_get_seq_on_migration(tmp_path):
+    db_path = str(tmp_path / "chat.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(
+            "CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, "
+            "item_id TEXT NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, "
+            "timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, chat_id TEXT)"
+        )
+        for chat_id, content in [("c1", "a"), ("c2", "b"), ("c1", "c")]:
+            conn.execute("INSERT INTO messages (user_id, item_id, role, content, chat_id) VALUES ('u', 'i1', 'user', ?, ?)",
+                         (content, chat_id))
+    manager = ChatContextManager(db_path=db_path)
+
+    async def main():
+        await manager._init_db()
+        await manager.add_message_by_chat("c1", "u", "i1", "user", "d")
+        await manager.close()
+
+    asyncio.run(main())
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("SELECT chat_id, content, seq FROM messages ORDER BY id").fetchall()
+    assert rows == [("c1", "a", 1), ("c2", "b", 1), ("c1", "c", 2), ("c1", "d", 3)]
+
+
+def test_message_queries_use_indexes_without_sorting(tmp_path):
+    manager = ChatContextManager(db_path=str(tmp_path / "chat.db"))
+    asyncio.run(manager._init_db())
+    asyncio.run(manager.close())
+    with sqlite3.connect(manager.db_path) as conn:
+        plan = " ".join(row[-1] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT role, content FROM messages WHERE chat_id = ? AND item_id = ? "
+            "ORDER BY seq DESC LIMIT ?", ("c1", "i1", 12)))
+        max_seq = " ".join(row[-1] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT MAX(seq) FROM messages WHERE chat_id = ?", ("c1",)))
+    assert "idx_chat_item_seq" in plan and "TEMP B-TREE" not in plan
+    assert "idx_chat_seq" in max_seq
@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+import pytest
+
+from utils.deadline import (
+    Deadline,
+    DeadlineExceeded,
+    DeadlinePolicy,
+    current_deadline,
+    deadline_scope,
+    remaining_or,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_budget_is_capped_by_remaining_time():
+    clock = FakeClock()
+    deadline = Deadline(10, {"generate": 8, "classify": 3}, clock)
+    assert deadline.budget("classify") == 3
+    assert deadline.budget("unknown") == 10
+    clock.now += 5
+    assert deadline.budget("generate") == 5
+    clock.now += 6
+    assert deadline.expired
+    with pytest.raises(DeadlineExceeded):
+        deadline.check("generate")
+
+
+def test_child_deadline_uses_stage_budget():
+    clock = FakeClock()
+    child = Deadline(10, {"generate": 4}, clock).child("generate", extra_secs=2)
+    assert child.remaining() == 6
+
+
+def test_run_raises_deadline_exceeded():
+    async def main():
+        deadline = Deadline(5, {"item_lookup": 0.05})
+        with pytest.raises(DeadlineExceeded) as exc:
+            await deadline.run("item_lookup", asyncio.sleep(1))
+        assert exc.value.stage == "item_lookup"
+        assert await deadline.run("generate", asyncio.sleep(0, result="ok")) == "ok"
+
+    asyncio.run(main())
+
+
+def test_remaining_or_without_and_with_deadline():
+    assert remaining_or(10) == 10
+    clock = FakeClock()
+    deadline = Deadline(3, clock=clock)
+    with deadline_scope(deadline):
+        assert remaining_or(10) == 3
+        clock.now += 5
+        assert remaining_or(10) == 0.05
+    assert current_deadline() is None
+
+
+def test_thread_sees_stage_deadline():
+    def work():
+        return current_deadline().remaining()
+
+    async def main():
+        deadline = Deadline(10, {"classify": 2})
+        return await deadline.run_in_thread("classify", work)
+
+    assert 0 < asyncio.run(main()) <= 2
+
+
+def test_thread_timeout_does_not_wait_for_blocking_call():
+    async def main():
+        deadline = Deadline(10, {"generate": 0.05})
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            await deadline.run_in_thread("generate", time.sleep, 0.3)
+        return time.monotonic() - started
+
+    assert asyncio.run(main()) < 0.25
+
+
+def test_policy_from_config():
+    policy = DeadlinePolicy.from_config({
+        "reply_deadline": {
+            "total_secs": 8,
+            "stages": {"generate": 6},
+            "fallback": "deferred",
+            "canned_replies": {"price": "稍等~"},
+        }
+    })
+    assert policy.stage_budgets["generate"] == 6
+    assert policy.stage_budgets["item_lookup"] == 4
+    assert policy.canned_reply("price") == "稍等~"
+    assert policy.canned_reply("no_reply") == policy.canned_replies["default"]
+    assert policy.canned_reply(None) == policy.canned_replies["default"]
+    assert policy.new_deadline().remaining() <= 8
+
+
+def test_disabled_policy_and_unknown_fallback():
+    assert DeadlinePolicy(enabled=False).new_deadline() is None
+    with pytest.raises(ValueError):
+        DeadlinePolicy(fallback="retry")
@@ -0,0 +1,94 @@
+import asyncio
+import sqlite3
+from typing import Annotated, TypedDict
+
+import pytest
+
+pytest.importorskip("langgraph")
+pytest.importorskip("langchain_openai")
+
+from langchain_core.messages import AIMessage, HumanMessage  # noqa: E402
+from langgraph.graph import END, StateGraph  # noqa: E402
+
+from graph_checkpoint import SqliteCheckpointSaver  # noqa: E402
+from XianyuGraph import HISTORY_TURNS, window_history  # noqa: E402
+
+
+class State(TypedDict):
+    message: str
+    item: str
+    history: Annotated[list, window_history]
+
+
+async def echo(state: State):
+    return {"history": [HumanMessage(content=state["message"]), AIMessage(content=f"回复:{state['message']}")]}
+
+
+def _contents(history):
+    return [m.content for m in history]
+
+
+def _graph(saver):
+    graph = StateGraph(State)
+    graph.add_node("echo", echo)
+    graph.set_entry_point("echo")
+    graph.add_edge("echo", END)
+    return graph.compile(checkpointer=saver)
+
+
+def _turn(graph, chat_id, message):
+    return asyncio.run(graph.ainvoke(
+        {"message": message, "item": "雅马哈功放"},
+        {"configurable": {"thread_id": chat_id}},
+    ))
+
+
+def test_history_accumulates_per_thread_and_survives_restart(tmp_path):
+    db = str(tmp_path / "chat.db")
+    graph = _graph(SqliteCheckpointSaver(db))
+    _turn(graph, "chat_a", "在吗")
+    _turn(graph, "chat_b", "多少钱")
+    result = _turn(graph, "chat_a", "功率多大")
+    assert _contents(result["history"]) == ["在吗", "回复:在吗", "功率多大", "回复:功率多大"]
+
+    # 新进程（新的存储实例）从数据库恢复
+    restarted = _graph(SqliteCheckpointSaver(db))
+    result = _turn(restarted, "chat_b", "包邮吗")
+    assert _contents(result["history"]) == ["多少钱", "回复:多少钱", "包邮吗", "回复:包邮吗"]
+
+
+def test_unchanged_channels_are_stored_once(tmp_path):
+    db = str(tmp_path / "chat.db")
+    graph = _graph(SqliteCheckpointSaver(db))
+    for _ in range(3):
+        _turn(graph, "chat_a", "同一句话")
+    with sqlite3.connect(db) as conn:
+        item_versions = conn.execute("SELECT COUNT(*) FROM graph_blobs WHERE channel = 'item'").fetchone()[0]
+        checkpoints = conn.execute("SELECT COUNT(*) FROM graph_checkpoints").fetchone()[0]
+    # 商品描述每轮只随输入写入一次，不随每个检查点重复保存
+    assert item_versions == 3
+    assert checkpoints > item_versions
+
+
+def test_old_checkpoints_are_pruned(tmp_path):
+    db = str(tmp_path / "chat.db")
+    saver = SqliteCheckpointSaver(db, keep_last=2)
+    graph = _graph(saver)
+    for i in range(10):
+        _turn(graph, "chat_a", f"消息{i}")
+    with sqlite3.connect(db) as conn:
+        count = conn.execute("SELECT COUNT(*) FROM graph_checkpoints").fetchone()[0]
+    assert count <= 4
+    state = saver.get_tuple({"configurable": {"thread_id": "chat_a"}}).checkpoint["channel_values"]
+    # 状态本身也有上限：最近几轮原文加一条摘要
+    assert len(state["history"]) == 2 * HISTORY_TURNS + 1
+    assert "消息0" in state["history"][0].content
+    assert len(list(saver.list({"configurable": {"thread_id": "chat_a"}}))) == count
+
+
+def test_delete_thread(tmp_path):
+    saver = SqliteCheckpointSaver(str(tmp_path / "chat.db"))
+    graph = _graph(saver)
+    _turn(graph, "chat_a", "在吗")
+    saver.delete_thread("chat_a")
+    assert saver.get_tuple({"configurable": {"thread_id": "chat_a"}}) is None
@@ -0,0 +1,158 @@
+import asyncio
+import sqlite3
+from contextlib import asynccontextmanager
+
+from context_manager import ChatContextManager
+from history_cache import ChatHistoryCache
+from utils.sqlite_pool import SqlitePool
+from utils.write_behind import WriteBehindQueue
+
+
+def _manager(tmp_path, cache=None, readers=3, summarizer=None):
+    db_path = str(tmp_path / "chat.db")
+    pool = SqlitePool(db_path, readers=readers)
+    return ChatContextManager(db_path=db_path, recent_turns=2, pool=pool, summarizer=summarizer,
+                              write_behind=WriteBehindQueue(pool, flush_interval_ms=10_000),
+                              history_cache=cache or ChatHistoryCache())
+
+
+async def _turn(manager, chat_id, item_id, n):
+    await manager.add_message_by_chat(chat_id, "u", item_id, "user", f"买家{n}")
+    await manager.load_turn_context(chat_id, item_id)
+    await manager.increment_bargain_count_for_item(chat_id, item_id)
+    await manager.get_bargain_count_for_item(chat_id, item_id)
+    await manager.get_last_item_id(chat_id)
+    await manager.add_message_by_chat(chat_id, "s", item_id, "assistant", f"卖家{n}")
+    await manager.update_last_item_id(chat_id, item_id)
+    await manager.update_summary(chat_id, item_id)
+
+
+def test_hot_chat_needs_no_reads(tmp_path):
+    manager = _manager(tmp_path, readers=1)
+    statements = []
+
+    async def main():
+        await manager._init_db()
+        await _turn(manager, "c1", "i1", 0)
+        async with manager.pool.reader() as conn:
+            await conn.set_trace_callback(statements.append)
+        for n in range(1, 4):
+            await _turn(manager, "c1", "i1", n)
+        turn = await manager.load_turn_context("c1", "i1")
+        await manager.close()
+        return turn
+
+    turn = asyncio.run(main())
+    assert statements == []
+    assert turn.bargain_count == 4
+    assert turn.last_item_id == "i1"
+    assert [m["content"] for m in turn.messages if m["role"] != "system"] == ["买家2", "卖家2", "买家3", "卖家3"]
+    assert manager.history.stats()["hits"] == 4
+
+
+def test_cache_matches_database_after_writes(tmp_path):
+    def summarize(summary, messages, max_tokens):
+        return (summary + " " + " ".join(content for _, content in messages)).strip()
+
+    cached = _manager(tmp_path, summarizer=summarize)
+
+    async def main():
+        await cached._init_db()
+        for n in range(6):
+            await _turn(cached, "c1", "i1", n)
+        await cached.update_last_item_id("c1", "i2")
+        hot = await cached.load_turn_context("c1", "i1")
+        await cached.flush()
+        cached.history.invalidate("c1")
+        cold = await cached.load_turn_context("c1", "i1")
+        await cached.close()
+        return hot, cold
+
+    hot, cold = asyncio.run(main())
+    assert hot.messages[0]["role"] == "system"
+    assert (hot.last_item_id, hot.messages, hot.bargain_count) == (cold.last_item_id, cold.messages, cold.bargain_count)
+
+
+def test_load_racing_a_write_is_not_cached(tmp_path):
+    manager = _manager(tmp_path)
+
+    async def main():
+        await manager._init_db()
+        token = manager.history.begin_load("c1")
+        await manager.add_message_by_chat("c1", "u", "i1", "user", "在吗")
+        manager.history.finish_load("c1", token, "i1", None, [], "", 0, 0, 4)
+        cached = manager.history.peek("c1", "i1")
+        await manager.close()
+        return cached
+
+    assert asyncio.run(main()) is None
+
+
+def test_load_during_in_flight_flush_caches_committed_history(tmp_path):
+    manager = _manager(tmp_path)
+    pool = manager.pool
+    writer = pool.writer
+    gate = asyncio.Event()
+
+    @asynccontextmanager
+    async def held_writer():
+        await gate.wait()
+        async with writer() as conn:
+            yield conn
+
+    async def main():
+        await manager._init_db()
+        await _turn(manager, "c1", "i1", 0)
+        await manager.flush()
+        manager.history.invalidate("c1")
+        pool.writer = held_writer
+        await manager.add_message_by_chat("c1", "u", "i1", "user", "买家1")
+        flush = asyncio.ensure_future(manager.flush())
+        try:
+            await asyncio.sleep(0.01)
+            # 写入已出队、事务尚未提交时开始加载
+            load = asyncio.ensure_future(manager.load_turn_context("c1", "i1"))
+            await asyncio.sleep(0.01)
+        finally:
+            gate.set()
+        await flush
+        turn = await load
+        cached = manager.history.peek("c1", "i1")
+        await manager.close()
+        return turn, cached
+
+    turn, cached = asyncio.run(main())
+    assert [m["content"] for m in turn.messages if m["role"] != "system"] == ["买家0", "卖家0", "买家1"]
+    assert cached is not None and list(cached.messages)[-1] == ("user", "买家1")
+
+
+def test_memory_cap_evicts_least_recent_chats():
+    cache = ChatHistoryCache(max_bytes=4096)
+    for n in range(10):
+        token = cache.begin_load(f"c{n}")
+        cache.finish_load(f"c{n}", token, "i1", "i1", [("user", "x" * 200)] * 4, "", 0, 4, 4)
+    cache.get("c0", "i1")
+
+    stats = cache.stats()
+    assert stats["bytes"] <= 4096
+    assert stats["evictions"] == 10 - stats["chats"]
+    assert cache.peek("c9", "i1") is not None
+    assert stats["misses"] == 1
+
+
+def test_failed_write_drops_cached_chat(tmp_path):
+    manager = _manager(tmp_path)
+
+    async def main():
+        await manager._init_db()
+        await _turn(manager, "c1", "i1", 0)
+        await manager.flush()
+        with sqlite3.connect(manager.db_path) as conn:
+            conn.execute("DROP TABLE chat_item_bargain_counts")
+        await manager.increment_bargain_count_for_item("c1", "i1")
+        await manager.flush()
+        cached = manager.history.peek_chat("c1")
+        await manager.close()
+        return cached
+
+    assert asyncio.run(main()) is None
@@ -0,0 +1,59 @@
+import threading
+
+from intent_classifier import NaiveBayesIntentClassifier, normalize_label
+
+SAMPLES = [
+    ("最低多少钱", "price"),
+    ("能便宜点吗", "price"),
+    ("500元可以吗", "price"),
+    ("再少一点吧", "price"),
+    ("支持蓝牙吗", "tech"),
+    ("输出功率多大", "tech"),
+    ("支持哪些接口", "tech"),
+    ("内存多大", "tech"),
+    ("在吗", "default"),
+    ("今天能发货吗", "default"),
+    ("包邮吗", "default"),
+    ("发什么快递", "default"),
+]
+
+
+def test_naive_bayes_learns_char_ngrams():
+    model = NaiveBayesIntentClassifier().fit(SAMPLES)
+    assert model.predict("最低能便宜多少")[0] == "price"
+    assert model.predict("支持蓝牙5.0吗")[0] == "tech"
+    assert model.predict("明天能发货吗")[0] == "default"
+    assert abs(sum(model.predict_proba("随便问问").values()) - 1.0) < 1e-9
+
+
+def test_model_round_trips_through_json(tmp_path):
+    model = NaiveBayesIntentClassifier().fit(SAMPLES)
+    path = str(tmp_path / "model.json")
+    model.save(path)
+    loaded = NaiveBayesIntentClassifier.load(path)
+    assert loaded.predict_proba("包邮吗") == model.predict_proba("包邮吗")
+
+
+def test_normalize_label():
+    assert normalize_label(" Price\n") == "price"
+    assert normalize_label("`tech`") == "tech"
+    assert normalize_label("我觉得是价格") is None
+
+
+def test_intent_labels_are_written_off_the_calling_thread(tmp_path, monkeypatch):
+    from utils import reporting_utils
+
+    monkeypatch.chdir(tmp_path)
+    opened_on = []
+    real_open = open
+
+    def tracking_open(*args, **kwargs):
+        opened_on.append(threading.current_thread().name)
+        return real_open(*args, **kwargs)
+
+    monkeypatch.setattr("builtins.open", tracking_open)
+    reporting_utils.log_intent_label("能便宜点吗", "price")
+    reporting_utils.log_intent_label("几成新", "tech")
+    assert opened_on == []
+    assert reporting_utils.load_intent_labels() == {"能便宜点吗": "price", "几成新": "tech"}
+    assert "jsonl-log-writer" in opened_on
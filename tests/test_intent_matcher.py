@@ -0,0 +1,57 @@
+import json
+import os
+
+import pytest
+
+from intent_matcher import IntentMatcher, IntentRuleSource
+from utils.aho_corasick import AhoCorasick
+
+
+def test_aho_corasick_finds_overlapping_matches():
+    automaton = AhoCorasick([("he", 1), ("she", 2), ("hers", 3)])
+    matches = sorted((start, end, term) for start, end, term, _ in automaton.iter_matches("ushers"))
+    assert matches == [(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")]
+
+
+@pytest.mark.parametrize("user_msg, last_intent, expected", [
+    ("老板，这台功放800元卖不卖？", None, "price"),
+    ("请问有什么参数？能便宜吗", None, "tech"),
+    ("我要3个，能便宜点吗", None, "propose_discount"),
+    ("好的", "propose_discount", "confirm_discount"),
+    ("好的", "price", None),
+    ("你吃饭了吗？", None, None),
+])
+def test_best_intent_keeps_rule_priority(user_msg, last_intent, expected):
+    assert IntentMatcher().best_intent(user_msg, last_intent) == expected
+
+
+def test_match_returns_all_intents_with_positions():
+    grouped = IntentMatcher().matched_intents("和天龙比，500元行吗")
+    assert set(grouped) == {"tech", "price", "confirm_discount"}
+    price = grouped["price"][0]
+    # 位置基于清洗后的文本 "和天龙比500元行吗"
+    assert (price.start, price.end, price.term) == (4, 8, "500元")
+
+
+def test_patterns_matching_at_the_same_position_are_all_reported():
+    matcher = IntentMatcher({
+        "propose_discount": {"keywords": [], "patterns": [r"\d+个"]},
+        "price": {"keywords": [], "patterns": [r"\d+"]},
+    })
+    matches = matcher.match("3个多少")
+    assert {(m.intent, m.start, m.term) for m in matches} == {("propose_discount", 0, "3个"), ("price", 0, "3")}
+    assert set(matcher.matched_intents("3个多少")) == {"propose_discount", "price"}
+
+
+def test_rule_source_reloads_only_when_config_changes(tmp_path):
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({"intent_rules": {"rules": {"tech": {"keywords": ["参数"], "patterns": []}}}}))
+    source = IntentRuleSource(str(config_path))
+    matcher = source.load()
+    assert matcher.best_intent("多少钱") is None
+    assert not source.changed()
+
+    config_path.write_text(json.dumps({"intent_rules": {"rules": {"price": {"keywords": ["钱"], "patterns": []}}}}))
+    os.utime(config_path, (0, 12345))
+    assert source.changed()
+    assert source.load().best_intent("多少钱") == "price"
@@ -0,0 +1,123 @@
+import asyncio
+import json
+
+import pytest
+
+from item_store import ItemStore, configure_item_store, parse_item_attributes
+
+ITEM = {
+    "itemId": "1001",
+    "title": "雅马哈功放 A-S501",
+    "desc": "九成新，功率：85W，声道: 2.0，无拆修",
+    "soldPrice": "1800",
+    "cpvLabels": [{"propertyName": "品牌", "valueName": "Yamaha/雅马哈"}],
+}
+
+
+class FakeContextManager:
+    def __init__(self, items=None):
+        self.items = dict(items or {})
+        self.saved = []
+
+    async def get_item_info(self, item_id):
+        return self.items.get(item_id)
+
+    async def save_item_info(self, item_id, item_data):
+        self.items[item_id] = item_data
+        self.saved.append(item_id)
+
+
+def make_fetch(latency=0.05, result=None):
+    calls = []
+
+    async def fetch(item_id):
+        calls.append(item_id)
+        await asyncio.sleep(latency)
+        return result if result is not None else {"data": {"itemDO": ITEM}}
+
+    return fetch, calls
+
+
+def test_parse_item_attributes():
+    attributes = parse_item_attributes(ITEM)
+    assert attributes["功率"] == "85W"
+    assert attributes["声道"] == "2.0"
+    assert attributes["品牌"] == "Yamaha/雅马哈"
+
+
+def test_concurrent_misses_fetch_once_and_save():
+    fetch, calls = make_fetch()
+    context = FakeContextManager()
+    store = ItemStore(context, fetch)
+
+    async def main():
+        return await asyncio.gather(*(store.get("1001") for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert all(r["title"] == ITEM["title"] for r in results)
+    assert calls == ["1001"]
+    assert context.saved == ["1001"]
+    assert store.stats()["coalesced"] == 4
+
+
+def test_memory_then_database_hits():
+    fetch, calls = make_fetch()
+    store = ItemStore(FakeContextManager({"1001": ITEM}), fetch)
+
+    async def main():
+        await store.get("1001")
+        await store.get("1001")
+
+    asyncio.run(main())
+    assert calls == []
+    assert store.stats()["db_hits"] == 1
+    assert store.stats()["hits"] == 1
+
+
+def test_failed_fetch_returns_none_and_is_not_cached():
+    fetch, calls = make_fetch(result={"error": "获取商品信息失败"})
+    store = ItemStore(FakeContextManager(), fetch)
+
+    async def main():
+        assert await store.get("1001") is None
+        assert await store.get("1001") is None
+
+    asyncio.run(main())
+    assert len(calls) == 2
+
+
+def test_cancelled_caller_does_not_cancel_fetch():
+    fetch, calls = make_fetch(latency=0.1)
+    store = ItemStore(FakeContextManager(), fetch)
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(store.get("1001"), timeout=0.02)
+        return await store.get("1001")
+
+    assert asyncio.run(main())["title"] == ITEM["title"]
+    assert calls == ["1001"]
+
+
+def test_lru_eviction():
+    items = {str(i): dict(ITEM, itemId=str(i)) for i in range(3)}
+    store = ItemStore(FakeContextManager(items), max_entries=2)
+
+    async def main():
+        for item_id in ("0", "1", "0", "2"):
+            await store.get(item_id)
+
+    asyncio.run(main())
+    assert list(store._cache) == ["0", "2"]
+
+
+def test_graph_tool_reads_store():
+    pytest.importorskip("langgraph")
+    from XianyuGraph import get_item_details
+
+    configure_item_store(ItemStore(FakeContextManager({"1001": ITEM})))
+    details = json.loads(asyncio.run(get_item_details.ainvoke({"item_id": "1001"})))
+    assert details["attributes"]["功率"] == "85W"
+    assert details["price"] == "1800"
+    missing = json.loads(asyncio.run(get_item_details.ainvoke({"item_id": "404"})))
+    assert missing == {"error": "Item not found"}
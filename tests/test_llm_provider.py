@@ -0,0 +1,118 @@
+import time
+
+import pytest
+from openai import BadRequestError, OpenAI
+
+from llm_provider import Endpoint, ProviderPool
+from utils.mock_llm_server import MockLLMServer
+
+
+@pytest.fixture
+def servers():
+    fast = MockLLMServer(latency=0.01, reply="fast").start()
+    slow = MockLLMServer(latency=0.3, reply="slow").start()
+    yield fast, slow
+    fast.stop()
+    slow.stop()
+
+
+def _endpoint(name, server):
+    return Endpoint(name, OpenAI(api_key="test", base_url=server.base_url, max_retries=0))
+
+
+def _ask(pool):
+    response = pool.chat.completions.create(model="mock", messages=[{"role": "user", "content": "在吗"}])
+    return response.choices[0].message.content
+
+
+def test_pool_routes_to_fastest_endpoint(servers):
+    fast, slow = servers
+    pool = ProviderPool([_endpoint("slow", slow), _endpoint("fast", fast)])
+    # 两个端点都先被探测一次，之后稳定选择更快的端点
+    replies = [_ask(pool) for _ in range(6)]
+    assert replies[-4:] == ["fast"] * 4
+    assert pool.ranked_endpoints()[0].name == "fast"
+
+
+def test_pool_fails_over_on_errors(servers):
+    fast, _ = servers
+    broken = MockLLMServer(fail_rate=1.0).start()
+    try:
+        pool = ProviderPool([_endpoint("broken", broken), _endpoint("fast", fast)])
+        assert _ask(pool) == "fast"
+        assert pool.stats()["endpoints"]["broken"]["error_rate"] == 1.0
+    finally:
+        broken.stop()
+
+
+def test_hedged_request_beats_slow_primary(servers):
+    fast, slow = servers
+    primary = _endpoint("primary", slow)
+    for _ in range(5):
+        primary.stats.record(0.05, True)
+    pool = ProviderPool([primary, _endpoint("backup", fast)], hedge=True, hedge_min_delay=0.05, hedge_min_samples=5)
+    # 让 primary 在排序中保持第一
+    pool.endpoints[1].stats.record(0.2, True)
+
+    start = time.perf_counter()
+    assert _ask(pool) == "fast"
+    assert time.perf_counter() - start < 0.25
+    assert pool.hedges_fired == 1
+    assert pool.hedges_won == 1
+
+
+def test_client_errors_fail_fast_but_rate_limits_fail_over(servers):
+    fast, _ = servers
+    bad_request = MockLLMServer(fail_rate=1.0, fail_status=400).start()
+    limited = MockLLMServer(fail_rate=1.0, fail_status=429).start()
+    try:
+        pool = ProviderPool([_endpoint("bad", bad_request), _endpoint("fast", fast)])
+        with pytest.raises(BadRequestError):
+            _ask(pool)
+        assert fast.requests == []
+        assert pool.stats()["endpoints"]["bad"]["error_rate"] == 0.0
+
+        pool = ProviderPool([_endpoint("limited", limited), _endpoint("fast", fast)])
+        assert _ask(pool) == "fast"
+    finally:
+        bad_request.stop()
+        limited.stop()
+
+
+def test_caller_model_wins_over_endpoint_default(servers):
+    fast, _ = servers
+    client = OpenAI(api_key="test", base_url=fast.base_url, max_retries=0)
+    pool = ProviderPool([Endpoint("fast", client, model="qwen-max", models={"qwen-turbo": "turbo-2024"})])
+    for model in ("qwen-turbo", "qwen-plus", None):
+        kwargs = {"model": model} if model else {}
+        pool.chat.completions.create(messages=[{"role": "user", "content": "在吗"}], **kwargs)
+    assert [r["model"] for r in fast.requests] == ["turbo-2024", "qwen-plus", "qwen-max"]
+
+
+def test_fallback_attempts_share_the_reply_deadline(servers):
+    from openai import APITimeoutError
+
+    from utils.deadline import Deadline, deadline_scope
+
+    _, slow = servers
+    pool = ProviderPool([_endpoint("a", slow), _endpoint("b", slow)])
+    start = time.perf_counter()
+    with deadline_scope(Deadline(0.1)), pytest.raises(APITimeoutError):
+        _ask(pool)
+    # 第一个端点用完时限后不再尝试第二个，也不会各自等满完整的超时
+    assert time.perf_counter() - start < 0.25
+
+
+def test_queueing_in_the_pool_does_not_fire_hedges(servers):
+    fast, slow = servers
+    primary = _endpoint("primary", fast)
+    for _ in range(5):
+        primary.stats.record(0.05, True)
+    pool = ProviderPool([primary, _endpoint("backup", slow)], hedge=True, hedge_min_delay=0.05,
+                        hedge_min_samples=5, max_workers=1)
+    pool.endpoints[1].stats.record(0.2, True)
+    # 占满线程池：主请求排队超过对冲延迟，但开始执行后很快返回
+    pool._executor.submit(time.sleep, 0.2)
+    assert _ask(pool) == "fast"
+    assert pool.hedges_fired == 0
+    assert slow.requests == []
@@ -0,0 +1,63 @@
+import sqlite3
+
+from llm_usage import UsageRecorder, build_report, usage_context
+
+PRICING = {"qwen-max": {"input_per_1k": 1.0, "cached_input_per_1k": 0.5, "output_per_1k": 2.0}}
+
+
+def test_cost_discounts_cached_tokens():
+    recorder = UsageRecorder(pricing=PRICING)
+    assert recorder.cost("qwen-max", 1000, 500, 400) == 600 * 1.0 / 1000 + 400 * 0.5 / 1000 + 500 * 2.0 / 1000
+    assert recorder.cost("unknown", 1000, 500, 0) == 0.0
+
+
+def test_unpriced_model_is_warned_once():
+    from loguru import logger
+
+    messages = []
+    handler = logger.add(messages.append, level="WARNING")
+    try:
+        recorder = UsageRecorder(pricing=PRICING)
+        for _ in range(3):
+            assert recorder.cost("qwen-turbo", 1000, 500, 0) == 0.0
+        recorder.cost("qwen-max", 1000, 500, 0)
+    finally:
+        logger.remove(handler)
+    assert len(messages) == 1 and "qwen-turbo" in messages[0]
+
+
+def test_profile_models_are_priced():
+    import json
+
+    with open("config.json", encoding="utf-8") as f:
+        config = json.load(f)
+    models = {profile["model"] for profile in config["agent_profiles"].values() if "model" in profile}
+    assert models <= set(config["llm_pricing"])
+
+
+def test_records_carry_context_and_aggregate(tmp_path):
+    db_path = str(tmp_path / "usage.db")
+    recorder = UsageRecorder(db_path, PRICING)
+    usage = {"prompt_tokens": 100, "completion_tokens": 20, "cached_tokens": 50}
+
+    with usage_context(chat_id="c1", item_id="i1"):
+        for latency in (0.1, 0.2, 0.3):
+            recorder.record("price", "qwen-max", usage, latency)
+    with usage_context(chat_id="c2", item_id="i2"):
+        recorder.record("classify", "qwen-max", usage, 0.05)
+        recorder.record("classify", "qwen-max", None, 1.0, ok=False)
+    recorder.record("tech", "qwen-max", usage, 0.4)
+    recorder.flush()
+
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("SELECT chat_id, item_id FROM llm_calls WHERE agent = 'tech'").fetchall()
+    assert rows == [(None, None)]
+
+    report = build_report(db_path, days=1, top=5)
+    price = report["agents"]["price"]
+    assert price["calls"] == 3
+    assert price["p50_ms"] == 200.0
+    assert price["p95_ms"] == 300.0
+    assert report["agents"]["classify"]["errors"] == 1
+    assert report["top_items"][0]["item_id"] == "i1"
+    assert report["top_items"][0]["calls"] == 3
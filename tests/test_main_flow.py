@@ -6,6 +6,7 @@ import time
 from unittest.mock import AsyncMock, MagicMock, patch
 
 from main import XianyuLive
+from context_manager import TurnContext
 from XianyuAgent import XianyuReplyBot
 from loguru import logger
 
@@ -61,6 +62,7 @@ async def mock_xianyu_live(mock_bot):
         live.context_manager.add_message_by_chat = AsyncMock()
         live.context_manager.update_last_item_id = AsyncMock()
         live.context_manager.get_last_item_id = AsyncMock(return_value=None)
+        live.context_manager.load_turn_context = AsyncMock(return_value=TurnContext(None, None, [], 0))
         
         live.xianyu.get_item_info = MagicMock(return_value={
             'data': {'itemDO': {'desc': 'Test Item', 'soldPrice': '100'}}
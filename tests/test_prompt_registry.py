@@ -0,0 +1,42 @@
+import os
+
+from prompt_registry import PromptRegistry, render_static_prompt
+
+
+def test_render_static_prompt_replaces_placeholders_with_labels():
+    rendered = render_static_prompt("商品: {product_name}，出价: `{user_offer_price}`，其他: {unknown}")
+    assert rendered == "商品: 【商品名称】，出价: `【买家出价】`，其他: 【unknown】"
+    assert render_static_prompt("没有占位符") == "没有占位符"
+
+
+def test_registry_swaps_only_changed_templates(tmp_path):
+    (tmp_path / "price_prompt.txt").write_text("议价 {product_name}", encoding="utf-8")
+    (tmp_path / "tech_prompt.txt").write_text("技术", encoding="utf-8")
+    registry = PromptRegistry(str(tmp_path), names=("price", "tech"))
+    notified = []
+    registry.add_listener(lambda: notified.append(True))
+
+    assert registry.static("price") == "议价 【商品名称】"
+    assert registry.get("price").fields == {"product_name"}
+    assert registry.refresh() is False
+
+    tech_before = registry.get("tech")
+    (tmp_path / "price_prompt.txt").write_text("新的议价", encoding="utf-8")
+    os.utime(tmp_path / "price_prompt.txt", (0, 12345))
+    assert registry.refresh() is True
+    assert registry.text("price") == "新的议价"
+    assert registry.get("tech") is tech_before
+    assert notified == [True]
+
+
+def test_registry_watches_extra_files(tmp_path):
+    config_path = tmp_path / "config.json"
+    config_path.write_text("{}")
+    registry = PromptRegistry(str(tmp_path), names=())
+    calls = []
+    registry.watch_file(str(config_path), lambda: calls.append(True))
+    registry.refresh()
+    assert calls == []
+    os.utime(config_path, (0, 12345))
+    registry.refresh()
+    assert calls == [True]
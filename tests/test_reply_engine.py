@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from reply_engine import BotEngine, EngineSelector, GraphEngine, ReplyResult, bargain_count_from_context
+
+ITEM = {"desc": "雅马哈功放", "soldPrice": "1800"}
+
+
+class FakeRouter:
+    def detect_by_rules(self, user_msg, last_intent):
+        return "price" if "便宜" in user_msg else None
+
+
+class FakeState:
+    last_intent = None
+
+
+class FakeBot:
+    def __init__(self):
+        self.router = FakeRouter()
+        self.states = {}
+        self.bargain_counts = []
+
+    def chat_state(self, chat_id=None):
+        return self.states.setdefault(chat_id, FakeState())
+
+    def generate_reply(self, user_msg, item_info, context, bargain_count=None, chat_id=None):
+        self.bargain_counts.append(bargain_count)
+        self.chat_state(chat_id).last_intent = "tech"
+        return f"回复:{user_msg}"
+
+
+class FakeGraph:
+    def __init__(self, checkpointer=None):
+        self.checkpointer = checkpointer
+        self.calls = []
+
+    async def ainvoke(self, state, config=None):
+        self.calls.append((state, config))
+        return {"final_reply": "图回复", "intent": "price"}
+
+
+def test_bot_engine():
+    engine = BotEngine(FakeBot())
+    result = asyncio.run(engine.generate("功率多大", ITEM, [], chat_id="c1", item_id="i1"))
+    assert result == ReplyResult("回复:功率多大", "tech")
+    assert engine.rule_intent("能便宜点吗") == "price"
+    asyncio.run(engine.generate("能便宜点吗", ITEM, [], chat_id="c1", item_id="i1", bargain_count=3))
+    assert engine.bot.bargain_counts == [None, 3]
+
+
+def test_graph_engine_passes_thread_or_history():
+    pytest.importorskip("langgraph")
+    context = [
+        {"role": "system", "content": "关于此商品的议价次数: 2"},
+        {"role": "user", "content": "在吗"},
+        {"role": "assistant", "content": "在的"},
+    ]
+    stateless = FakeGraph()
+    result = asyncio.run(GraphEngine(stateless).generate("多少钱", ITEM, context, chat_id="c1", item_id="i1"))
+    assert result == ReplyResult("图回复", "price")
+    state, config = stateless.calls[0]
+    assert config is None
+    assert [m.content for m in state["chat_history"]] == ["在吗", "在的"]
+    assert state["bargain_count"] == 2
+
+    persistent = FakeGraph(checkpointer=object())
+    asyncio.run(GraphEngine(persistent).generate("多少钱", ITEM, context, chat_id="c1", item_id="i1"))
+    state, config = persistent.calls[0]
+    assert config == {"configurable": {"thread_id": "c1"}}
+    assert state["chat_history"] == []
+
+    # 显式传入的议价次数优先于上下文中的系统消息
+    asyncio.run(GraphEngine(persistent).generate("多少钱", ITEM, [], chat_id="c1", item_id="i1", bargain_count=4))
+    assert persistent.calls[1][0]["bargain_count"] == 4
+
+
+def test_selector_account_override_and_percentage():
+    engines = {"bot": BotEngine(FakeBot()), "graph": GraphEngine(FakeGraph())}
+    selector = EngineSelector(engines, accounts={"seller_a": "graph"}, graph_percentage=30)
+    assert selector.select("seller_a", "any").name == "graph"
+    chosen = [selector.engine_name("seller_b", f"chat_{i}") for i in range(1000)]
+    assert 200 < chosen.count("graph") < 400
+    # 同一会话总是落在同一引擎
+    assert all(selector.engine_name("seller_b", f"chat_{i}") == chosen[i] for i in range(1000))
+    assert EngineSelector(engines).engine_name("seller_b", "chat_1") == "bot"
+    assert EngineSelector(engines, graph_percentage=100).engine_name("seller_b", "chat_1") == "graph"
+
+
+def test_selector_rejects_unknown_engine():
+    with pytest.raises(ValueError):
+        EngineSelector({}, default="langchain")
+
+
+def test_bargain_count_from_context():
+    assert bargain_count_from_context([{"role": "system", "content": "关于此商品的议价次数: 3"}]) == 3
+    assert bargain_count_from_context([{"role": "user", "content": "议价次数: 3"}]) == 0
+
+
+def test_discount_state_is_kept_per_chat(monkeypatch, tmp_path):
+    from llm_usage import configure_usage_recorder
+    from utils.mock_llm_server import MockLLMServer
+    from XianyuAgent import XianyuReplyBot
+
+    configure_usage_recorder({"llm_usage": {"db_path": str(tmp_path / "usage.db")}})
+    monkeypatch.setattr("utils.reporting_utils.LOG_DIR", str(tmp_path / "logs"))
+    item = {"title": "罗技鼠标", "desc": "罗技鼠标", "soldPrice": "100"}
+    with MockLLMServer(reply="default") as server:
+        monkeypatch.setenv("API_KEY", "test")
+        monkeypatch.setenv("MODEL_BASE_URL", server.base_url)
+        engine = BotEngine(XianyuReplyBot({}))
+        proposed = asyncio.run(engine.generate("买3件有优惠吗", item, [], chat_id="a", item_id="i1"))
+        # 另一个会话的确认不会用到 a 会话的优惠方案
+        other = asyncio.run(engine.generate("好的就按这个优惠", item, [], chat_id="b", item_id="i1"))
+        confirmed = asyncio.run(engine.generate("好的就按这个优惠", item, [], chat_id="a", item_id="i1"))
+
+    assert proposed.intent == "propose_discount"
+    assert other.intent != "confirm_discount"
+    assert confirmed.intent == "confirm_discount"
+    assert engine.bot.chat_state("a").last_discount_info == {}
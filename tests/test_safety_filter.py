@@ -0,0 +1,102 @@
+import pytest
+
+from safety_filter import DEFAULT_REPLACEMENT, SafetyFilter
+
+
+@pytest.fixture
+def safety():
+    return SafetyFilter(min_digit_run=7)
+
+
+@pytest.mark.parametrize("text, hit", [
+    ("加我微信聊", "微信"),
+    ("加我V信吧", "微信"),
+    ("加薇信详聊", "微信"),
+    ("有事加 v x", "微信"),
+    ("ｑｑ联系", "QQ"),
+    ("加我Q Q", "QQ"),
+    ("Q​Q", "QQ"),
+    ("扣扣号发你", "QQ"),
+    ("走ZFB转账", "支付宝"),
+    ("支付寶也行", "支付宝"),
+    ("可以線下交易", "线下"),
+    ("电话１３８１２３４５６７８", "数字串"),
+    ("电话138\u200b1234\u200b5678", "数字串"),
+    ("电话138-1234-5678", "数字串"),
+    ("电话138 1234 5678", "数字串"),
+    ("电话１３８　１２３４　５６７８", "数字串"),
+    ("加我wx", "微信"),
+    ("加WeChat详聊", "微信"),
+])
+def test_evasions_are_caught(safety, text, hit):
+    assert safety.find(text) == hit
+    assert safety.apply(text) == DEFAULT_REPLACEMENT
+
+
+@pytest.mark.parametrize("text", [
+    "亲，这款99新，原价3999，现价2500包邮",
+    "可以的，拍下后我改价，优惠100元",
+    "电池健康度95%，屏幕无划痕",
+    "这台是2023-05-20买的",
+    "发票日期2024.10.15",
+    "尺寸 1920 * 1080",
+    "支持new xbox手柄",
+    "wxga分辨率的屏幕",
+    "保修2023-05-20至2025-05-20",
+    "单价 100 200 300 三档",
+    "这是官方权威信息",
+    "品牌威信很高",
+    "威力很大，很有威严",
+])
+def test_normal_replies_pass(safety, text):
+    assert safety.apply(text) == text
+
+
+def test_streaming_matches_across_chunks(safety):
+    scanner = safety.scanner()
+    assert scanner.feed("好的，您加我") is None
+    assert scanner.feed("V") is None
+    assert scanner.feed("信吧") == "微信"
+    assert scanner.blocked
+    assert scanner.feed("后面的内容") == "微信"
+
+
+def test_digit_run_spans_chunks(safety):
+    scanner = safety.scanner()
+    assert scanner.feed("号码13") is None
+    assert scanner.feed("8123") is None
+    assert scanner.feed("45678") == "数字串"
+
+    scanner = safety.scanner()
+    assert scanner.feed("号码138-") is None
+    assert scanner.feed("1234 ") is None
+    assert scanner.feed("5678") == "数字串"
+
+
+def test_ascii_variant_is_confirmed_by_next_char(safety):
+    scanner = safety.scanner()
+    assert scanner.feed("加我 v") is None
+    assert scanner.feed(" x") is None
+    assert scanner.feed("吧") == "微信"
+
+    scanner = safety.scanner()
+    assert scanner.feed("加我vx") is None
+    assert scanner.close() == "微信"
+    assert safety.scanner().feed("vxbox") is None
+
+
+def test_shipped_config_passes_normal_replies():
+    import json
+
+    with open("config.json", encoding="utf-8") as f:
+        safety = SafetyFilter.from_config(json.load(f))
+    for text in ("这是官方权威信息", "品牌威信很高", "这台是2023-05-20买的"):
+        assert safety.apply(text) == text
+    assert safety.find("加我微信") == "微信"
+    assert safety.find("电话 138-1234-5678") == "数字串"
+
+
+def test_phrases_from_config():
+    safety = SafetyFilter.from_config({"safety_filter": {"phrases": ["闲鱼外"], "replacement": "请在平台沟通"}})
+    assert safety.apply("我们闲鱼外交易") == "请在平台沟通"
+    assert safety.find("加我微信") is None
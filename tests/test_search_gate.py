@@ -0,0 +1,49 @@
+import pytest
+from openai import OpenAI
+
+from llm_usage import configure_usage_recorder
+from search_gate import SearchGate
+from utils.mock_llm_server import MockLLMServer
+from utils.reporting_utils import jsonl_appender
+from XianyuAgent import TechAgent
+
+DESC = "iPhone 13 128G 国行 电池健康92% 无划痕 屏幕完好;当前商品售卖价格为:2800"
+
+
+@pytest.mark.parametrize("question, search, reason", [
+    ("几成新？", False, "item_condition"),
+    ("有没有划痕", False, "item_condition"),
+    ("电池健康多少", False, "covered_by_desc"),
+    ("128G的吗", False, "covered_by_desc"),
+    ("电池容量多大", True, "spec_not_in_desc"),
+    ("和iPhone14有什么区别", True, "spec_not_in_desc"),
+    ("今天能发吗", False, "general"),
+])
+def test_gate_decisions(question, search, reason):
+    decision = SearchGate().decide(question, DESC, "iPhone 13")
+    assert (decision.search, decision.reason) == (search, reason)
+
+
+def test_disabled_gate_always_searches():
+    gate = SearchGate(enabled=False)
+    assert gate.decide("几成新", DESC).search
+    assert gate.stats()["search_rate"] == 1.0
+
+
+def test_tech_agent_only_enables_search_when_needed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("TAVILY_API_KEY", raising=False)
+    configure_usage_recorder({"llm_usage": {"db_path": str(tmp_path / "usage.db")}})
+    with MockLLMServer(reply="好的") as server:
+        client = OpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+        agent = TechAgent(client, "技术", lambda x: x, {"max_tokens": 200}, search_profile={"max_tokens": 600})
+
+        agent.generate(user_msg="几成新？", item_desc=DESC, context=[], product_name="iPhone 13")
+        assert "extra_body" not in server.requests[-1] and "enable_search" not in server.requests[-1]
+        assert server.requests[-1]["max_tokens"] == 200
+
+        agent.generate(user_msg="处理器是什么", item_desc=DESC, context=[], product_name="iPhone 13")
+        assert server.requests[-1].get("enable_search") is True
+        assert server.requests[-1]["max_tokens"] == 600
+    jsonl_appender.flush()
+    assert (tmp_path / "logs" / "search_decisions.jsonl").read_text(encoding="utf-8").count("\n") == 2
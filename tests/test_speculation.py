@@ -0,0 +1,38 @@
+import time
+
+from speculation import SpeculativeExecutor
+
+
+def _slow(value, delay=0.1):
+    time.sleep(delay)
+    return value
+
+
+def test_speculation_hit_overlaps_classify_and_generate():
+    executor = SpeculativeExecutor(enabled=True)
+    start = time.perf_counter()
+    intent, reply = executor.run("default", lambda: _slow("default"), lambda i: _slow(f"{i}-reply"))
+    elapsed = time.perf_counter() - start
+    assert (intent, reply) == ("default", "default-reply")
+    assert elapsed < 0.18
+    assert executor.stats.snapshot()["hits"] == 1
+
+
+def test_speculation_miss_regenerates_with_actual_intent():
+    executor = SpeculativeExecutor(enabled=True)
+    generated = []
+
+    def generate(intent):
+        generated.append(intent)
+        return f"{intent}-reply"
+
+    intent, reply = executor.run("default", lambda: "price", generate)
+    assert (intent, reply) == ("price", "price-reply")
+    assert "price" in generated
+    assert executor.stats.hit_rate == 0.0
+
+
+def test_predict_policies():
+    assert SpeculativeExecutor(policy="default").predict("tech") == "default"
+    assert SpeculativeExecutor(policy="last_intent").predict("tech") == "tech"
+    assert SpeculativeExecutor(policy="last_intent").predict("propose_discount") == "default"
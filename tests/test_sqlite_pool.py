@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from context_manager import ChatContextManager
+from utils.sqlite_pool import SqlitePool
+
+
+def test_pool_enables_wal_and_reuses_connections(tmp_path):
+    pool = SqlitePool(str(tmp_path / "chat.db"), readers=2, cache_size_kb=4096)
+
+    async def main():
+        async with pool.writer() as first:
+            mode = await (await first.execute("PRAGMA journal_mode")).fetchone()
+            sync = await (await first.execute("PRAGMA synchronous")).fetchone()
+            cache = await (await first.execute("PRAGMA cache_size")).fetchone()
+        async with pool.writer() as second:
+            pass
+        async with pool.reader() as reader:
+            query_only = await (await reader.execute("PRAGMA query_only")).fetchone()
+        await pool.close()
+        return first, second, mode[0], sync[0], cache[0], query_only[0]
+
+    first, second, mode, sync, cache, query_only = asyncio.run(main())
+    assert first is second
+    assert mode == "wal"
+    assert sync == 1  # NORMAL
+    assert cache == -4096
+    assert query_only == 1
+
+
+def test_writer_rolls_back_on_error(tmp_path):
+    pool = SqlitePool(str(tmp_path / "chat.db"))
+
+    async def main():
+        async with pool.writer() as conn:
+            await conn.execute("CREATE TABLE t (v INTEGER)")
+            await conn.commit()
+        with pytest.raises(RuntimeError):
+            async with pool.writer() as conn:
+                await conn.execute("INSERT INTO t VALUES (1)")
+                raise RuntimeError("boom")
+        async with pool.reader() as conn:
+            count = await (await conn.execute("SELECT COUNT(*) FROM t")).fetchone()
+        await pool.close()
+        return count[0]
+
+    assert asyncio.run(main()) == 0
+
+
+def test_readers_are_bounded(tmp_path):
+    pool = SqlitePool(str(tmp_path / "chat.db"), readers=1)
+    active, peak = 0, 0
+
+    async def read():
+        nonlocal active, peak
+        async with pool.reader() as conn:
+            active += 1
+            peak = max(peak, active)
+            await conn.execute("SELECT 1")
+            await asyncio.sleep(0.01)
+            active -= 1
+
+    async def main():
+        await asyncio.gather(*(read() for _ in range(5)))
+        await pool.close()
+
+    asyncio.run(main())
+    assert peak == 1
+
+
+def test_context_manager_on_pool(tmp_path):
+    manager = ChatContextManager(db_path=str(tmp_path / "data" / "chat.db"), recent_turns=2)
+
+    async def main():
+        await manager._init_db()
+        await manager.add_message_by_chat("c1", "u1", "i1", "user", "能便宜点吗")
+        await manager.add_message_by_chat("c1", "s1", "i1", "assistant", "最低1700")
+        await manager.increment_bargain_count_for_item("c1", "i1")
+        await manager.update_last_item_id("c1", "i1")
+        context = await manager.get_context_for_item("c1", "i1")
+        last_item = await manager.get_last_item_id("c1")
+        await manager.close()
+        return context, last_item
+
+    context, last_item = asyncio.run(main())
+    assert [m["content"] for m in context] == ["能便宜点吗", "最低1700", "关于此商品的议价次数: 1"]
+    assert last_item == "i1"
@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+from web_search import SearchCache, normalize_query
+
+
+@pytest.fixture
+def cache(tmp_path):
+    calls = []
+
+    def search(query):
+        calls.append(query)
+        time.sleep(0.05)
+        return f"结果:{query}"
+
+    cache = SearchCache(str(tmp_path / "cache.db"), ttl_secs=3600, max_entries=3, search_fn=search)
+    cache.calls = calls
+    return cache
+
+
+def test_normalize_query():
+    assert normalize_query("  iPhone１３  Pro，电池容量？") == "iphone13 pro 电池容量"
+    assert normalize_query("IPHONE13 pro 电池容量") == normalize_query("iphone13  Pro,电池容量!")
+
+
+def test_repeat_queries_hit_cache(cache):
+    assert cache.get_or_search("iPhone13 电池容量") == "结果:iPhone13 电池容量"
+    assert cache.get_or_search("iphone13，电池容量") == "结果:iPhone13 电池容量"
+    assert len(cache.calls) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_put_upserts_and_ttl_expires(cache):
+    cache.put("k", "v1")
+    cache.put("k", "v2")
+    assert cache.get("k") == "v2"
+    cache.ttl = cache.ttl * 0
+    assert cache.get("k") is None
+
+
+def test_eviction_keeps_newest(cache):
+    for i in range(5):
+        cache.put(f"q{i}", str(i))
+    cache._puts = 0
+    cache.put("q5", "5")
+    assert cache.get("q0") is None
+    assert cache.get("q5") == "5"
+
+
+def test_concurrent_identical_searches_run_once(cache):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_search("小米14 续航"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(cache.calls) == 1
+    assert results == ["结果:小米14 续航"] * 8
+
+
+def test_failed_search_is_not_cached(cache):
+    def broken(query):
+        raise RuntimeError("timeout")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_search("q", broken)
+    assert cache.get("q") is None
@@ -0,0 +1,166 @@
+import asyncio
+import sqlite3
+from contextlib import asynccontextmanager
+
+from context_manager import ChatContextManager
+from utils.sqlite_pool import SqlitePool
+from utils.write_behind import WriteBehindQueue
+
+
+def _manager(tmp_path, **kwargs):
+    db_path = str(tmp_path / "chat.db")
+    pool = SqlitePool(db_path)
+    return ChatContextManager(db_path=db_path, pool=pool, write_behind=WriteBehindQueue(pool, **kwargs))
+
+
+def _count(db_path, sql):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(sql).fetchone()[0]
+
+
+def test_writes_from_many_chats_share_one_transaction(tmp_path):
+    manager = _manager(tmp_path, flush_interval_ms=10_000)
+
+    async def main():
+        await manager._init_db()
+        for n in range(20):
+            await manager.add_message_by_chat(f"c{n}", "u", "i1", "user", "在吗")
+            await manager.increment_bargain_count_for_item(f"c{n}", "i1")
+            await manager.update_last_item_id(f"c{n}", "i1")
+        assert manager.writes.pending()
+        await manager.flush()
+        stats = manager.writes.stats()
+        await manager.close()
+        return stats
+
+    stats = asyncio.run(main())
+    assert stats == {"ops": 60, "batches": 1, "failed": 0, "avg_batch_size": 60.0}
+    assert _count(manager.db_path, "SELECT COUNT(*) FROM messages") == 20
+
+
+def test_reads_see_own_chat_writes(tmp_path):
+    manager = _manager(tmp_path, flush_interval_ms=10_000)
+
+    async def main():
+        await manager._init_db()
+        await manager.add_message_by_chat("c1", "u", "i1", "user", "能便宜点吗")
+        await manager.increment_bargain_count_for_item("c1", "i1")
+        await manager.add_message_by_chat("c2", "u", "i1", "user", "在吗")
+        context = await manager.get_context_for_item("c1", "i1")
+        count = await manager.get_bargain_count_for_item("c1", "i1")
+        await manager.close()
+        return context, count
+
+    context, count = asyncio.run(main())
+    assert context[0]["content"] == "能便宜点吗"
+    assert count == 1
+
+
+def test_reads_wait_for_in_flight_commit(tmp_path):
+    manager = _manager(tmp_path, flush_interval_ms=10_000)
+    pool = manager.writes.pool
+    writer = pool.writer
+    gate = asyncio.Event()
+
+    @asynccontextmanager
+    async def held_writer():
+        await gate.wait()
+        async with writer() as conn:
+            yield conn
+
+    async def main():
+        await manager._init_db()
+        pool.writer = held_writer
+        await manager.add_message_by_chat("c1", "u", "i1", "user", "能便宜点吗")
+        flush = asyncio.ensure_future(manager.flush())
+        try:
+            await asyncio.sleep(0.01)
+            # 批次已出队、事务还没提交时，该会话仍算作有待写入
+            in_flight = manager.writes.pending("c1")
+            read = asyncio.ensure_future(manager.get_context_for_item("c1", "i1"))
+            await asyncio.sleep(0.01)
+        finally:
+            gate.set()
+        await flush
+        context = await read
+        assert not manager.writes.pending("c1")
+        await manager.close()
+        return in_flight, context
+
+    in_flight, context = asyncio.run(main())
+    assert in_flight
+    assert [m["content"] for m in context] == ["能便宜点吗"]
+
+
+def test_failed_op_does_not_affect_batch(tmp_path):
+    db_path = str(tmp_path / "chat.db")
+    pool = SqlitePool(db_path)
+    queue = WriteBehindQueue(pool, flush_interval_ms=10_000)
+
+    async def main():
+        async with pool.writer() as conn:
+            await conn.execute("CREATE TABLE t (v INTEGER CHECK (v < 3))")
+            await conn.commit()
+        insert = "INSERT INTO t VALUES (?)"
+        futures = [
+            queue.submit([(insert, (1,))], "写入1"),
+            queue.submit([(insert, (5,)), ("INSERT INTO missing VALUES (1)", ())], "写入坏数据"),
+            queue.submit([(insert, (2,))], "写入2"),
+        ]
+        await queue.close()
+        await pool.close()
+        return [f.result() for f in futures]
+
+    assert asyncio.run(main()) == [True, False, True]
+    with sqlite3.connect(db_path) as conn:
+        assert [r[0] for r in conn.execute("SELECT v FROM t ORDER BY v")] == [1, 2]
+
+
+async def _wait_for_count(db_path, sql, expected, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    end = loop.time() + timeout
+    while _count(db_path, sql) != expected and loop.time() < end:
+        await asyncio.sleep(0.01)
+    return _count(db_path, sql)
+
+
+def test_batch_size_triggers_flush(tmp_path):
+    manager = _manager(tmp_path, flush_interval_ms=10_000, max_batch_ops=5)
+    sql = "SELECT COUNT(*) FROM chat_session_state"
+
+    async def main():
+        await manager._init_db()
+        for n in range(5):
+            await manager.update_last_item_id(f"c{n}", "i1")
+        count = await _wait_for_count(manager.db_path, sql, 5)
+        await manager.close()
+        return count
+
+    assert asyncio.run(main()) == 5
+
+
+def test_interval_triggers_flush(tmp_path):
+    manager = _manager(tmp_path, flush_interval_ms=20)
+    sql = "SELECT COUNT(*) FROM chat_session_state"
+
+    async def main():
+        await manager._init_db()
+        await manager.update_last_item_id("c1", "i1")
+        count = await _wait_for_count(manager.db_path, sql, 1)
+        pending = manager.writes.pending()
+        await manager.close()
+        return count, pending
+
+    assert asyncio.run(main()) == (1, False)
+
+
+def test_close_flushes_pending_writes(tmp_path):
+    manager = _manager(tmp_path, flush_interval_ms=10_000)
+
+    async def main():
+        await manager._init_db()
+        await manager.add_message_by_chat("c1", "u", "i1", "user", "在吗")
+        await manager.close()
+
+    asyncio.run(main())
+    assert _count(manager.db_path, "SELECT COUNT(*) FROM messages") == 1
@@ -0,0 +1,173 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("langgraph")
+pytest.importorskip("langchain_openai")
+
+import XianyuGraph  # noqa: E402
+from llm_usage import configure_usage_recorder  # noqa: E402
+from utils.mock_llm_server import MockLLMServer  # noqa: E402
+
+
+class SlowTool:
+    def __init__(self, name, latency, result="ok"):
+        self.name = name
+        self.latency = latency
+        self.result = result
+
+    async def ainvoke(self, args):
+        await asyncio.sleep(self.latency)
+        return f"{self.result}:{args}"
+
+
+def _calls(*names):
+    return [{"name": name, "args": {"q": name}, "id": f"call_{i}"} for i, name in enumerate(names)]
+
+
+def test_tool_calls_run_concurrently_in_order():
+    tools = {"a": SlowTool("a", 0.2), "b": SlowTool("b", 0.2)}
+    start = time.perf_counter()
+    result = asyncio.run(XianyuGraph.tool_node({"tool_calls": _calls("a", "b")}, tools, {}))
+    assert time.perf_counter() - start < 0.35
+    assert [m.tool_call_id for m in result["chat_history"]] == ["call_0", "call_1"]
+    assert result["tool_calls"] is None
+
+
+def test_tool_timeout_and_unknown_tool_become_error_results():
+    tools = {"slow": SlowTool("slow", 1.0)}
+    result = asyncio.run(XianyuGraph.tool_node({"tool_calls": _calls("slow", "missing")}, tools, {"slow": 0.05}))
+    contents = [m.content for m in result["chat_history"]]
+    assert "timed out" in contents[0]
+    assert "unknown tool" in contents[1]
+
+
+def test_get_graph_compiles_once(monkeypatch, tmp_path):
+    monkeypatch.setenv("API_KEY", "test")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(XianyuGraph, "_compiled_graph", None)
+    graph = XianyuGraph.get_graph(str(tmp_path / "missing.json"))
+    assert graph.checkpointer is not None
+    assert XianyuGraph.get_graph() is graph
+
+
+def test_graph_turn_with_tools(monkeypatch, tmp_path):
+    configure_usage_recorder({"llm_usage": {"db_path": str(tmp_path / "usage.db")}})
+
+    def reply(body):
+        if any(m.get("role") == "tool" for m in body["messages"]):
+            return "功率85W"
+        if body.get("tools"):
+            return {"tool_calls": [{"name": "get_item_details", "args": {"item_id": "item_123"}}]}
+        return "tech"
+
+    with MockLLMServer(reply=reply) as server:
+        monkeypatch.setenv("API_KEY", "test")
+        monkeypatch.setenv("MODEL_BASE_URL", server.base_url)
+        graph = XianyuGraph.XianyuGraphBuilder({}).compile()
+        result = asyncio.run(graph.ainvoke({
+            "user_message": "功率多大",
+            "item_description": "雅马哈功放",
+            "chat_history": [],
+            "intent": "",
+            "bargain_count": 0,
+            "final_reply": "",
+        }))
+    assert result["intent"] == "tech"
+    assert result["final_reply"] == "功率85W"
+    assert len(server.requests) == 3
+
+
+def test_default_agent_tool_results_return_to_default_agent(monkeypatch, tmp_path):
+    configure_usage_recorder({"llm_usage": {"db_path": str(tmp_path / "usage.db")}})
+
+    def reply(body):
+        if any(m.get("role") == "tool" for m in body["messages"]):
+            return "可以开发票"
+        if body.get("tools"):
+            return {"tool_calls": [{"name": "get_item_details", "args": {"item_id": "item_123"}}]}
+        return "default"
+
+    with MockLLMServer(reply=reply) as server:
+        monkeypatch.setenv("API_KEY", "test")
+        monkeypatch.setenv("MODEL_BASE_URL", server.base_url)
+        result = asyncio.run(XianyuGraph.XianyuGraphBuilder({}).compile().ainvoke({
+            "user_message": "能开发票吗",
+            "item_description": "雅马哈功放",
+            "chat_history": [],
+            "intent": "",
+            "bargain_count": 0,
+            "final_reply": "",
+        }))
+    assert result["intent"] == "default"
+    assert result["final_reply"] == "可以开发票"
+    # router + 默认Agent调用工具 + 默认Agent根据工具结果回复，不经过技术Agent
+    assert len(server.requests) == 3
+    assert server.requests[2]["messages"][0] == server.requests[1]["messages"][0]
+
+
+def test_budget_reasons_and_stats():
+    budget = XianyuGraph.ToolLoopBudget(max_tool_iterations=2, max_wall_secs=5, max_tokens=100)
+    now = time.monotonic()
+    assert budget.exhausted_reason({"turn_started": now, "tool_iterations": 1, "tokens_used": 10}) is None
+    assert budget.exhausted_reason({"turn_started": now, "tool_iterations": 2}) == "iterations"
+    assert budget.exhausted_reason({"turn_started": now - 6}) == "wall_time"
+    assert budget.exhausted_reason({"turn_started": now, "tokens_used": 100}) == "tokens"
+    budget.record_turn()
+    budget.record_turn()
+    budget.record_exhausted("iterations")
+    assert budget.stats() == {"turns": 2, "exhausted": 1, "exhausted_rate": 0.5, "by_reason": {"iterations": 1}}
+
+
+def test_tool_loop_forces_final_answer(monkeypatch, tmp_path):
+    configure_usage_recorder({"llm_usage": {"db_path": str(tmp_path / "usage.db")}})
+
+    def reply(body):
+        if any(m.get("content") == XianyuGraph.FORCE_FINAL_INSTRUCTION for m in body["messages"]):
+            return "根据现有信息，功率85W"
+        if body.get("tools"):
+            return {"tool_calls": [{"name": "get_item_details", "args": {"item_id": "item_123"}}]}
+        return "tech"
+
+    with MockLLMServer(reply=reply) as server:
+        monkeypatch.setenv("API_KEY", "test")
+        monkeypatch.setenv("MODEL_BASE_URL", server.base_url)
+        builder = XianyuGraph.XianyuGraphBuilder({"graph": {"tool_budget": {"max_tool_iterations": 2}}})
+        result = asyncio.run(builder.compile().ainvoke({
+            "user_message": "功率多大",
+            "item_description": "雅马哈功放",
+            "chat_history": [],
+            "intent": "",
+            "bargain_count": 0,
+            "final_reply": "",
+        }))
+    assert result["final_reply"] == "根据现有信息，功率85W"
+    assert result["tool_iterations"] == 2
+    # router + 3次技术Agent + 强制最终回复
+    assert len(server.requests) == 5
+    assert "tools" not in server.requests[-1]
+    assert builder.budget.stats()["by_reason"] == {"iterations": 1}
+
+
+def test_history_window_folds_old_turns_and_drops_finished_tool_calls():
+    from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+    history = []
+    for i in range(10):
+        call = {"name": "get_item_details", "args": {}, "id": f"call_{i}"}
+        history = XianyuGraph.window_history(history, [
+            HumanMessage(content=f"问题{i}"),
+            AIMessage(content="", tool_calls=[call]),
+            ToolMessage(content="参数", tool_call_id=f"call_{i}"),
+            AIMessage(content=f"回答{i}"),
+        ])
+    current = [HumanMessage(content="问题10"), AIMessage(content="", tool_calls=[{"name": "x", "args": {}, "id": "c"}])]
+    history = XianyuGraph.window_history(history, current)
+
+    assert isinstance(history[0], SystemMessage) and "问题0" in history[0].content
+    finished = history[1:-2]
+    assert [m.content for m in finished if isinstance(m, HumanMessage)] == [f"问题{i}" for i in range(5, 10)]
+    assert not any(isinstance(m, ToolMessage) or getattr(m, "tool_calls", None) for m in finished)
+    # 进行中的一轮保留工具调用
+    assert history[-2:] == current
@@ -0,0 +1,94 @@
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+
+class AhoCorasick:
+    """
+    多模式字符串匹配自动机（Aho-Corasick）
+
+    一次性从所有关键词构建，之后对任意文本的匹配只需单次线性扫描，
+    耗时与关键词数量无关。支持通过 step() 逐字符推进，用于流式文本。
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, Any]]):
+        """
+        构建自动机
+
+        Args:
+            patterns: (关键词, 附加数据) 序列，匹配时原样返回附加数据
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, Any]]] = [[]]
+
+        for pattern, payload in patterns:
+            if not pattern:
+                continue
+            self._insert(pattern, payload)
+        self._build_failure_links()
+
+    def _insert(self, pattern: str, payload: Any):
+        state = 0
+        for ch in pattern:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((pattern, payload))
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                # 合并失败链上的输出，匹配时无需再沿失败链回溯
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def step(self, state: int, ch: str) -> Tuple[int, List[Tuple[str, Any]]]:
+        """
+        从给定状态读入一个字符
+
+        Returns:
+            tuple: (新状态, 在该字符处结束的所有 (关键词, 附加数据))
+        """
+        goto = self._goto
+        while state and ch not in goto[state]:
+            state = self._fail[state]
+        state = goto[state].get(ch, 0)
+        return state, self._output[state]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, str, Any]]:
+        """
+        单次扫描文本，返回所有匹配（含重叠匹配）
+
+        Yields:
+            tuple: (起始位置, 结束位置(不含), 关键词, 附加数据)
+        """
+        goto, fail, output = self._goto, self._fail, self._output
+        root = goto[0]
+        state = 0
+        for end, ch in enumerate(text, 1):
+            if not state:
+                # 根状态下绝大多数字符不是任何关键词的首字符，直接跳过
+                state = root.get(ch, 0)
+                if not state:
+                    continue
+            else:
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(ch, 0)
+            for pattern, payload in output[state]:
+                yield end - len(pattern), end, pattern, payload
+
+    def __len__(self):
+        return len(self._goto) - 1
@@ -0,0 +1,160 @@
+"""
+单条消息的端到端回复时限
+
+收到买家消息时创建 Deadline，并通过 contextvar 向下传递：商品信息获取、意图识别和回复生成
+各自按子预算与剩余时间中较小者设置超时，同步代码（API重试、大模型调用）也可以读取剩余时间。
+超时后由 DeadlinePolicy 给出兜底回复，保证首条回复的耗时有上限。
+"""
+import asyncio
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+DEFAULT_TOTAL_SECS = 15.0
+DEFAULT_STAGE_BUDGETS = {"item_lookup": 4.0, "classify": 4.0, "generate": 12.0}
+DEFAULT_CANNED_REPLIES = {
+    "default": "亲，在的，稍等我看一下马上回复您~",
+    "price": "价格这块我确认一下，稍等马上回复您~",
+    "tech": "这个问题我查一下具体参数，稍等马上回复您~",
+}
+
+_current: contextvars.ContextVar = contextvars.ContextVar("reply_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """某个阶段在时限内没有完成"""
+
+    def __init__(self, stage: str):
+        super().__init__(f"阶段 {stage} 超出回复时限")
+        self.stage = stage
+
+
+class Deadline:
+    """从创建时刻开始计时的总时限，以及按阶段划分的子预算"""
+
+    def __init__(self, total_secs: float, stage_budgets: Optional[Dict[str, float]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self.started = clock()
+        self.expires_at = self.started + total_secs
+        self.stage_budgets = dict(stage_budgets or {})
+
+    def elapsed(self) -> float:
+        return self._clock() - self.started
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self._clock())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def budget(self, stage: str) -> float:
+        """该阶段可用的时间：阶段子预算与总剩余时间中较小者"""
+        remaining = self.remaining()
+        return min(self.stage_budgets.get(stage, remaining), remaining)
+
+    def check(self, stage: str):
+        if self.expired:
+            raise DeadlineExceeded(stage)
+
+    async def run(self, stage: str, awaitable):
+        """在阶段预算内等待，超时抛出 DeadlineExceeded"""
+        try:
+            return await asyncio.wait_for(awaitable, timeout=self.budget(stage))
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(stage) from None
+
+    def child(self, stage: str, extra_secs: float = 0.0) -> "Deadline":
+        """以该阶段预算（加上 extra_secs）为总时限的子时限，阶段内部的调用据此设置自己的超时"""
+        return Deadline(self.budget(stage) + extra_secs, self.stage_budgets, self._clock)
+
+    def start_in_thread(self, stage: str, fn, *args, extra_secs: float = 0.0, **kwargs) -> asyncio.Task:
+        """
+        在线程中启动同步函数，返回可等待的任务
+
+        线程本身无法中断，因此线程内通过 current_deadline() 看到的是该阶段的子时限，
+        同步代码（API重试、大模型调用）据此自行收敛，超时后不会在后台无限占用线程。
+        extra_secs 用于延迟补发：调用方放弃等待后，线程仍可在宽限期内完成。
+        """
+        child = self.child(stage, extra_secs)
+
+        def call():
+            with deadline_scope(child):
+                return fn(*args, **kwargs)
+
+        return asyncio.ensure_future(asyncio.to_thread(call))
+
+    async def run_in_thread(self, stage: str, fn, *args, **kwargs):
+        """在线程中执行同步函数，超出阶段预算时抛出 DeadlineExceeded"""
+        return await self.run(stage, self.start_in_thread(stage, fn, *args, **kwargs))
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]):
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+def deadline_in(ctx: contextvars.Context) -> Optional[Deadline]:
+    """读取另一个上下文（如 contextvars.copy_context() 的快照）中的回复时限"""
+    return ctx.get(_current)
+
+
+def remaining_or(default: float, minimum: float = 0.05) -> float:
+    """当前有时限时返回剩余时间（不超过 default，不低于 minimum），否则返回 default"""
+    deadline = current_deadline()
+    return default if deadline is None else max(minimum, min(default, deadline.remaining()))
+
+
+class DeadlinePolicy:
+    """
+    回复时限配置
+
+    fallback 为 canned 时，超时后发送按意图准备的兜底回复并放弃迟到的结果；
+    为 deferred 时，先发送兜底回复，真正的回复在 deferred_grace_secs 内完成则随后补发。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        total_secs: float = DEFAULT_TOTAL_SECS,
+        stage_budgets: Optional[Dict[str, float]] = None,
+        fallback: str = "canned",
+        canned_replies: Optional[Dict[str, str]] = None,
+        deferred_grace_secs: float = 30.0,
+    ):
+        if fallback not in ("canned", "deferred"):
+            raise ValueError(f"未知的超时兜底方式: {fallback}")
+        self.enabled = enabled
+        self.total_secs = total_secs
+        self.stage_budgets = {**DEFAULT_STAGE_BUDGETS, **(stage_budgets or {})}
+        self.fallback = fallback
+        self.canned_replies = {**DEFAULT_CANNED_REPLIES, **(canned_replies or {})}
+        self.deferred_grace_secs = deferred_grace_secs
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "DeadlinePolicy":
+        section = config.get("reply_deadline") or {}
+        return cls(
+            enabled=section.get("enabled", True),
+            total_secs=section.get("total_secs", DEFAULT_TOTAL_SECS),
+            stage_budgets=section.get("stages"),
+            fallback=section.get("fallback", "canned"),
+            canned_replies=section.get("canned_replies"),
+            deferred_grace_secs=section.get("deferred_grace_secs", 30.0),
+        )
+
+    def new_deadline(self) -> Optional[Deadline]:
+        return Deadline(self.total_secs, self.stage_budgets) if self.enabled else None
+
+    def canned_reply(self, intent: Optional[str]) -> str:
+        return self.canned_replies.get(intent or "default", self.canned_replies["default"])
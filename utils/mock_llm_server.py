@@ -0,0 +1,173 @@
+"""
+本地 OpenAI 兼容的大模型替身服务
+
+用于测试与基准：可注入固定或随机延迟、失败率，并统计收到的请求数和token数。
+只实现 /v1/chat/completions 的非流式接口。reply 函数返回 {"tool_calls": [{"name": ..., "args": {...}}]}
+时模拟模型发起工具调用。
+
+用法:
+    with MockLLMServer(latency=0.2, reply="好的") as server:
+        client = OpenAI(api_key="test", base_url=server.base_url)
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Union
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 2)
+
+
+class MockLLMServer:
+    """OpenAI 兼容的替身服务，运行在后台线程"""
+
+    def __init__(
+        self,
+        latency: Union[float, Callable[[Dict], float]] = 0.0,
+        reply: Union[str, Callable[[Dict], str]] = "好的",
+        fail_rate: float = 0.0,
+        fail_status: int = 500,
+        cached_tokens: int = 0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        """
+        Args:
+            latency: 每个请求的延迟秒数，或根据请求体计算延迟的函数
+            reply: 固定回复，或根据请求体生成回复的函数；函数返回 dict 时作为工具调用
+            fail_rate: 返回错误的概率
+            fail_status: 注入错误时的 HTTP 状态码
+            cached_tokens: 在 usage.prompt_tokens_details 中报告的缓存命中token数
+        """
+        self.latency = latency
+        self.reply = reply
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.cached_tokens = cached_tokens
+        self.requests: List[Dict] = []
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = []
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+
+    def _respond(self, body: Dict) -> Optional[Dict]:
+        latency = self.latency(body) if callable(self.latency) else self.latency
+        if latency:
+            time.sleep(latency)
+        if self.fail_rate and random.random() < self.fail_rate:
+            return None
+
+        content = self.reply(body) if callable(self.reply) else self.reply
+        message = {"role": "assistant", "content": content}
+        finish_reason = "stop"
+        if isinstance(content, dict):
+            message = self._tool_call_message(content)
+            finish_reason = "tool_calls"
+            content = json.dumps(content, ensure_ascii=False)
+        prompt_text = "".join(str(m.get("content", "")) for m in body.get("messages", []))
+        prompt_tokens = _estimate_tokens(prompt_text)
+        completion_tokens = _estimate_tokens(content)
+        max_tokens = body.get("max_tokens")
+        if max_tokens:
+            completion_tokens = min(completion_tokens, max_tokens)
+
+        with self._lock:
+            self.requests.append(body)
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+        return {
+            "id": f"chatcmpl-mock-{len(self.requests)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": finish_reason,
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": min(self.cached_tokens, prompt_tokens)},
+            },
+        }
+
+    @staticmethod
+    def _tool_call_message(spec: Dict) -> Dict:
+        calls = [
+            {
+                "id": f"call_{random.getrandbits(32):08x}",
+                "type": "function",
+                "function": {"name": call["name"], "arguments": json.dumps(call.get("args", {}), ensure_ascii=False)},
+            }
+            for call in spec.get("tool_calls", [])
+        ]
+        return {"role": "assistant", "content": spec.get("content"), "tool_calls": calls}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    body = {}
+                if not self.path.endswith("/chat/completions"):
+                    self._send(404, {"error": {"message": "not found"}})
+                    return
+                payload = server._respond(body)
+                if payload is None:
+                    self._send(server.fail_status, {"error": {"message": "injected failure"}})
+                else:
+                    self._send(200, payload)
+
+            def _send(self, status, payload):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
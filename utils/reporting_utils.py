@@ -1,9 +1,88 @@
+import atexit
+import json
 import os
+import queue
+import threading
+import time
+from collections import defaultdict
 from datetime import datetime
+from typing import Dict, Optional
 from loguru import logger
 
 LOG_DIR = "logs"
 
+
+class JsonlAppender:
+    """
+    JSONL 日志的后台追加器
+
+    append() 只把记录放入内存队列，调用方（回复路径）不做任何文件操作；
+    后台线程每隔 flush_interval 秒把攒下的记录按文件合并追加。
+    """
+
+    def __init__(self, flush_interval: float = 1.0):
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._writer_loop, name="jsonl-log-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def append(self, path: str, entry: Dict):
+        self._ensure_started()
+        # 入队时确定绝对路径，写入线程不受之后工作目录变化的影响
+        self._queue.put((os.path.abspath(path), json.dumps(entry, ensure_ascii=False) + "\n"))
+
+    def _writer_loop(self):
+        while True:
+            lines, flushed = defaultdict(list), []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if isinstance(item, threading.Event):
+                    # flush() 的请求：立即写入已收集的记录
+                    flushed.append(item)
+                    break
+                lines[item[0]].append(item[1])
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            for path, batch in lines.items():
+                self._write(path, batch)
+            for event in flushed:
+                event.set()
+
+    @staticmethod
+    def _write(path: str, batch):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.writelines(batch)
+        except Exception as e:
+            logger.error(f"Failed to write {os.path.basename(path)}: {e}")
+
+    def flush(self, timeout: float = 5.0):
+        """等待已追加的记录全部写入文件"""
+        if self._thread is None:
+            return
+        event = threading.Event()
+        self._queue.put(event)
+        event.wait(timeout)
+
+
+jsonl_appender = JsonlAppender()
+
 def ensure_log_dir():
     """确保日志目录存在"""
     if not os.path.exists(LOG_DIR):
@@ -44,3 +123,77 @@ def log_daily_conversation(chat_id: str, user_name: str, item_id: str, user_mess
             f.write(log_entry)
     except Exception as e:
         logger.error(f"Failed to log daily conversation: {e}")
+
+def iter_logged_conversations(log_dir: str = LOG_DIR):
+    """
+    解析 log_daily_conversation 写入的对话日志
+
+    Yields:
+        dict: 包含 chat_id, item_id, user_message, bot_reply 的对话回合
+    """
+    if not os.path.isdir(log_dir):
+        return
+    for name in sorted(os.listdir(log_dir)):
+        if not (name.startswith("conversations_") and name.endswith(".txt")):
+            continue
+        try:
+            with open(os.path.join(log_dir, name), "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except Exception as e:
+            logger.error(f"Failed to read conversation log {name}: {e}")
+            continue
+
+        turn = None
+        for line in lines:
+            if line.startswith("==================== ") and "会话ID:" in line:
+                parts = [p.strip() for p in line.strip("= ").split("|")]
+                turn = {"chat_id": "", "item_id": "", "user_message": "", "bot_reply": ""}
+                for part in parts:
+                    if part.startswith("会话ID:"):
+                        turn["chat_id"] = part.split(":", 1)[1].strip()
+                    elif part.startswith("商品ID:"):
+                        turn["item_id"] = part.split(":", 1)[1].strip()
+            elif turn is not None and line.startswith("【用户】"):
+                # 格式为 "【用户】 用户名: 消息"，用户名本身不含 ": "
+                turn["user_message"] = line.split(": ", 1)[1] if ": " in line else ""
+            elif turn is not None and line.startswith("【AI助手】:"):
+                turn["bot_reply"] = line[len("【AI助手】:"):].strip()
+                yield turn
+                turn = None
+
+def log_intent_label(user_message: str, label: str, source: str = "llm"):
+    """记录意图分类结果，作为本地意图分类器的训练数据（由后台线程写入）"""
+    jsonl_appender.append(os.path.join(LOG_DIR, "intent_labels.jsonl"), {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "message": user_message,
+        "label": label,
+        "source": source,
+    })
+
+def log_search_decision(user_message: str, item_id, search: bool, reason: str, coverage: float):
+    """记录技术咨询是否联网搜索的判断，用于回看门控的准确性（由后台线程写入）"""
+    jsonl_appender.append(os.path.join(LOG_DIR, "search_decisions.jsonl"), {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "message": user_message,
+        "item_id": item_id,
+        "search": search,
+        "reason": reason,
+        "coverage": round(coverage, 3),
+    })
+
+def load_intent_labels(log_dir: str = LOG_DIR):
+    """读取已记录的意图标签，同一条消息以最后一次标注为准"""
+    jsonl_appender.flush()
+    log_file = os.path.join(log_dir, "intent_labels.jsonl")
+    labels = {}
+    if not os.path.exists(log_file):
+        return labels
+    with open(log_file, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get("message") and entry.get("label"):
+                labels[entry["message"]] = entry["label"]
+    return labels
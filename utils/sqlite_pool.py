@@ -0,0 +1,126 @@
+"""
+进程内常驻的 SQLite 连接池
+
+一个写连接加少量读连接在进程生命周期内保持打开，避免每次查询都新建连接和 aiosqlite 工作线程。
+数据库切换到 WAL 模式：读不阻塞写，提交时不再整库 fsync（synchronous=NORMAL）。
+每个连接自带 sqlite3 的预编译语句缓存，连接常驻后同一条 SQL 只需编译一次。
+"""
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+import aiosqlite
+from loguru import logger
+
+DEFAULT_READERS = 3
+DEFAULT_CACHE_SIZE_KB = 8192
+DEFAULT_MMAP_SIZE_MB = 64
+DEFAULT_CACHED_STATEMENTS = 256
+
+
+class SqlitePool:
+    """
+    一个写连接 + 若干读连接
+
+    writer() 串行化所有写事务；reader() 从空闲读连接中取一个，用完归还。
+    两者都在首次使用时才打开连接。
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        readers: int = DEFAULT_READERS,
+        cache_size_kb: int = DEFAULT_CACHE_SIZE_KB,
+        mmap_size_mb: int = DEFAULT_MMAP_SIZE_MB,
+        busy_timeout_ms: int = 5000,
+    ):
+        self.db_path = db_path
+        self.readers = max(1, readers)
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size_mb = mmap_size_mb
+        self.busy_timeout_ms = busy_timeout_ms
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+        self._idle: Optional[asyncio.Queue] = None
+        self._reader_conns: List[aiosqlite.Connection] = []
+        self._open_lock = asyncio.Lock()
+
+    @classmethod
+    def from_config(cls, config: Dict, db_path: str) -> "SqlitePool":
+        section = config.get("database") or {}
+        return cls(
+            db_path,
+            readers=section.get("readers", DEFAULT_READERS),
+            cache_size_kb=section.get("cache_size_kb", DEFAULT_CACHE_SIZE_KB),
+            mmap_size_mb=section.get("mmap_size_mb", DEFAULT_MMAP_SIZE_MB),
+        )
+
+    async def _connect(self, read_only: bool = False) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.db_path, cached_statements=DEFAULT_CACHED_STATEMENTS)
+        await conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        await conn.execute("PRAGMA synchronous = NORMAL")
+        await conn.execute(f"PRAGMA cache_size = {-int(self.cache_size_kb)}")
+        await conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size_mb) * 1024 * 1024}")
+        await conn.execute("PRAGMA temp_store = MEMORY")
+        if read_only:
+            await conn.execute("PRAGMA query_only = 1")
+        return conn
+
+    async def open(self):
+        async with self._open_lock:
+            if self._writer is not None:
+                return
+            db_dir = os.path.dirname(self.db_path)
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir)
+            writer = await self._connect()
+            # WAL 记录在数据库文件中，之后所有连接（包括其他模块的同步连接）都使用 WAL
+            cursor = await writer.execute("PRAGMA journal_mode = WAL")
+            mode = (await cursor.fetchone())[0]
+            if mode.lower() != "wal":
+                logger.warning(f"数据库未能切换到WAL模式，当前为: {mode}")
+            self._idle = asyncio.Queue()
+            for _ in range(self.readers):
+                conn = await self._connect(read_only=True)
+                self._reader_conns.append(conn)
+                self._idle.put_nowait(conn)
+            self._writer = writer
+            logger.info(f"数据库连接池已打开: {self.db_path}，读连接 {self.readers} 个")
+
+    @asynccontextmanager
+    async def writer(self):
+        """独占写连接；调用方自行提交，退出时仍有未提交的事务则回滚"""
+        if self._writer is None:
+            await self.open()
+        async with self._write_lock:
+            try:
+                yield self._writer
+            finally:
+                if self._writer.in_transaction:
+                    await self._writer.rollback()
+
+    @asynccontextmanager
+    async def reader(self):
+        if self._writer is None:
+            await self.open()
+        conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                await conn.rollback()
+            self._idle.put_nowait(conn)
+
+    async def close(self):
+        async with self._open_lock:
+            if self._writer is None:
+                return
+            async with self._write_lock:
+                await self._writer.close()
+                self._writer = None
+            for conn in self._reader_conns:
+                await conn.close()
+            self._reader_conns = []
+            self._idle = None
+            logger.info("数据库连接池已关闭")
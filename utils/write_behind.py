@@ -0,0 +1,185 @@
+"""
+数据库写后合并队列
+
+写语句先进入内存队列立即返回，每隔一个时间窗或攒够一批后，把所有会话的写入放进同一个事务提交。
+批内相同的 SQL 合并为一次 executemany，整批只需要很少几次到数据库线程的往返和一次提交。
+需要读到自己刚写入内容的读取先调用 flush()（或按会话判断 pending 后再 flush），进程退出前 close() 保证写完。
+"""
+import asyncio
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+DEFAULT_FLUSH_INTERVAL_MS = 20
+DEFAULT_MAX_BATCH_OPS = 200
+
+Statement = Tuple[str, Sequence]
+
+
+class _Op:
+    __slots__ = ("statements", "label", "key", "future", "ok")
+
+    def __init__(self, statements, label, key, future):
+        self.statements = statements
+        self.label = label
+        self.key = key
+        self.future = future
+        self.ok = True
+
+
+class WriteBehindQueue:
+    """
+    按时间窗或操作数合并提交的写队列
+
+    一个操作是若干条 (sql, params)。同一条 SQL 的参数按提交顺序执行；不同 SQL 按其在批内首次出现的
+    顺序分组执行，因此队列只用于彼此可交换的写入：追加消息、计数累加、覆盖状态。
+    submit 返回的 Future 在所属事务提交后完成，结果为该操作是否成功；调用方可以不等待它。
+    """
+
+    def __init__(self, pool, flush_interval_ms: float = DEFAULT_FLUSH_INTERVAL_MS,
+                 max_batch_ops: int = DEFAULT_MAX_BATCH_OPS):
+        """
+        Args:
+            pool: SqlitePool，批次在其写连接上提交
+            flush_interval_ms: 第一个待写操作最多等待的时间
+            max_batch_ops: 攒够多少个操作立即提交
+        """
+        self.pool = pool
+        self.interval = flush_interval_ms / 1000
+        self.max_batch_ops = max(1, max_batch_ops)
+        self._pending: List[_Op] = []
+        self._pending_keys: Counter = Counter()
+        self._timer: Optional[asyncio.Task] = None
+        self._size_flush: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._closed = False
+        self.ops = 0
+        self.failed = 0
+        self.batches = 0
+
+    @classmethod
+    def from_config(cls, config: Dict, pool) -> Optional["WriteBehindQueue"]:
+        """读取 database.write_behind 配置，未启用时返回 None（每次写入单独提交）"""
+        section = (config.get("database") or {}).get("write_behind") or {}
+        if not section.get("enabled", True):
+            return None
+        return cls(
+            pool,
+            flush_interval_ms=section.get("flush_interval_ms", DEFAULT_FLUSH_INTERVAL_MS),
+            max_batch_ops=section.get("max_batch_ops", DEFAULT_MAX_BATCH_OPS),
+        )
+
+    def submit(self, statements: List[Statement], label: str, key: Optional[str] = None) -> asyncio.Future:
+        """
+        加入一个写操作
+
+        Args:
+            statements: 按顺序执行的 (sql, params)
+            label: 失败时日志中的操作名称
+            key: 操作所属的会话，供 pending(key) 判断是否需要先 flush
+        """
+        if self._closed:
+            raise RuntimeError("写队列已关闭")
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(_Op(statements, label, key, future))
+        if key is not None:
+            self._pending_keys[key] += 1
+        if len(self._pending) >= self.max_batch_ops:
+            # 上一次攒满触发的提交还没开始时不重复调度，等它开始时会带走这些操作
+            if self._size_flush is None or self._size_flush.done():
+                self._size_flush = asyncio.ensure_future(self.flush())
+        elif self._timer is None:
+            self._timer = asyncio.ensure_future(self._flush_later())
+        return future
+
+    def pending(self, key: Optional[str] = None) -> bool:
+        """key 会话是否有尚未提交的写入；已出队但所属事务还在提交中的操作也算在内"""
+        if key is None:
+            return bool(self._pending)
+        return self._pending_keys[key] > 0
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.interval)
+        finally:
+            self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        """提交当前所有待写操作；返回时此前 submit 的操作均已落库"""
+        # shield：等待方被取消（如回复超时）时提交仍然完成，已出队的操作不会随之丢失
+        await asyncio.shield(self._flush())
+
+    async def _flush(self):
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return
+            try:
+                await self._commit(batch)
+            finally:
+                # 提交结束后才不再计入 pending，提交期间的读取据此先等待本次 flush
+                for op in batch:
+                    if op.key is not None:
+                        self._pending_keys[op.key] -= 1
+                        if self._pending_keys[op.key] <= 0:
+                            del self._pending_keys[op.key]
+
+    async def _commit(self, batch: List[_Op]):
+        groups: "OrderedDict[str, List[Tuple[_Op, Sequence]]]" = OrderedDict()
+        for op in batch:
+            for sql, params in op.statements:
+                groups.setdefault(sql, []).append((op, params))
+        try:
+            async with self.pool.writer() as conn:
+                cursor = await conn.cursor()
+                await cursor.execute("BEGIN")
+                for sql, rows in groups.items():
+                    await self._execute_group(cursor, sql, rows)
+                await conn.commit()
+        except Exception as e:
+            logger.error(f"批量写入数据库失败，{len(batch)} 个操作未保存: {e}")
+            for op in batch:
+                op.ok = False
+        self.batches += 1
+        self.ops += len(batch)
+        for op in batch:
+            self.failed += not op.ok
+            if not op.future.done():
+                op.future.set_result(op.ok)
+
+    @staticmethod
+    async def _execute_group(cursor, sql, rows):
+        """一次 executemany 执行整组；失败时回滚该组并逐条重试，只丢弃出错的那条"""
+        rows = [(op, params) for op, params in rows if op.ok]
+        if not rows:
+            return
+        await cursor.execute("SAVEPOINT write_group")
+        try:
+            await cursor.executemany(sql, [params for _, params in rows])
+        except Exception:
+            await cursor.execute("ROLLBACK TO write_group")
+            for op, params in rows:
+                try:
+                    await cursor.execute(sql, params)
+                except Exception as e:
+                    logger.error(f"{op.label}时出错: {e}")
+                    op.ok = False
+        await cursor.execute("RELEASE write_group")
+
+    async def close(self):
+        """停止接收新操作并写完队列中剩余的操作"""
+        self._closed = True
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "ops": self.ops,
+            "batches": self.batches,
+            "failed": self.failed,
+            "avg_batch_size": round(self.ops / self.batches, 2) if self.batches else 0.0,
+        }
@@ -0,0 +1,202 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from loguru import logger
+
+try:
+    from tavily import TavilyClient
+except ImportError:  # 未安装时TechAgent退回模型自带的联网搜索
+    TavilyClient = None
+
+DEFAULT_DB_PATH = "data/chat_history.db"
+DEFAULT_TTL_SECS = 24 * 3600
+DEFAULT_MAX_ENTRIES = 5000
+
+_QUERY_SEP_RE = re.compile(r'[^\w\u4e00-\u9fa5]+')
+
+
+def normalize_query(query: str) -> str:
+    """统一全角半角与大小写，标点和连续空白折叠为单个空格，使措辞上的细微差别命中同一条缓存"""
+    folded = unicodedata.normalize("NFKC", query).lower()
+    return _QUERY_SEP_RE.sub(" ", folded).strip()
+
+
+_tavily_client = None
+_tavily_lock = threading.Lock()
+
+
+def search_available() -> bool:
+    return TavilyClient is not None and bool(os.getenv("TAVILY_API_KEY"))
+
+
+def tavily_search(query: str) -> str:
+    """调用 Tavily 搜索，返回拼接后的结果正文；客户端在进程内复用"""
+    global _tavily_client
+    if _tavily_client is None:
+        with _tavily_lock:
+            if _tavily_client is None:
+                _tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+    # search_depth="advanced" 可以获取更丰富的结果
+    response = _tavily_client.search(query, search_depth="advanced")
+    results = response.get("results", [])
+    return "\n".join([res.get("content", "") for res in results])
+
+
+class SearchCache:
+    """
+    网络搜索结果缓存
+
+    结果存放在 chat_history.db 的 search_cache 表，以规范化后的查询为键，按 TTL 过期，
+    条数超过上限时淘汰最旧的记录。同一查询的并发请求只会真正搜索一次，其余请求等待并共享结果。
+    """
+
+    def __init__(
+        self,
+        db_path: str = DEFAULT_DB_PATH,
+        ttl_secs: float = DEFAULT_TTL_SECS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        search_fn: Callable[[str], str] = tavily_search,
+    ):
+        self.db_path = db_path
+        self.ttl = timedelta(seconds=ttl_secs)
+        self.max_entries = max_entries
+        self.search_fn = search_fn
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._puts = 0
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._init_db()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "SearchCache":
+        section = config.get("search_cache") or {}
+        return cls(
+            db_path=section.get("db_path", DEFAULT_DB_PATH),
+            ttl_secs=section.get("ttl_secs", DEFAULT_TTL_SECS),
+            max_entries=section.get("max_entries", DEFAULT_MAX_ENTRIES),
+        )
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def _init_db(self):
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS search_cache (
+                    query TEXT PRIMARY KEY,
+                    results TEXT NOT NULL,
+                    last_updated DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_updated ON search_cache (last_updated)")
+
+    def get(self, query: str) -> Optional[str]:
+        """返回未过期的缓存结果"""
+        cutoff = (datetime.now() - self.ttl).isoformat()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT results FROM search_cache WHERE query = ? AND last_updated >= ?",
+                (normalize_query(query), cutoff),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, query: str, results: str):
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO search_cache (query, results, last_updated) VALUES (?, ?, ?)
+                ON CONFLICT(query) DO UPDATE SET results = excluded.results, last_updated = excluded.last_updated
+                """,
+                (normalize_query(query), results, datetime.now().isoformat()),
+            )
+            self._puts += 1
+            # 淘汰按写入次数摊销，不在每次写入时都统计全表
+            if self._puts % 50 == 1:
+                self._evict(conn)
+
+    def _evict(self, conn):
+        cutoff = (datetime.now() - self.ttl).isoformat()
+        conn.execute("DELETE FROM search_cache WHERE last_updated < ?", (cutoff,))
+        conn.execute(
+            """
+            DELETE FROM search_cache WHERE query NOT IN (
+                SELECT query FROM search_cache ORDER BY last_updated DESC LIMIT ?
+            )
+            """,
+            (self.max_entries,),
+        )
+
+    def get_or_search(self, query: str, search_fn: Callable[[str], str] = None) -> str:
+        """
+        优先返回缓存；未命中时搜索并写入缓存，同一查询的并发请求合并为一次搜索
+
+        搜索出错时异常抛给所有等待者，不写入缓存。
+        """
+        key = normalize_query(query)
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        self.misses += 1
+        try:
+            results = (search_fn or self.search_fn)(query)
+            self.put(key, results)
+            future.set_result(results)
+            return results
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self) -> Dict:
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
+
+
+_shared_cache: Optional[SearchCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_search_cache(config_path: str = "config.json") -> SearchCache:
+    """进程内共享的搜索缓存，按 config.json 的 search_cache 段构建"""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_lock:
+            if _shared_cache is None:
+                try:
+                    with open(config_path, "r", encoding="utf-8") as f:
+                        config = json.load(f)
+                except FileNotFoundError:
+                    config = {}
+                except Exception as e:
+                    logger.error(f"加载搜索缓存配置时出错: {e}")
+                    config = {}
+                _shared_cache = SearchCache.from_config(config)
+    return _shared_cache